@@ -0,0 +1,106 @@
+import io
+import logging
+import multiprocessing as mp
+
+import numpy as np
+import torch
+
+log = logging.getLogger()
+
+
+class SharedFrameCache:
+    """A byte budgeted LRU cache of decoded frames in shared memory.
+
+    The cache is an arena of fixed size slots which is allocated in shared memory
+    by the main process, hence the DataLoader workers, which are forked from the
+    main process, read and write the same slots. A frame is serialized into one
+    slot, the slot table (keys, lengths, last access ticks) is shared as well and
+    guarded by a lock. If the cache is full the least recently used slot is reused.
+
+    Args:
+        max_bytes: The memory limit of the arena in bytes.
+        slot_bytes: The max size of one serialized frame in bytes.
+    """
+
+    def __init__(self, max_bytes: int, slot_bytes: int):
+        self.slot_bytes = slot_bytes
+        self.num_slots = max(max_bytes // slot_bytes, 1)
+        S = self.num_slots
+        self.data = torch.empty((S, slot_bytes), dtype=torch.uint8).share_memory_()
+        self.keys = torch.full((S,), -1, dtype=torch.int64).share_memory_()
+        self.lengths = torch.zeros(S, dtype=torch.int64).share_memory_()
+        self.ticks = torch.zeros(S, dtype=torch.int64).share_memory_()
+        # clock, hits, misses, frames larger than a slot
+        self.stats = torch.zeros(4, dtype=torch.int64).share_memory_()
+        self.lock = mp.Lock()
+        self._warned = False
+
+    @staticmethod
+    def compact(value):
+        """Clones the tensors, a view would serialize the full storage, e.g. mmaps."""
+        if isinstance(value, torch.Tensor):
+            return value.clone()
+        if isinstance(value, dict):
+            return {k: SharedFrameCache.compact(v) for k, v in value.items()}
+        return value
+
+    @classmethod
+    def encode(cls, value: dict):
+        buffer = io.BytesIO()
+        torch.save(cls.compact(value), buffer)
+        return np.frombuffer(buffer.getbuffer(), dtype=np.uint8)
+
+    @staticmethod
+    def decode(data: bytes):
+        return torch.load(io.BytesIO(data))
+
+    def _slot(self, key: int):
+        slots = torch.nonzero(self.keys == key)
+        return int(slots[0, 0]) if len(slots) else None
+
+    def _tick(self, slot: int):
+        self.stats[0] += 1
+        self.ticks[slot] = self.stats[0]
+
+    def get(self, key: int):
+        with self.lock:
+            slot = self._slot(key)
+            if slot is None:
+                self.stats[2] += 1
+                return None
+            self._tick(slot)
+            self.stats[1] += 1
+            # copy under the lock, the slot could be evicted afterwards
+            data = self.data[slot, : int(self.lengths[slot])].numpy().tobytes()
+        return self.decode(data)
+
+    def put(self, key: int, value: dict):
+        data = self.encode(value)
+        if len(data) > self.slot_bytes:  # the frame does not fit into a slot
+            with self.lock:
+                self.stats[3] += 1
+            if not self._warned:
+                log.warning(
+                    f"The frame {key} has {len(data)} bytes, which exceeds the slot "
+                    f"size of {self.slot_bytes} bytes, it is loaded from disk."
+                )
+                self._warned = True
+            return False
+        with self.lock:
+            if self._slot(key) is not None:  # another worker was faster
+                return True
+            slot = int(torch.argmin(self.ticks))  # free slots have the tick zero
+            self.keys[slot] = key
+            self.lengths[slot] = len(data)
+            self.data[slot, : len(data)] = torch.from_numpy(data.copy())
+            self._tick(slot)
+        return True
+
+    def info(self):
+        return {
+            "slots": self.num_slots,
+            "used": int((self.keys >= 0).sum()),
+            "hits": int(self.stats[1]),
+            "misses": int(self.stats[2]),
+            "oversized": int(self.stats[3]),
+        }
@@ -0,0 +1,130 @@
+import torch
+
+from lib.renderer.camera import Camera
+
+########################################################################################
+# Depth
+########################################################################################
+
+
+def encode_depth(point: torch.Tensor, mask: torch.Tensor, depth_factor: float = 1000):
+    """Encodes the point map as positive depth in millimetres of dim (H, W) uint16.
+
+    The point map is fully determined by the depth and the intrinsics, hence only
+    the z-plane is stored, where the camera looks along -Z.
+    """
+    depth = torch.round(-point[..., 2] * depth_factor)
+    depth = torch.clamp(depth, 0, 2**16 - 1)
+    depth[~mask] = 0
+    return depth.to(torch.int32).to(torch.uint16)
+
+
+def decode_depth(depth: torch.Tensor, camera: Camera, depth_factor: float = 1000):
+    """Unprojects the uint16 depth of dim (..., H, W) to the points (..., H, W, 3)."""
+    depth = depth.to(torch.int32).to(torch.float32) / depth_factor
+    point = camera.unproject_depth_map(depth)
+    point[depth == 0] = 0.0
+    return point
+
+
+########################################################################################
+# Mask
+########################################################################################
+
+
+def pack_mask(mask: torch.Tensor):
+    """Packs the boolean mask into bits, 8 pixels per byte of dim (ceil(H*W/8),)."""
+    flat = mask.reshape(-1).to(torch.uint8)
+    flat = torch.nn.functional.pad(flat, (0, (-flat.shape[0]) % 8))
+    bits = torch.tensor([1, 2, 4, 8, 16, 32, 64, 128], dtype=torch.uint8)
+    return (flat.reshape(-1, 8) * bits.to(flat.device)).sum(-1).to(torch.uint8)
+
+
+def unpack_mask(packed: torch.Tensor, shape: tuple[int, ...]):
+    bits = torch.tensor([1, 2, 4, 8, 16, 32, 64, 128], dtype=torch.uint8)
+    flat = (packed.unsqueeze(-1) & bits.to(packed.device)) > 0  # (N, 8)
+    numel = torch.Size(shape).numel()
+    return flat.reshape(-1)[:numel].reshape(shape)
+
+
+########################################################################################
+# Normal
+########################################################################################
+
+
+def encode_octahedral(normal: torch.Tensor):
+    """Encodes the unit normals of dim (..., 3) into two int16 of dim (..., 2).
+
+    The normals are projected onto the octahedron |x| + |y| + |z| = 1 and the lower
+    hemisphere is folded onto the upper one, which gives an almost uniform error.
+    """
+    n = normal / torch.clamp(normal.abs().sum(-1, keepdim=True), min=1e-08)
+    x, y, z = n.unbind(-1)
+    sign_x = torch.where(x >= 0, 1.0, -1.0)
+    sign_y = torch.where(y >= 0, 1.0, -1.0)
+    fold_x = (1 - y.abs()) * sign_x
+    fold_y = (1 - x.abs()) * sign_y
+    u = torch.where(z >= 0, x, fold_x)
+    v = torch.where(z >= 0, y, fold_y)
+    uv = torch.stack([u, v], dim=-1)
+    return torch.round(uv * 32767).to(torch.int16)
+
+
+def decode_octahedral(code: torch.Tensor):
+    uv = code.to(torch.float32) / 32767
+    u, v = uv.unbind(-1)
+    z = 1 - u.abs() - v.abs()
+    t = torch.clamp(-z, min=0.0)
+    x = u - torch.where(u >= 0, t, -t)
+    y = v - torch.where(v >= 0, t, -t)
+    normal = torch.stack([x, y, z], dim=-1)
+    return torch.nn.functional.normalize(normal, dim=-1)
+
+
+def encode_normal(normal: torch.Tensor, mode: str = "octahedral"):
+    assert mode in ["float16", "octahedral"]
+    if mode == "float16":
+        return normal.to(torch.float16)
+    return encode_octahedral(normal)
+
+
+def decode_normal(code: torch.Tensor):
+    if code.dtype == torch.float16:
+        return code.to(torch.float32)
+    return decode_octahedral(code)
+
+
+########################################################################################
+# Frame
+########################################################################################
+
+
+def encode_frame(
+    mask: torch.Tensor,
+    point: torch.Tensor,
+    normal: torch.Tensor,
+    normal_mode: str = "octahedral",
+    depth_factor: float = 1000,
+):
+    """Encodes the mask (H, W), point (H, W, 3) and normal (H, W, 3) of a frame."""
+    return {
+        "shape": tuple(mask.shape),
+        "mask": pack_mask(mask),
+        "depth": encode_depth(point, mask, depth_factor=depth_factor),
+        "normal": encode_normal(normal, mode=normal_mode),
+    }
+
+
+def decode_frame(code: dict, camera: Camera, depth_factor: float = 1000):
+    """Decodes the frame, the camera needs to be at the scale of the frame."""
+    mask = unpack_mask(code["mask"], code["shape"])
+    point = decode_depth(code["depth"], camera=camera, depth_factor=depth_factor)
+    normal = decode_normal(code["normal"])
+    point[~mask] = 0.0
+    normal[~mask] = 0.0
+    return {"mask": mask, "point": point, "normal": normal}
+
+
+def frame_nbytes(frame: dict):
+    tensors = [v for v in frame.values() if torch.is_tensor(v)]
+    return sum(v.numel() * v.element_size() for v in tensors)
@@ -1,9 +1,11 @@
+from collections import OrderedDict
 from functools import partial
 
 import lightning as L
 import torch
 from torch.utils.data import DataLoader, Dataset, default_collate
 
+from lib.data.prefetcher import FramePrefetcher
 from lib.data.sampler import SimpleIndexSampler
 from lib.renderer import Camera, Rasterizer, Renderer
 
@@ -22,6 +24,9 @@ class DPHMDataModule(L.LightningDataModule):
         # dataset
         dataset: Dataset | None = None,
         device: str = "cuda",
+        # prefetching
+        prefetch: bool = False,
+        prefetch_depth: int = 2,
         **kwargs,
     ) -> None:
         super().__init__()
@@ -30,6 +35,9 @@ class DPHMDataModule(L.LightningDataModule):
         self.batch_size = batch_size
         self.sampler: None | SimpleIndexSampler = None
         self._datasets: dict[int, torch.utils.data.Dataset] = {}
+        self._prefetcher: FramePrefetcher | None = None
+        if prefetch:
+            self._prefetcher = FramePrefetcher(self.load_window, depth=prefetch_depth)
 
     @staticmethod
     def _collate_fn(self, batch: list):
@@ -43,21 +51,71 @@ class DPHMDataModule(L.LightningDataModule):
                 b[key] = value
         return b
 
+    def get_dataset(self, scale: int):
+        if scale not in self._datasets:  # cache the dataset with the scale
+            self._datasets[scale] = self.hparams["dataset"](scale=scale)
+        return self._datasets[scale]
+
     def update_dataset(self, camera: Camera, rasterizer: Rasterizer):
         """This is modified by the coarse to fine scheduler."""
         self.scale = camera.scale
-        if self.scale not in self._datasets:  # cache the dataset with the scale
-            _dataset = self.hparams["dataset"](scale=self.scale)
-            self._datasets[self.scale] = _dataset
-        self.dataset = self._datasets[self.scale]  # select the dataset with the scale
+        self.dataset = self.get_dataset(self.scale)  # select the dataset with the scale
 
     def update_idxs(self, idxs: list[int]):
         """This is used to change the sampling mode of the datasets."""
         self.sampler = SimpleIndexSampler(idxs)
         self.batch_size = len(idxs)
 
+    def update_schedule(self, schedule: list[list[int]], scales: list[int]):
+        """The upcoming frame idxs windows and scales that are loaded ahead of time."""
+        if not self.hparams["prefetch"]:
+            return
+        if self._prefetcher is None:  # restarted after a teardown
+            self._prefetcher = FramePrefetcher(
+                self.load_window, depth=self.hparams["prefetch_depth"]
+            )
+        for scale in scales:  # the datasets are created in the main thread
+            self.get_dataset(scale)
+        self._prefetcher.update_schedule(schedule=schedule, scales=scales)
+
+    def teardown(self, stage: str | None = None):
+        """Stops the background thread of the prefetcher until the next schedule."""
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+
+    def load_window(self, scale: int, idxs: tuple[int, ...]):
+        """Loads, collates, pins and transfers the frames of one window."""
+        dataset = self.get_dataset(scale)
+        batch = default_collate([dataset[idx] for idx in idxs])
+        pin = self.hparams["pin_memory"] and torch.cuda.is_available()
+        stream = torch.cuda.Stream() if pin else None
+        b = {}
+        with torch.cuda.stream(stream):
+            for key, value in batch.items():
+                if isinstance(value, torch.Tensor):
+                    if pin:
+                        value = value.pin_memory()
+                    b[key] = value.to(self.device, non_blocking=pin)
+                    if pin:  # the memory is used by the tracker on the default stream
+                        b[key].record_stream(torch.cuda.default_stream())
+                else:
+                    b[key] = value
+        if stream is not None:  # blocks the background thread, not the tracker
+            stream.synchronize()
+        return b
+
+    def fetch_window(self, scale: int, idxs: list[int]):
+        """The batch of a window at the scale, e.g. from the prefetched batches."""
+        if self._prefetcher is not None:
+            return dict(self._prefetcher.get(scale=scale, frame_idxs=idxs))
+        return self.load_window(scale, tuple(idxs))
+
     def fetch(self):
         assert self.sampler is not None
+        if self._prefetcher is not None:
+            batch = self._prefetcher.get(scale=self.scale, frame_idxs=self.sampler.idxs)
+            return dict(batch)  # the tensors are shared between the outer iterations
         dataloader = DataLoader(
             dataset=self.dataset,
             batch_size=self.batch_size,
@@ -70,6 +128,59 @@ class DPHMDataModule(L.LightningDataModule):
         return next(iter(dataloader))
 
 
+class StreamDataModule:
+    """Serves the preprocessed live frames with the interface of the DPHMDataModule.
+
+    The frames are added by the streaming tracker once they are preprocessed, only
+    the latest `buffer_size` frames are kept, e.g. for the init and joint trackers.
+    """
+
+    def __init__(self, device: str = "cuda", buffer_size: int = 16):
+        self.device = device
+        self.buffer_size = buffer_size
+        self.frames: OrderedDict[int, dict] = OrderedDict()
+        self.sampler: None | SimpleIndexSampler = None
+        self.scale = 1
+
+    def add_frames(self, frame_idxs: list[int], out: dict):
+        """Adds the batched output of `preprocess_frames` of the frame idxs."""
+        for i, frame_idx in enumerate(frame_idxs):
+            frame = {}
+            for key, value in out.items():
+                if isinstance(value, dict):  # the maps of one scale
+                    frame[key] = {k: v[i] for k, v in value.items()}
+                else:
+                    frame[key] = value[i]
+            self.frames[frame_idx] = frame
+        while len(self.frames) > self.buffer_size:
+            self.frames.popitem(last=False)
+
+    def update_dataset(self, camera: Camera, rasterizer: Rasterizer):
+        self.scale = camera.scale
+
+    def update_idxs(self, idxs: list[int]):
+        self.sampler = SimpleIndexSampler(idxs)
+        self.batch_size = len(idxs)
+
+    def update_schedule(self, schedule: list[list[int]], scales: list[int]):
+        pass  # the frames are not known ahead of time
+
+    def fetch(self):
+        assert self.sampler is not None
+        batch = []
+        for frame_idx in self.sampler.idxs:
+            frame = self.frames[frame_idx]
+            batch.append(
+                {
+                    "frame_idx": frame_idx,
+                    "landmark": frame["landmark"],
+                    "landmark_mask": frame["landmark_mask"],
+                    **frame[self.scale],
+                }
+            )
+        return DPHMDataModule._collate_fn(self, batch)
+
+
 class PCGDataModule(L.LightningDataModule):
     def __init__(
         self,
@@ -212,6 +323,7 @@ class DPHMTrainDataModule(L.LightningDataModule):
         drop_last: bool = True,
         persistent_workers: bool = False,
         shuffle: bool = True,
+        multiprocessing_context: str | None = None,  # spawn for rendering workers
         # dataset
         dataset: Dataset | None = None,
         renderer: Renderer | None = None,
@@ -226,6 +338,12 @@ class DPHMTrainDataModule(L.LightningDataModule):
         self.train_dataset = self.hparams["train_dataset"](scale=scale)
         self.val_dataset = self.hparams["val_dataset"](scale=scale)
 
+    @property
+    def multiprocessing_context(self):
+        if self.hparams["num_workers"] == 0:
+            return None
+        return self.hparams["multiprocessing_context"]
+
     def train_dataloader(self) -> DataLoader:
         return DataLoader(
             dataset=self.train_dataset,
@@ -234,6 +352,7 @@ class DPHMTrainDataModule(L.LightningDataModule):
             pin_memory=self.hparams["pin_memory"],
             drop_last=self.hparams["drop_last"],
             persistent_workers=self.hparams["persistent_workers"],
+            multiprocessing_context=self.multiprocessing_context,
             shuffle=self.hparams["shuffle"],
         )
 
@@ -245,5 +364,6 @@ class DPHMTrainDataModule(L.LightningDataModule):
             pin_memory=self.hparams["pin_memory"],
             drop_last=self.hparams["drop_last"],
             persistent_workers=self.hparams["persistent_workers"],
+            multiprocessing_context=self.multiprocessing_context,
             shuffle=False,
         )
@@ -4,20 +4,58 @@ from pathlib import Path
 import torch
 from torch.utils.data import Dataset
 
+from lib.data.cache import SharedFrameCache
+from lib.data.codec import decode_frame
+from lib.data.loader import load_intrinsics
+from lib.data.store import PackedFrameStore
+from lib.renderer.camera import Camera
+
 
 class DPHMDataset(Dataset):
-    def __init__(self, scale: int = 1, data_dir: str = "/data"):
+    def __init__(
+        self,
+        scale: int = 1,
+        data_dir: str = "/data",
+        packed: bool = False,
+        codec: bool = False,
+    ):
         self.scale = scale
         self.data_dir = data_dir
+        self.init_storage(packed=packed, codec=codec)
+
+    def init_storage(self, packed: bool = False, codec: bool = False):
+        self.packed = packed
+        self.codec = codec
+        self._stores: dict[str, PackedFrameStore] = {}
+        self._cameras: dict[str, Camera] = {}
+
+    def store(self, dataset: str) -> PackedFrameStore | None:
+        """The memory mapped frames of the sequence, if the packed format is used."""
+        if not self.packed:
+            return None
+        if dataset not in self._stores:
+            path = Path(self.data_dir) / dataset / "packed"
+            assert PackedFrameStore.exists(path), f"No packed store in {path}"
+            self._stores[dataset] = PackedFrameStore(path)
+        return self._stores[dataset]
 
     def frame_count(self, dataset: str):
+        if store := self.store(dataset):
+            return store.frame_count
         path = Path(self.data_dir) / dataset / "cache/8_mask"
+        if self.codec:
+            path = Path(self.data_dir) / dataset / "cache/8_code"
         return len([p for p in path.iterdir() if str(p).endswith(".pt")])
 
     def iter_frame_idx(self, dataset: str):
         return list(range(self.frame_count(dataset)))
 
     def load_cached(self, dataset: str, data_type: str, frame_idx: int) -> Path:
+        if store := self.store(dataset):
+            name = store.cached_name(self.scale, data_type)
+            return store.frame(name, frame_idx)
+        if self.codec and data_type in ["mask", "point", "normal"]:
+            return self.load_code(dataset, frame_idx)[data_type]
         path = (
             Path(self.data_dir)
             / dataset
@@ -27,18 +65,70 @@ class DPHMDataset(Dataset):
         )
         return torch.load(path)
 
+    def load_cached_frame(self, dataset: str, data_types: list[str], frame_idx: int):
+        """Loads the data types of a frame, e.g. a compact frame is decoded once."""
+        code_types = {"mask", "point", "normal"} & set(data_types)
+        frame = {}
+        if self.codec and code_types and not self.store(dataset):
+            code = self.load_code(dataset, frame_idx)
+            frame = {data_type: code[data_type] for data_type in code_types}
+        for data_type in data_types:
+            if data_type not in frame:
+                frame[data_type] = self.load_cached(dataset, data_type, frame_idx)
+        return frame
+
+    def load_code(self, dataset: str, frame_idx: int):
+        """Decodes the compact frame into the mask, point and normal."""
+        path = (
+            Path(self.data_dir)
+            / dataset
+            / "cache"
+            / f"{self.scale}_code"
+            / f"{frame_idx:05}.pt"
+        )
+        code = torch.load(path)
+        if dataset not in self._cameras:  # the unprojection at the cached scale
+            H, W = code["shape"]
+            self._cameras[dataset] = Camera(
+                K=load_intrinsics(Path(self.data_dir) / dataset, return_tensor="pt"),
+                width=W * self.scale,
+                height=H * self.scale,
+                scale=self.scale,
+                device="cpu",
+            )
+        return decode_frame(code, camera=self._cameras[dataset])
+
     def load(self, dataset: str, data_type: str):
+        if store := self.store(dataset):  # zero-copy view of all frames
+            return store.frames(store.cached_name(self.scale, data_type))
         data = []
         for frame_idx in self.iter_frame_idx(dataset):
             value = self.load_cached(dataset, data_type, frame_idx)
             data.append(value)
         return data
 
+    def load_many(self, dataset: str, data_types: list[str]):
+        """Loads the data types frame by frame, e.g. a compact frame is decoded once."""
+        if self.store(dataset):
+            return {
+                data_type: self.load(dataset, data_type) for data_type in data_types
+            }
+        data: dict[str, list] = {data_type: [] for data_type in data_types}
+        for frame_idx in self.iter_frame_idx(dataset):
+            frame = self.load_cached_frame(dataset, data_types, frame_idx)
+            for data_type in data_types:
+                data[data_type].append(frame[data_type])
+        return data
+
     def load_root(self, dataset: str, data_type: str, frame_idx: int):
+        if store := self.store(dataset):
+            return store.frame(data_type, frame_idx)
         path = Path(self.data_dir) / f"{dataset}/{data_type}/{frame_idx:05}.pt"
         return torch.load(path)
 
     def load_roots(self, dataset: str, data_type: str):
+        if store := self.store(dataset):
+            return store.frames(data_type)
         data = []
         for frame_idx in self.iter_frame_idx(dataset):
             value = self.load_root(dataset, data_type, frame_idx)
@@ -46,11 +136,15 @@ class DPHMDataset(Dataset):
         return data
 
     def load_param(self, dataset: str, frame_idx: int):
+        if store := self.store(dataset):
+            return store.params()[frame_idx]
         path = Path(self.data_dir) / f"{dataset}/params/{frame_idx:05}.pt"
         params = torch.load(path)
         return {k: v[0] for k, v in params.items()}
 
     def load_params(self, dataset: str):
+        if store := self.store(dataset):
+            return store.params()
         params = []
         for frame_idx in self.iter_frame_idx(dataset):
             params.append(self.load_param(dataset, frame_idx))
@@ -69,14 +163,18 @@ class DPHMOptimizeDataset(DPHMDataset):
         dataset: str,
         scale: int = 1,
         data_dir: str = "/data",
+        packed: bool = False,
+        codec: bool = False,
     ):
         self.scale = scale
         self.data_dir = data_dir
+        self.init_storage(packed=packed, codec=codec)
         self.dataset = dataset
-        self.mask = self.load(dataset, "mask")
-        self.normal = self.load(dataset, "normal")
-        self.color = self.load(dataset, "color")
-        self.point = self.load(dataset, "point")
+        data = self.load_many(dataset, ["mask", "normal", "color", "point"])
+        self.mask = data["mask"]
+        self.normal = data["normal"]
+        self.color = data["color"]
+        self.point = data["point"]
         self.landmark = self.load_roots(dataset, "landmark")
         self.landmark_mask = self.load_roots(dataset, "landmark_mask")
         self.vertices = self.load_roots(dataset, "vertices")
@@ -115,8 +213,13 @@ class DPHMTrainDataset(DPHMDataset):
         jump_size: int = 1,
         start_frame: int | None = None,
         end_frame: int | None = None,
-        memory: str = "ram",  # ram, disk
+        memory: str = "ram",  # ram, disk, cache
         landmarks: bool = True,
+        packed: bool = False,
+        codec: bool = False,
+        cache_bytes: int = 8 * 1024**3,  # the memory limit of the frame cache
+        slot_bytes: int | None = None,  # the max size of a cached frame
+        slot_margin: float = 1.5,  # the slot size relative to the first frame
         **kwargs,
     ):
         assert mode in ["fix", "dynamic"]
@@ -125,6 +228,7 @@ class DPHMTrainDataset(DPHMDataset):
         self.scale = scale
         self.memory = memory
         self.data_dir = data_dir
+        self.init_storage(packed=packed, codec=codec)
         self._start_frame = start_frame
         self._end_frame = end_frame
 
@@ -147,11 +251,13 @@ class DPHMTrainDataset(DPHMDataset):
 
         for dataset in sorted(datasets):
             if self.memory == "ram":
-                self.mask[dataset] = self.load(dataset, "mask")
-                self.face_mask[dataset] = self.load(dataset, "face_mask")
-                self.normal[dataset] = self.load(dataset, "normal")
-                self.color[dataset] = self.load(dataset, "color")
-                self.point[dataset] = self.load(dataset, "point")
+                data_types = ["mask", "face_mask", "normal", "color", "point"]
+                data = self.load_many(dataset, data_types)
+                self.mask[dataset] = data["mask"]
+                self.face_mask[dataset] = data["face_mask"]
+                self.normal[dataset] = data["normal"]
+                self.color[dataset] = data["color"]
+                self.point[dataset] = data["point"]
                 self.params[dataset] = self.load_params(dataset)
                 self.vertices[dataset] = self.load_roots(dataset, "vertices")
                 if self.landmarks_flag:
@@ -182,6 +288,17 @@ class DPHMTrainDataset(DPHMDataset):
             self.idx2dataset.update(idx2data)
             self.total_frames += len(frame_idx)
 
+        self.dataset2code = {dataset: i for i, dataset in enumerate(sorted(datasets))}
+        self.cache: SharedFrameCache | None = None
+        if self.memory == "cache" and self.total_frames and slot_bytes is None:
+            # the slot size is based on a decoded frame, e.g. all share the scale,
+            # the margin absorbs e.g. a varying number of landmarks or compression
+            dataset, frame_idx, _ = self.fetch_helper(0)
+            frame = self.load_frame(dataset, frame_idx)
+            slot_bytes = int(len(SharedFrameCache.encode(frame)) * slot_margin)
+        if self.memory == "cache" and self.total_frames:
+            self.cache = SharedFrameCache(max_bytes=cache_bytes, slot_bytes=slot_bytes)
+
     def fetch_helper(self, idx: int):
         # fetch the information about the current dataset sequence
         dataset = self.idx2dataset[idx]
@@ -198,6 +315,27 @@ class DPHMTrainDataset(DPHMDataset):
 
         return dataset, frame_idx, init_idx
 
+    def load_frame(self, dataset: str, frame_idx: int):
+        frame = self.load_cached_frame(
+            dataset, ["mask", "point", "normal", "color"], frame_idx
+        )
+        frame["params"] = self.load_param(dataset, frame_idx)
+        frame["vertices"] = self.load_root(dataset, "vertices", frame_idx)
+        if self.landmarks_flag:
+            frame["landmark"] = self.load_root(dataset, "landmark", frame_idx)
+            frame["landmark_mask"] = self.load_root(dataset, "landmark_mask", frame_idx)
+        return frame
+
+    def load_frame_cached(self, dataset: str, frame_idx: int):
+        """Decodes the frame once, afterwards it's served from the shared cache."""
+        assert self.cache is not None
+        key = self.dataset2code[dataset] * 1_000_000 + frame_idx
+        frame = self.cache.get(key)
+        if frame is None:
+            frame = self.load_frame(dataset, frame_idx)
+            self.cache.put(key, frame)
+        return frame
+
     def __len__(self):
         return self.total_frames
 
@@ -219,12 +357,30 @@ class DPHMTrainDataset(DPHMDataset):
             if self.landmarks_flag:
                 landmark = self.landmark[dataset][frame_idx]
                 landmark_mask = self.landmark_mask[dataset][frame_idx]
+        elif self.memory == "cache":
+            frame = self.load_frame_cached(dataset, frame_idx)
+            init_frame = self.load_frame_cached(dataset, init_idx)
+            mask = frame["mask"]
+            point = frame["point"]
+            normal = frame["normal"]
+            color = frame["color"]
+            params = frame["params"]
+            vertices = frame["vertices"]
+            init_params = init_frame["params"]
+            init_vertices = init_frame["vertices"]
+            init_color = init_frame["color"]
+            if self.landmarks_flag:
+                landmark = frame["landmark"]
+                landmark_mask = frame["landmark_mask"]
         else:
-            mask = self.load_cached(dataset, "mask", frame_idx)
+            frame = self.load_cached_frame(
+                dataset, ["mask", "point", "normal", "color"], frame_idx
+            )
+            mask = frame["mask"]
             # face_mask = self.load_cached(dataset, "face_mask", frame_idx)
-            point = self.load_cached(dataset, "point", frame_idx)
-            normal = self.load_cached(dataset, "normal", frame_idx)
-            color = self.load_cached(dataset, "color", frame_idx)
+            point = frame["point"]
+            normal = frame["normal"]
+            color = frame["color"]
             params = self.load_param(dataset, frame_idx)
             vertices = self.load_root(dataset, "vertices", frame_idx)
             init_params = self.load_param(dataset, init_idx)
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+
+def code_version(*paths: str | Path):
+    """The hash of the source files that produce an artifact."""
+    h = hashlib.sha1()
+    for path in paths:
+        h.update(Path(path).read_bytes())
+    return h.hexdigest()[:12]
+
+
+def file_stats(*paths: str | Path):
+    """The (mtime, size) of the input files, missing files are recorded as None."""
+    stats = []
+    for path in paths:
+        stat = os.stat(path) if Path(path).exists() else None
+        stats.append(None if stat is None else [stat.st_mtime_ns, stat.st_size])
+    return stats
+
+
+def fingerprint(config: dict, version: str = "", inputs: list | None = None):
+    """The hash of everything an artifact depends on."""
+    value = {"config": config, "version": version, "inputs": inputs or []}
+    data = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+class Manifest:
+    """Records for each output artifact of a sequence how it was produced.
+
+    The manifest is a json file in the sequence directory with the layout
+    {stage: {artifact: {key: fingerprint}}}, e.g. the artifact "8_mask" of the key
+    "00012" of the stage "preprocess". An artifact is stale if its fingerprint,
+    which is built from the config, the code version and the stats of the input
+    files, differs or if one of its output files is missing. Stages rebuild only
+    the stale artifacts and save the manifest after each chunk, hence an
+    interrupted run continues where it stopped.
+
+    Args:
+        path: The path of the manifest, e.g. data_dir / "manifest.json".
+        force: Treat every artifact as stale and rebuild everything.
+    """
+
+    def __init__(self, path: str | Path, force: bool = False):
+        self.path = Path(path)
+        self.force = force
+        self.records: dict[str, dict[str, dict[str, str]]] = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.records = json.load(f)
+
+    def get(self, stage: str, artifact: str, key: Any):
+        return self.records.get(stage, {}).get(artifact, {}).get(str(key))
+
+    def is_stale(
+        self,
+        stage: str,
+        artifact: str,
+        key: Any,
+        fingerprint: str,
+        outputs: list[Path] | None = None,
+    ):
+        if self.force or self.get(stage, artifact, key) != fingerprint:
+            return True
+        return not all(Path(p).exists() for p in outputs or [])
+
+    def update(self, stage: str, artifact: str, key: Any, fingerprint: str):
+        stage_records = self.records.setdefault(stage, {})
+        stage_records.setdefault(artifact, {})[str(key)] = fingerprint
+
+    def save(self):
+        # write and rename such that an interrupted run never corrupts the manifest
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.records, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
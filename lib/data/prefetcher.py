@@ -0,0 +1,75 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+
+class FramePrefetcher:
+    """Loads the upcoming windows of a frame schedule in a background thread.
+
+    The prefetcher receives the schedule of the frame idxs, e.g. from
+    `SequentialTracker.frame_idxs_iter`, and the scales in the order of the coarse
+    to fine scheduler. The upcoming `depth` windows are loaded with their first
+    scale, the next scale of the current window is loaded once the window reaches
+    the previous one. The loaded batches are reused for every fetch of the same
+    window, e.g. for each outer iteration.
+
+    Args:
+        load_fn: Loads, collates and transfers the batch of (scale, frame_idxs).
+        depth: The number of windows that are loaded ahead of the current one.
+    """
+
+    def __init__(self, load_fn: Callable, depth: int = 2):
+        self.load_fn = load_fn
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.schedule: list[tuple[int, ...]] = []
+        self.scales: list[int] = []
+        self.position = 0
+        self.futures: dict[tuple, Future] = {}
+
+    def keys(self, window: tuple[int, ...], scale: int | None = None):
+        """The batches of the window that are needed next after the scale."""
+        if scale not in self.scales:  # the window is not started yet
+            return [(s, window) for s in self.scales[:1]]
+        pos = self.scales.index(scale)
+        return [(s, window) for s in self.scales[pos : pos + 2]]
+
+    def update_schedule(self, schedule: list[list[int]], scales: list[int]):
+        self.schedule = [tuple(window) for window in schedule]
+        self.scales = list(scales)
+        self.position = 0
+        current = self.keys(self.schedule[0]) if self.schedule else []
+        self.submit(current)
+
+    def submit(self, current: list[tuple]):
+        upcoming = self.schedule[self.position + 1 : self.position + self.depth + 1]
+        for key in current + [k for w in upcoming for k in self.keys(w)]:
+            if key not in self.futures:
+                self.futures[key] = self.executor.submit(self.load_fn, *key)
+
+    def advance(self, scale: int, window: tuple[int, ...]):
+        """Moves the schedule to the current window and drops the old batches."""
+        if window in self.schedule[self.position :]:
+            self.position = self.schedule.index(window, self.position)
+        current = self.keys(window, scale)
+        upcoming = self.schedule[self.position + 1 : self.position + self.depth + 1]
+        keep = {(scale, window), *current, *[k for w in upcoming for k in self.keys(w)]}
+        for key in list(self.futures.keys()):
+            if key not in keep:
+                self.futures.pop(key).cancel()
+        self.submit(current)
+
+    def get(self, scale: int, frame_idxs: list[int]):
+        window = tuple(frame_idxs)
+        self.advance(scale, window)
+        key = (scale, window)
+        if key not in self.futures:  # not scheduled, e.g. the init frames
+            future: Future = Future()
+            future.set_result(self.load_fn(*key))
+            self.futures[key] = future
+        return self.futures[key].result()
+
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+        self.executor.shutdown(wait=True)
@@ -1,5 +1,6 @@
 import cv2
 import torch
+from torchvision.transforms import v2
 
 
 def extract_mask(depth: torch.Tensor, threshold: float = 0.8):
@@ -16,6 +17,62 @@ def biliteral_filter(image, dilation, sigma_color, sigma_space):
     return torch.tensor(img).to(image)
 
 
+def _bilateral_pass(
+    image: torch.Tensor,
+    dim: int,
+    radius: int,
+    sigma_color: float,
+    sigma_space: float,
+):
+    """One 1D bilateral pass along the dim of the image (..., H, W, C)."""
+    size = image.shape[dim]
+    idx = torch.arange(size, device=image.device)
+    numerator = torch.zeros_like(image)
+    denominator = torch.zeros_like(image[..., :1])
+    for offset in range(-radius, radius + 1):
+        # replicate the border such that the shifted image has the same size
+        shifted = image.index_select(dim, torch.clamp(idx + offset, 0, size - 1))
+        color_dist = ((shifted - image) ** 2).sum(-1, keepdim=True)
+        log_weight = -(offset**2) / (2 * sigma_space**2)
+        weight = torch.exp(log_weight - color_dist / (2 * sigma_color**2))
+        numerator += weight * shifted
+        denominator += weight
+    return numerator / denominator
+
+
+def bilateral_filter(
+    image: torch.Tensor,
+    dilation: int = 30,
+    sigma_color: float = 150,
+    sigma_space: float = 150,
+):
+    """Batched separable bilateral filter in torch.
+
+    The 2D kernel is approximated by a horizontal and a vertical 1D bilateral pass,
+    hence the cost per pixel is linear in the diameter instead of quadratic. All
+    frames and pixels are processed with vectorized ops, which run multithreaded
+    on the CPU and on the GPU, e.g. for the live frames.
+
+    Args:
+        image (torch.Tensor): The image of dim (..., H, W, C) or (..., H, W).
+        dilation (int): The diameter of the pixel neighborhood, as in cv2.
+        sigma_color (float): The sigma in the color space.
+        sigma_space (float): The sigma in the pixel space.
+
+    Returns:
+        (torch.Tensor): The filtered image with the same dim.
+    """
+    squeeze = image.dim() == 2
+    if squeeze:
+        image = image.unsqueeze(-1)
+    x = image.to(torch.float32)
+    radius = max(dilation // 2, 1)
+    for dim in [-2, -3]:  # first the width then the height
+        x = _bilateral_pass(x, dim, radius, sigma_color, sigma_space)
+    x = x.to(image.dtype)
+    return x.squeeze(-1) if squeeze else x
+
+
 def point2normal(point: torch.Tensor):
     """Calculate the normal image from the camera image.
 
@@ -31,41 +88,31 @@ def point2normal(point: torch.Tensor):
     camera space.
 
     Args:
-        depth (torch.Tensor): Camera image of dim (H, W, 3).
+        depth (torch.Tensor): Camera image of dim (H, W, 3) or batched (B, H, W, 3).
 
     Returns:
-        (torch.Tensor): The normal image based on the depth/camera of dim (H, W, 3).
+        (torch.Tensor): The normal image based on the camera of dim (..., H, W, 3).
     """
     # in order to calc that only with depth image, we need to make sure that the
     # depth is in pixel space.
-    point = point.clone()
-
-    # make sure that on the boundary is nothing wrong calculated
-    # point_mask = point.sum(-1) != 0
-    # point[~point_mask] = torch.nan  # some large value
-
-    H, W, _ = point.shape
     normals = torch.zeros_like(point)
     normals[..., 2] = -1  # make sure that the default normal looks to the camera
 
-    x_right = torch.arange(2, W)
-    x_left = torch.arange(0, W - 2)
-    dzx = point[:, x_right, 2] - point[:, x_left, 2]
-    dx = point[:, x_right, 0] - point[:, x_left, 0]
-    normals[:, 1:-1, 0] = dzx / dx
+    # central differences along the width and the height of all frames
+    dzx = point[..., :, 2:, 2] - point[..., :, :-2, 2]
+    dx = point[..., :, 2:, 0] - point[..., :, :-2, 0]
+    normals[..., :, 1:-1, 0] = dzx / dx
 
-    y_right = torch.arange(2, H)
-    y_left = torch.arange(0, H - 2)
-    dzy = point[y_right, :, 2] - point[y_left, :, 2]
-    dy = point[y_right, :, 1] - point[y_left, :, 1]
-    normals[1:-1, :, 1] = dzy / dy
+    dzy = point[..., 2:, :, 2] - point[..., :-2, :, 2]
+    dy = point[..., 2:, :, 1] - point[..., :-2, :, 1]
+    normals[..., 1:-1, :, 1] = dzy / dy
 
     # remove artefacs
     normals = torch.nan_to_num(normals, 0)
-    normals[:1, :, :] = 0
-    normals[-1:, :, :] = 0
-    normals[:, :1, :] = 0
-    normals[:, -1:, :] = 0
+    normals[..., :1, :, :] = 0
+    normals[..., -1:, :, :] = 0
+    normals[..., :, :1, :] = 0
+    normals[..., :, -1:, :] = 0
 
     # create the maks based on the valid normal values
     normal_mask = normals.sum(-1) != 0
@@ -79,3 +126,91 @@ def point2normal(point: torch.Tensor):
     normals = torch.nn.functional.normalize(normals, dim=-1)
 
     return normals, normal_mask
+
+
+def resize(image: torch.Tensor, size: tuple[int, int]):
+    """Resizes the batch of images of dim (B, H, W, C)."""
+    image = v2.functional.resize(inpt=image.permute(0, 3, 1, 2), size=size)
+    return image.permute(0, 2, 3, 1)
+
+
+def preprocess_frames(
+    color: torch.Tensor,
+    depth: torch.Tensor,
+    camera,
+    scales: list[int],
+    inf_depth: float = 0.6,
+    dilation: int = 30,
+    landmark: torch.Tensor | None = None,
+):
+    """Converts a batch of raw RGB-D frames into the cached data of the tracker.
+
+    Args:
+        color (torch.Tensor): The color images of dim (B, H, W, 3).
+        depth (torch.Tensor): The depth in m of dim (B, H, W).
+        camera (Camera): The camera at the full resolution, e.g. scale=1.
+        scales (list[int]): The scales of the downscaled maps.
+        landmark (torch.Tensor): The pixels (u, v) of the landmarks of dim (B, L, 2).
+
+    Returns:
+        (dict): The landmark (B, L, 3) and the landmark_mask (B, L) if the pixels are
+            given, and for each scale a dict with the color, mask, normal and point.
+    """
+    color, depth = color.clone(), depth.clone()
+
+    # select the foreground based on a depth threshold
+    f_mask = (depth < inf_depth) & (depth != 0)
+
+    # convert the depth maps to point maps, the background is set to the max depth
+    for depth_i, f_mask_i in zip(depth, f_mask):
+        if f_mask_i.any():
+            depth_i[~f_mask_i] = depth_i[f_mask_i].max()
+    point = camera.unproject_depth_map(depth)  # (B, H, W, 3)
+
+    # convert pointmap to normalmap and smooth the normal maps
+    normal, n_mask = point2normal(point)
+    normal = bilateral_filter(
+        image=normal,
+        dilation=dilation,
+        sigma_color=150,
+        sigma_space=150,
+    )
+
+    # create the final mask based on normal and depth
+    mask = f_mask & n_mask
+
+    # mask the default values
+    color[~mask] = 255
+    normal[~mask] = 0
+    point[~mask] = 0
+
+    out: dict = {}
+    if landmark is not None:
+        batch_idx = torch.arange(len(landmark), device=landmark.device)[:, None]
+        u, v = landmark[..., 0], landmark[..., 1]
+        out["landmark"] = point[batch_idx, v, u]
+        out["landmark_mask"] = mask[batch_idx, v, u]
+
+    for scale in scales:
+        # downscale the images
+        size = (int(camera.height / scale), int(camera.width / scale))
+        down_mask = resize(mask.to(torch.float32).unsqueeze(-1), size)[..., 0] == 1.0
+
+        down_color = resize(color, size)
+        down_color[~down_mask] = 255
+
+        down_normal = resize(normal, size)
+        down_normal = torch.nn.functional.normalize(down_normal, dim=-1)
+        down_normal[~down_mask] = 0
+
+        down_point = resize(point, size)
+        down_point[~down_mask] = 0
+
+        out[scale] = {
+            "color": down_color,
+            "mask": down_mask,
+            "normal": down_normal,
+            "point": down_point,
+        }
+
+    return out
@@ -0,0 +1,193 @@
+import json
+import re
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import torch
+
+
+class PackedParams:
+    """Lazy per-frame view of the packed flame params, e.g. params[frame_idx]."""
+
+    def __init__(self, params: dict[str, torch.Tensor]):
+        self.params = params
+
+    def __len__(self):
+        return len(next(iter(self.params.values())))
+
+    def __getitem__(self, frame_idx: int):
+        return {k: v[frame_idx] for k, v in self.params.items()}
+
+
+class PackedFrameStore:
+    """The frames of a sequence packed into one contiguous array per data type.
+
+    The layout of a sequence is a directory with an `index.json` and one `.npy`
+    file per (data type, scale), e.g. `cache_8_point.npy` of dim (F, H, W, 3),
+    `landmark.npy` or `params_transl.npy`. The arrays are opened with memory
+    mapping, hence opening a store is instant and a frame access is a zero-copy
+    slice of the mapped file, the pages are only read on demand.
+    """
+
+    index_name: str = "index.json"
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path / self.index_name, "r") as f:
+            self.index = json.load(f)
+        self._arrays: dict[str, torch.Tensor] = {}
+
+    @classmethod
+    def exists(cls, path: str | Path):
+        return (Path(path) / cls.index_name).exists()
+
+    @property
+    def frame_count(self) -> int:
+        return self.index["frame_count"]
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.index["arrays"].keys())
+
+    def frames(self, name: str) -> torch.Tensor:
+        """The memory mapped frames of dim (F, ...), opened once per data type."""
+        if name not in self._arrays:
+            file = self.path / self.index["arrays"][name]["file"]
+            # copy-on-write mapping, the tensor is writable without touching the file
+            array = np.load(file, mmap_mode="c")
+            self._arrays[name] = torch.from_numpy(array)
+        return self._arrays[name]
+
+    def frame(self, name: str, frame_idx: int) -> torch.Tensor:
+        return self.frames(name)[frame_idx]
+
+    def params(self) -> PackedParams:
+        prefix = "params_"
+        params = {
+            name[len(prefix) :]: self.frames(name)
+            for name in self.names
+            if name.startswith(prefix)
+        }
+        return PackedParams(params)
+
+    @staticmethod
+    def cached_name(scale: int, data_type: str):
+        return f"cache_{scale}_{data_type}"
+
+    @staticmethod
+    def param_name(key: str):
+        return f"params_{key}"
+
+    @classmethod
+    def write(cls, path: str | Path, arrays: dict[str, Sequence[torch.Tensor]]):
+        """Packs the per-frame tensors of each data type into one array file.
+
+        The frames are written one at a time into the memory mapped file, hence the
+        frames can be loaded lazily, e.g. with `FrameFiles`.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        index: dict = {"frame_count": 0, "arrays": {}}
+        for name, frames in arrays.items():
+            if len(frames) == 0:
+                raise ValueError(f"There are no frames to pack for {name} in {path}.")
+            file = f"{name}.npy"
+            first = frames[0].numpy()
+            array = np.lib.format.open_memmap(
+                path / file,
+                mode="w+",
+                dtype=first.dtype,
+                shape=(len(frames), *first.shape),
+            )
+            array[0] = first
+            for frame_idx in range(1, len(frames)):
+                array[frame_idx] = frames[frame_idx].numpy()
+            array.flush()
+            index["arrays"][name] = {
+                "file": file,
+                "shape": list(array.shape),
+                "dtype": str(array.dtype),
+            }
+            index["frame_count"] = len(frames)
+            del array  # close the mapping
+        # the index is written last, hence a partial conversion is never opened
+        with open(path / cls.index_name, "w") as f:
+            json.dump(index, f, indent=2)
+        return cls(path)
+
+
+class FrameFiles:
+    """Lazy sequence of the per-frame .pt files of a folder, e.g. `{idx:05}.pt`.
+
+    Args:
+        folder: The folder of the frames.
+        frame_count: The number of frames.
+        key: Selects the value of a dict per frame, e.g. a flame param.
+    """
+
+    def __init__(self, folder: Path, frame_count: int, key: str | None = None):
+        self.folder = folder
+        self.frame_count = frame_count
+        self.key = key
+
+    def __len__(self):
+        return self.frame_count
+
+    def __getitem__(self, frame_idx: int) -> torch.Tensor:
+        frame = torch.load(self.folder / f"{frame_idx:05}.pt")
+        if self.key is not None:
+            return frame[self.key][0]
+        return frame
+
+
+CACHE_FOLDER = re.compile(r"^(\d+)_(color|mask|normal|point)$")
+
+
+def convert_sequence(
+    data_dir: str | Path,
+    dataset: str,
+    scales: list[int] | None = None,
+    packed_dir: str = "packed",
+):
+    """Converts the per-frame .pt files of a sequence into the packed layout.
+
+    The cached images are read from `cache/{scale}_{type}/{idx:05}.pt`, the root
+    data from `{type}/{idx:05}.pt` and the params from `params/{idx:05}.pt`. The
+    frames are streamed into the packed arrays, only one frame is in memory. Other
+    folders of the cache, e.g. the `{scale}_code` caches, are skipped.
+    """
+    root = Path(data_dir) / dataset
+    cache_dir = root / "cache"
+
+    folders: dict[str, Path] = {}
+    for folder in sorted(cache_dir.iterdir()):
+        match = CACHE_FOLDER.match(folder.name)
+        if not folder.is_dir() or match is None:
+            continue
+        scale, data_type = match.groups()
+        if scales is not None and int(scale) not in scales:
+            continue
+        folders[PackedFrameStore.cached_name(int(scale), data_type)] = folder
+    for data_type in ["landmark", "landmark_mask", "vertices"]:
+        if (root / data_type).exists():
+            folders[data_type] = root / data_type
+
+    # the number of frames of the converted data types, they need to match
+    counts = {name: len(list(f.glob("*.pt"))) for name, f in folders.items()}
+    if (root / "params").exists():
+        counts["params"] = len(list((root / "params").glob("*.pt")))
+    if len(set(counts.values())) != 1:
+        raise ValueError(f"The frame counts of {dataset} differ: {counts}")
+    frame_count = next(iter(counts.values()))
+
+    arrays: dict[str, Sequence[torch.Tensor]] = {
+        name: FrameFiles(folder, frame_count) for name, folder in folders.items()
+    }
+    if (root / "params").exists():
+        params = torch.load(root / "params" / f"{0:05}.pt")
+        for key in params.keys():
+            name = PackedFrameStore.param_name(key)
+            arrays[name] = FrameFiles(root / "params", frame_count, key=key)
+
+    return PackedFrameStore.write(root / packed_dir, arrays)
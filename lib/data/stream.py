@@ -0,0 +1,210 @@
+import io
+import queue
+import socket
+import struct
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision.transforms.functional import pil_to_tensor
+
+
+class FrameSource:
+    """A source of raw RGB-D frames, which arrive while the tracker is running.
+
+    The frames are dicts with the frame_idx, the color (H, W, 3) uint8, the depth in m
+    (H, W), optionally the landmark pixels (L, 2) and the arrival time, which is set
+    with `time.perf_counter` once the frame is received. The frames are filled into a
+    queue by a background thread, hence the tracker can drop the frames that arrived
+    while the previous frame was tracked.
+
+    Args:
+        maxsize: The max number of buffered frames, if full the oldest is dropped.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._done = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def run(self):
+        """Fills the queue until the source is closed or exhausted."""
+        pass
+
+    def put(self, frame: dict):
+        frame.setdefault("arrival", time.perf_counter())
+        while True:
+            try:
+                self.queue.put_nowait(frame)
+                return
+            except queue.Full:  # the tracker is behind, drop the oldest frame
+                self._pop()
+
+    def _pop(self):
+        try:
+            self.queue.get_nowait()
+            self.dropped += 1
+        except queue.Empty:
+            pass
+
+    def get(self, timeout: float | None = None):
+        """The next frame, None if the source is exhausted or the timeout is over."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            try:
+                return self.queue.get(timeout=0.01)
+            except queue.Empty:
+                if self._done.is_set() and self.queue.empty():
+                    return None
+                if deadline is not None and time.perf_counter() > deadline:
+                    return None
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def finish(self):
+        """Marks the source as exhausted, the buffered frames are still returned."""
+        self._done.set()
+
+    def close(self):
+        self.finish()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+
+class QueueFrameSource(FrameSource):
+    """The frames are pushed with `put` from another thread, e.g. a sensor callback."""
+
+
+class DirectoryFrameSource(FrameSource):
+    """Watches the color and depth folders of a sequence for new frames.
+
+    The frames are expected in the layout of the dphm kinect sequences, e.g.
+    color/00012.png, depth/00012.png and optionally the mediapipe landmarks in
+    color/Mediapipe_landmarks/00012.npy, which are written by the capture process.
+
+    Args:
+        data_dir: The directory of the sequence.
+        depth_factor: The pixel to depth ratio, e.g. 1000 for mm.
+        media_idx: The mediapipe idxs of the flame landmarks.
+        start_frame: The first frame idx.
+        poll_interval: The time in s between two checks of the folders.
+        idle_timeout: The source is exhausted if no frame arrived within the time.
+    """
+
+    def __init__(
+        self,
+        data_dir: str | Path,
+        depth_factor: float = 1000,
+        media_idx: np.ndarray | None = None,
+        start_frame: int = 0,
+        poll_interval: float = 0.005,
+        idle_timeout: float = 5.0,
+        maxsize: int = 64,
+    ):
+        super().__init__(maxsize=maxsize)
+        self.data_dir = Path(data_dir)
+        self.depth_factor = depth_factor
+        self.media_idx = media_idx
+        self.frame_idx = start_frame
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+
+    def load_frame(self, frame_idx: int):
+        color_path = self.data_dir / "color" / f"{frame_idx:05}.png"
+        depth_path = self.data_dir / "depth" / f"{frame_idx:05}.png"
+        if not (color_path.exists() and depth_path.exists()):
+            return None
+        try:
+            color = pil_to_tensor(Image.open(color_path)).permute(1, 2, 0)
+            depth = pil_to_tensor(Image.open(depth_path)).to(torch.float32)[0]
+        except OSError:  # the file is still written
+            return None
+        frame = {"frame_idx": frame_idx, "color": color}
+        frame["depth"] = depth / self.depth_factor
+        path = self.data_dir / "color/Mediapipe_landmarks" / f"{frame_idx:05}.npy"
+        if self.media_idx is not None and path.exists():
+            landmark = torch.tensor(np.load(path))
+            landmark[:, 0] *= color.shape[1]
+            landmark[:, 1] *= color.shape[0]
+            frame["landmark"] = landmark[self.media_idx].long()
+        return frame
+
+    def run(self):
+        last_arrival = time.perf_counter()
+        while not self._done.is_set():
+            frame = self.load_frame(self.frame_idx)
+            if frame is not None:
+                self.put(frame)
+                self.frame_idx += 1
+                last_arrival = time.perf_counter()
+                continue
+            if time.perf_counter() - last_arrival > self.idle_timeout:
+                break
+            time.sleep(self.poll_interval)
+        self.finish()
+
+
+def send_frame(sock: socket.socket, frame: dict):
+    """Sends a frame to a `SocketFrameSource`, prefixed with the length in bytes."""
+    buffer = io.BytesIO()
+    torch.save({k: v for k, v in frame.items() if k != "arrival"}, buffer)
+    data = buffer.getvalue()
+    sock.sendall(struct.pack("!Q", len(data)) + data)
+
+
+class SocketFrameSource(FrameSource):
+    """Receives the frames from a local socket, a stand-in for a sensor process.
+
+    The sender connects to (host, port) and sends the frames with `send_frame`,
+    closing the connection exhausts the source.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 5555,
+        maxsize: int = 64,
+    ):
+        super().__init__(maxsize=maxsize)
+        self.server = socket.create_server((host, port))
+        self.server.settimeout(0.1)
+
+    @staticmethod
+    def recv_exact(conn: socket.socket, size: int):
+        data = bytearray()
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                return None
+            data.extend(chunk)
+        return bytes(data)
+
+    def run(self):
+        conn = None
+        while conn is None and not self._done.is_set():
+            try:
+                conn, _ = self.server.accept()
+            except socket.timeout:
+                continue
+        while conn is not None and not self._done.is_set():
+            header = self.recv_exact(conn, 8)
+            if header is None:
+                break
+            data = self.recv_exact(conn, struct.unpack("!Q", header)[0])
+            if data is None:
+                break
+            self.put(torch.load(io.BytesIO(data), weights_only=True))
+        if conn is not None:
+            conn.close()
+        self.server.close()
+        self.finish()
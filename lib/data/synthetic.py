@@ -1,8 +1,15 @@
+import random
 from collections import defaultdict
 
 import torch
+from omegaconf import DictConfig, OmegaConf
+from torch.utils.data import Dataset
 
+from lib.data.loader import load_intrinsics
 from lib.model import Flame
+from lib.rasterizer import Rasterizer
+from lib.renderer.camera import Camera
+from lib.renderer.renderer import Renderer
 
 
 def generate_params(
@@ -59,3 +66,220 @@ def generate_synthetic_params(
         value[zero_mask] = 0.0
         params[key] = value
     return params
+
+
+def generate_sequence_params(
+    flame: Flame,
+    frame_size: int,
+    params_settings: dict,
+    offset_settings: dict,
+    select: list[str] | None = None,
+):
+    """Samples the params of all frames of a synthetic sequence at once.
+
+    The default params of the sequence are sampled once and the per-frame offsets
+    are sampled as one window of size `frame_size`, which follows the same
+    distribution as the frame by frame sampling in `scripts/generate_synthetic.py`.
+
+    Returns:
+        (dict): The params of the frames, each of dim (F, D).
+    """
+    default_params = generate_synthetic_params(
+        flame,
+        window_size=params_settings["window_size"],
+        default=params_settings["default"],
+        sigmas=params_settings["sigmas"],
+        sparsity=params_settings["sparsity"],
+        select=select,
+    )
+    offset = generate_synthetic_params(
+        flame,
+        window_size=frame_size,
+        default=offset_settings["default"],
+        sigmas=offset_settings["sigmas"],
+        sparsity=offset_settings["sparsity"],
+        select=select,
+    )
+    params = {}
+    for p_name, default in default_params.items():
+        value = default + offset[p_name]  # the global params are shared
+        params[p_name] = value.expand(frame_size, -1).contiguous()
+    return params
+
+
+def render_sequence(
+    flame: Flame,
+    renderer,
+    params: dict,
+    scales: list[int],
+    batch_size: int = 32,
+    data_types: list[str] = ["mask", "point", "normal", "color"],
+):
+    """Renders the frames of a sequence in batches for each scale.
+
+    Returns:
+        (dict): The rendered frames of dim (F, H', W', ...) on the cpu for each
+            (scale, data type), e.g. out[(8, "point")].
+    """
+    frame_size = next(iter(params.values())).shape[0]
+    out: dict[tuple[int, str], list[torch.Tensor]] = defaultdict(list)
+    for scale in scales:
+        renderer.update(scale=scale)
+        for start in range(0, frame_size, batch_size):
+            batch_params = {k: v[start : start + batch_size] for k, v in params.items()}
+            r_out = flame.render(renderer=renderer, params=batch_params)
+            for data_type in data_types:
+                out[(scale, data_type)].append(r_out[data_type].detach().cpu())
+    return {k: torch.cat(v, dim=0) for k, v in out.items()}
+
+
+class SyntheticTrainDataset(Dataset):
+    """Renders the synthetic training frames on the fly instead of loading them.
+
+    The sample idx is split into a sequence and a frame of the sequence. The default
+    params of a sequence and the offset of a frame are sampled with a seed derived
+    from (seed, sequence, frame), hence a sample is the same in every epoch and in
+    every DataLoader worker, and the init frame `frame_idx - jump_size` is the same
+    frame that is rendered for its own idx. The init frame of the dynamic mode is
+    drawn with the same seed. As in the `DPHMTrainDataset` only the
+    frames whose init frames are inside of the sequence are sampled. The flame
+    model and the renderer are created lazily in each worker, use the "spawn"
+    context with CUDA workers.
+
+    Args:
+        sequence_size: The number of synthetic sequences.
+        frame_size: The number of frames of one synthetic sequence.
+        seed: The base seed, use different seeds for the train and val split.
+        flame: The kwargs of the flame model.
+        intrinsics_dir: The sequence of the camera calibration.
+    """
+
+    def __init__(
+        self,
+        scale: int = 1,
+        sequence_size: int = 1000,
+        frame_size: int = 100,
+        jump_size: int = 1,
+        mode: str = "fix",
+        seed: int = 0,
+        flame: dict = {},
+        intrinsics_dir: str = "/data",
+        width: int = 1920,
+        height: int = 1080,
+        near: float = 0.01,
+        far: float = 100,
+        params_settings: dict = {},
+        offset_settings: dict = {},
+        params_filter: list[str] | None = None,
+        landmarks: bool = True,
+        device: str = "cuda",
+        **kwargs,
+    ):
+        assert mode in ["fix", "dynamic"]
+        self.scale = scale
+        self.sequence_size = sequence_size
+        self.frame_size = frame_size
+        self.jump_size = jump_size
+        self.mode = mode
+        # the frames [jump_size, frame_size) or [jump_size, frame_size - jump_size)
+        self.num_frames = frame_size - jump_size
+        if mode == "dynamic":
+            self.num_frames -= jump_size
+        assert self.num_frames > 0, "The frame size needs to exceed the jump size."
+        self.seed = seed
+        self.flame_kwargs = self.to_dict(flame)
+        self.intrinsics_dir = intrinsics_dir
+        self.camera_kwargs = dict(width=width, height=height, near=near, far=far)
+        self.params_settings = self.to_dict(params_settings)
+        self.offset_settings = self.to_dict(offset_settings)
+        self.params_filter = None if params_filter is None else list(params_filter)
+        self.landmarks_flag = landmarks
+        self.device = device
+        self._flame: Flame | None = None
+        self._renderer: Renderer | None = None
+
+    @staticmethod
+    def to_dict(settings: dict | DictConfig):
+        if isinstance(settings, DictConfig):
+            return OmegaConf.to_container(settings, resolve=True)
+        return dict(settings)
+
+    def __len__(self) -> int:
+        return self.sequence_size * self.num_frames
+
+    def setup(self):
+        """Creates the flame model and the renderer in the current process."""
+        if self._flame is not None:
+            return
+        K = load_intrinsics(data_dir=self.intrinsics_dir, return_tensor="pt")
+        camera = Camera(K=K, scale=self.scale, device=self.device, **self.camera_kwargs)
+        rasterizer = Rasterizer(width=camera.width, height=camera.height)
+        self._renderer = Renderer(rasterizer=rasterizer, camera=camera)
+        self._flame = Flame(**self.flame_kwargs, device=self.device)
+
+    def sample_seed(self, *keys: int):
+        seed = self.seed
+        for key in keys:
+            seed = (seed * 1_000_003 + key) % 2**63
+        return seed
+
+    def sample_params(self, sequence: int, frame_idx: int):
+        """The params of a frame, deterministic for the (sequence, frame)."""
+        assert self._flame is not None
+        devices = [self.device] if self.device.startswith("cuda") else []
+        with torch.random.fork_rng(devices=devices):
+            torch.manual_seed(self.sample_seed(sequence))
+            default_params = generate_synthetic_params(
+                self._flame,
+                select=self.params_filter,
+                **self.params_settings,
+            )
+            torch.manual_seed(self.sample_seed(sequence, frame_idx))
+            offset = generate_synthetic_params(
+                self._flame,
+                select=self.params_filter,
+                **self.offset_settings,
+            )
+        return {k: v + offset[k] for k, v in default_params.items()}
+
+    def __getitem__(self, idx: int):
+        self.setup()
+        assert self._flame is not None and self._renderer is not None
+        sequence = idx // self.num_frames
+        frame_idx = idx % self.num_frames + self.jump_size
+        init_idx = frame_idx - self.jump_size
+        if self.mode == "dynamic":
+            s_idx = frame_idx - self.jump_size
+            e_idx = frame_idx + self.jump_size
+            rng = random.Random(self.sample_seed(sequence, frame_idx))
+            init_idx = rng.randint(s_idx, e_idx)
+
+        # render the frame and the init frame with one batch
+        params = self.sample_params(sequence, frame_idx)
+        init_params = self.sample_params(sequence, init_idx)
+        batch_params = {k: torch.cat([params[k], init_params[k]]) for k in params}
+        with torch.no_grad():
+            out = self._flame.render(renderer=self._renderer, params=batch_params)
+        out = {k: v.detach().cpu() for k, v in out.items() if torch.is_tensor(v)}
+
+        landmark = []
+        landmark_mask = []
+        if self.landmarks_flag:
+            landmark = out["landmark"][0]
+            landmark_mask = torch.ones(landmark.shape[0], dtype=torch.bool)
+        return {
+            "dataset": f"s{sequence:05}",
+            "frame_idx": frame_idx,
+            "mask": out["mask"][0],
+            "point": out["point"][0],
+            "normal": out["normal"][0],
+            "color": out["color"][0],
+            "params": {k: v[0].detach().cpu() for k, v in params.items()},
+            "vertices": out["vertices"][0],
+            "init_params": {k: v[0].detach().cpu() for k, v in init_params.items()},
+            "init_vertices": out["vertices"][1],
+            "init_color": out["color"][1],
+            "init_frame_idx": frame_idx,
+            "landmark": landmark,
+            "landmark_mask": landmark_mask,
+        }
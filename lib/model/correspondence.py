@@ -1,3 +1,5 @@
+from dataclasses import dataclass
+
 import torch
 import torch.nn as nn
 
@@ -5,6 +7,8 @@ from lib.model.common import CNNMLP
 
 
 class OpticalFlowCorrespondenceModule(nn.Module):
+    rasterize: bool = True
+
     def __init__(
         self,
         hidden_channels: int = 100,
@@ -113,6 +117,8 @@ class OpticalFlowCorrespondenceModule(nn.Module):
 
 
 class ProjectiveCorrespondenceModule(nn.Module):
+    rasterize: bool = True
+
     def __init__(self, d_threshold: float = 0.1, n_threshold: float = 0.9):
         super().__init__()
         self.d_threshold = d_threshold
@@ -163,3 +169,242 @@ class ProjectiveCorrespondenceModule(nn.Module):
 
     def transform(self, t_value: torch.Tensor, **kwargs):
         return t_value
+
+
+@dataclass
+class VoxelHashIndex:
+    """A voxel hash over the masked source point clouds of a batch of frames.
+
+    The points are sorted by the linear key of their voxel, each occupied voxel
+    stores the range of its points, hence a lookup of a voxel is a binary search
+    over the keys and the nearest neighbor is searched over the points of the
+    neighborhood voxels.
+
+    Attributes:
+        keys (torch.Tensor): The sorted linear keys of the occupied voxels (K,).
+        start (torch.Tensor): The first point of each voxel (K,).
+        end (torch.Tensor): The end of the points of each voxel (K,).
+        point (torch.Tensor): The points sorted by voxel of dim (P, 3).
+        normal (torch.Tensor): The normals sorted by voxel of dim (P, 3).
+        origin (torch.Tensor): The min voxel coordinate of dim (3,).
+        dims (torch.Tensor): The extend of the voxel grid of dim (3,).
+        voxel_size (float): The edge length of a voxel.
+    """
+
+    keys: torch.Tensor
+    start: torch.Tensor
+    end: torch.Tensor
+    point: torch.Tensor
+    normal: torch.Tensor
+    origin: torch.Tensor
+    dims: torch.Tensor
+    voxel_size: float
+
+    @classmethod
+    def build(
+        cls,
+        s_mask: torch.Tensor,
+        s_point: torch.Tensor,
+        s_normal: torch.Tensor,
+        voxel_size: float,
+        num_rings: int = 1,
+    ):
+        B = s_mask.shape[0]
+        b_idx = torch.arange(B, device=s_mask.device)
+        b_idx = b_idx.view(B, *([1] * (s_mask.dim() - 1))).expand_as(s_mask)[s_mask]
+        point = s_point[s_mask]  # (P, 3)
+        normal = s_normal[s_mask]  # (P, 3)
+
+        # the voxel grid with a border for the neighborhood lookup
+        coords = torch.floor(point / voxel_size).long()  # (P, 3)
+        origin = coords.min(dim=0).values - num_rings
+        coords = coords - origin
+        dims = coords.max(dim=0).values + num_rings + 1
+        keys = cls.linear_keys(b_idx, coords, dims)
+
+        # sort the points by voxel, each voxel is a range of points
+        keys, order = keys.sort()
+        keys, counts = torch.unique_consecutive(keys, return_counts=True)
+        end = counts.cumsum(0)
+
+        return cls(
+            keys=keys,
+            start=end - counts,
+            end=end,
+            point=point[order],
+            normal=normal[order],
+            origin=origin,
+            dims=dims,
+            voxel_size=voxel_size,
+        )
+
+    @staticmethod
+    def linear_keys(b_idx: torch.Tensor, coords: torch.Tensor, dims: torch.Tensor):
+        x, y, z = coords.unbind(-1)
+        return ((b_idx * dims[0] + x) * dims[1] + y) * dims[2] + z
+
+    def query(self, point: torch.Tensor, num_rings: int = 1, chunk_size: int = 4096):
+        """Finds the nearest point in the neighborhood voxels of the query points.
+
+        Args:
+            point (torch.Tensor): The query points of dim (B, V, 3).
+            num_rings (int): The number of voxel rings around the query voxel.
+            chunk_size (int): The number of query points that are searched at once.
+
+        Returns:
+            (torch.Tensor, torch.Tensor, torch.Tensor): The nearest point (B, V, 3),
+                the normal (B, V, 3) and the mask of the found points (B, V).
+        """
+        B, V, _ = point.shape
+        r = torch.arange(-num_rings, num_rings + 1, device=point.device)
+        offsets = torch.cartesian_prod(r, r, r)  # (R, 3)
+
+        # the keys of the neighborhood voxels
+        coords = torch.floor(point / self.voxel_size).long() - self.origin
+        coords = coords.unsqueeze(-2) + offsets  # (B, V, R, 3)
+        valid = ((coords >= 0) & (coords < self.dims)).all(dim=-1)  # (B, V, R)
+        b_idx = torch.arange(B, device=point.device).view(B, 1, 1)
+        keys = self.linear_keys(b_idx, coords, self.dims)  # (B, V, R)
+
+        # binary search for the occupied voxels
+        pos = torch.searchsorted(self.keys, keys.reshape(-1)).reshape(keys.shape)
+        pos = pos.clamp(max=self.keys.shape[0] - 1)
+        found = valid & (self.keys[pos] == keys)  # (B, V, R)
+
+        query = point.reshape(B * V, 3)
+        pos, found = pos.reshape(B * V, -1), found.reshape(B * V, -1)
+        nearest = torch.full((B * V,), -1, dtype=torch.long, device=point.device)
+        for q_start in range(0, B * V, chunk_size):
+            q_idx, v_idx = found[q_start : q_start + chunk_size].nonzero(as_tuple=True)
+            q_idx = q_idx + q_start
+            voxel = pos[q_idx, v_idx]
+
+            # expand the voxels to the (query, point) candidate pairs
+            counts = self.end[voxel] - self.start[voxel]
+            q_idx = q_idx.repeat_interleave(counts)
+            first = counts.cumsum(0) - counts
+            p_idx = torch.arange(q_idx.shape[0], device=point.device)
+            p_idx = p_idx - first.repeat_interleave(counts)
+            p_idx = p_idx + self.start[voxel].repeat_interleave(counts)
+
+            # the nearest of the candidates
+            dist = (self.point[p_idx] - query[q_idx]).pow(2).sum(-1)
+            best = dist.new_full((B * V,), torch.inf)
+            best = best.scatter_reduce(0, q_idx, dist, reduce="amin")
+            is_best = dist == best[q_idx]
+            nearest[q_idx[is_best]] = p_idx[is_best]
+
+        f_mask = nearest >= 0
+        nearest = nearest.clamp(min=0)
+        point = self.point[nearest].reshape(B, V, 3)
+        normal = self.normal[nearest].reshape(B, V, 3)
+        return point, normal, f_mask.reshape(B, V)
+
+
+class NearestNeighborCorrespondenceModule(nn.Module):
+    """Rasterization-free correspondences between the vertices and the point cloud.
+
+    The spatial index is build once per input frame, the model vertices query the
+    index in batch. The rejection uses the same distance and normal thresholds as
+    the projective correspondences. The search radius of the index is at least
+    num_rings * voxel_size, by default the voxels are as large as the distance
+    threshold, hence a single ring covers it.
+    """
+
+    rasterize: bool = False
+
+    def __init__(
+        self,
+        d_threshold: float = 0.1,
+        n_threshold: float = 0.9,
+        voxel_size: float | None = None,
+        num_rings: int = 1,
+    ):
+        super().__init__()
+        self.d_threshold = d_threshold
+        self.n_threshold = n_threshold
+        if voxel_size is None:
+            voxel_size = d_threshold
+        self.voxel_size = voxel_size
+        assert num_rings >= d_threshold / voxel_size, "The search radius is too small."
+        self.num_rings = num_rings
+        self._index: VoxelHashIndex | None = None
+        self._index_key: tuple | None = None
+
+    def build(
+        self,
+        s_mask: torch.Tensor,
+        s_point: torch.Tensor,
+        s_normal: torch.Tensor,
+        frame_idx: list[int] | None = None,
+    ):
+        """Builds the spatial index, which is reused for the same frames."""
+        key = None
+        if frame_idx is not None:
+            key = (tuple(int(idx) for idx in frame_idx), tuple(s_point.shape))
+            if self._index is not None and key == self._index_key:
+                return self._index
+        self._index = VoxelHashIndex.build(
+            s_mask=s_mask,
+            s_point=s_point,
+            s_normal=s_normal,
+            voxel_size=self.voxel_size,
+            num_rings=self.num_rings,
+        )
+        self._index_key = key
+        return self._index
+
+    def predict(
+        self,
+        s_mask: torch.Tensor,
+        s_point: torch.Tensor,
+        s_normal: torch.Tensor,
+        t_point: torch.Tensor,
+        t_normal: torch.Tensor,
+        frame_idx: list[int] | None = None,
+    ):
+        index = self.build(
+            s_mask=s_mask,
+            s_point=s_point,
+            s_normal=s_normal,
+            frame_idx=frame_idx,
+        )
+        point, normal, f_mask = index.query(t_point, num_rings=self.num_rings)
+        return {
+            "s_mask": f_mask,  # (B, V)
+            "s_point": point,  # (B, V, 3)
+            "s_normal": normal,  # (B, V, 3)
+            "t_point": t_point,  # (B, V, 3)
+            "t_normal": t_normal,  # (B, V, 3)
+        }
+
+    def mask(
+        self,
+        s_mask: torch.Tensor,
+        s_point: torch.Tensor,
+        s_normal: torch.Tensor,
+        t_point: torch.Tensor,
+        t_normal: torch.Tensor,
+        t_mask: torch.Tensor | None = None,
+    ):
+        # the per vertex distance in 3d to the nearest neighbor
+        dist = torch.norm(t_point - s_point, dim=-1)  # (B, V)
+        # vertices that found a neighbor and which are part of the model
+        f_mask = s_mask if t_mask is None else s_mask & t_mask  # (B, V)
+        # the depth mask based on some epsilon of distance 10cm
+        d_mask = (dist < self.d_threshold) & f_mask  # (B, V)
+        # dot product, e.g. coresponds to an angle
+        normal_dot = (s_normal * t_normal).sum(-1)
+        n_mask = normal_dot > self.n_threshold  # (B, V)
+        # final loss mask of distance and normal threshold
+        final_mask = d_mask & f_mask & n_mask
+
+        info = {}
+        info["mask_normal"] = n_mask
+        info["mask_depth"] = d_mask
+        info["mask_final"] = final_mask
+
+        return final_mask, info
+
+    def transform(self, t_value: torch.Tensor, **kwargs):
+        return t_value
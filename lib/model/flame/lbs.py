@@ -399,3 +399,16 @@ def batch_rigid_transform(
     posed_joints = transforms[:, :, :3, 3]
 
     return posed_joints, rel_transforms
+
+
+def matrix_to_axis_angle(R: torch.Tensor, eps: float = 1e-6):
+    """The log map of the rotation matrices (N, 3, 3) to axis-angle vectors (N, 3)."""
+    trace = R[:, 0, 0] + R[:, 1, 1] + R[:, 2, 2]
+    angle = torch.acos(((trace - 1) / 2).clamp(-1 + eps, 1 - eps))
+    vee = torch.stack(
+        [R[:, 2, 1] - R[:, 1, 2], R[:, 0, 2] - R[:, 2, 0], R[:, 1, 0] - R[:, 0, 1]],
+        dim=-1,
+    )
+    # for small angles angle / sin(angle) goes to 1
+    factor = torch.where(angle < 1e-4, torch.ones_like(angle), angle / angle.sin())
+    return 0.5 * factor[:, None] * vee
@@ -0,0 +1,134 @@
+import math
+
+import torch
+import torch.nn as nn
+
+from lib.utils.distance import point2plane_distance
+
+
+class ResidualSampler(nn.Module):
+    def __init__(
+        self,
+        mode: str = "uniform",  # uniform, stratified, importance
+        budget: int = 5000,  # max number of pixels per frame
+        reweight: bool = True,  # unbiased energy with inverse inclusion prob
+        num_bins: int = 4,  # number of bins per angle for the normal space
+        eps: float = 1e-04,  # min error for the importance sampling
+    ):
+        super().__init__()
+        assert mode in ["uniform", "stratified", "importance"]
+        self.mode = mode
+        self.budget = budget
+        self.reweight = reweight
+        self.num_bins = num_bins
+        self.eps = eps
+
+    def normal_bins(self, normal: torch.Tensor):
+        """Quantizes the normals into bins of the polar and azimuth angle.
+
+        Args:
+            normal (torch.Tensor): The normals of dim (C, 3).
+
+        Returns:
+            (torch.Tensor): The bin idx per normal of dim (C,).
+        """
+        theta = torch.acos(normal[:, 2].clamp(-1.0, 1.0)) / math.pi  # (0, 1)
+        phi = (torch.atan2(normal[:, 1], normal[:, 0]) + math.pi) / (2 * math.pi)
+        theta = (theta * self.num_bins).long().clamp(0, self.num_bins - 1)
+        phi = (phi * self.num_bins).long().clamp(0, self.num_bins - 1)
+        return theta * self.num_bins + phi
+
+    def sample_uniform(self, k: int, **kwargs):
+        C = kwargs["s_point"].shape[0]
+        idx = torch.randperm(C, device=kwargs["s_point"].device)[:k]
+        prob = torch.full((k,), k / C, device=idx.device)
+        return idx, prob
+
+    def sample_stratified(self, k: int, **kwargs):
+        s_normal = kwargs["s_normal"]
+        C = s_normal.shape[0]
+        num_bins = self.num_bins**2
+
+        # random order of the pixels inside of each bin
+        bins = self.normal_bins(s_normal)
+        perm = torch.randperm(C, device=bins.device)
+        order = torch.argsort(bins[perm], stable=True)
+        idx, bins = perm[order], bins[perm][order]
+
+        # the same quota per non-empty bin, small bins are taken completely and
+        # their leftover quota is redistributed to the larger bins
+        counts = torch.bincount(bins, minlength=num_bins)
+        quota = self.bin_quota(k, counts.tolist())
+        quota = torch.tensor(quota, device=bins.device)
+        start = torch.cumsum(counts, dim=0) - counts
+        rank = torch.arange(C, device=bins.device) - start[bins]
+        select = rank < quota[bins]
+        prob = torch.clamp(quota[bins] / counts[bins], max=1.0)
+        return idx[select], prob[select]
+
+    def bin_quota(self, k: int, counts: list[int]):
+        """The number of samples per bin, which sum up to min(k, sum(counts))."""
+        quota = [0] * len(counts)
+        remaining = k
+        bins = sorted((c, i) for i, c in enumerate(counts) if c > 0)
+        for j, (count, i) in enumerate(bins):
+            share = remaining // (len(bins) - j)
+            if count <= share:  # small bins are taken completely
+                quota[i] = count
+                remaining -= count
+                continue
+            # the remaining bins are larger than their share
+            num_large = len(bins) - j
+            for n, (_, i) in enumerate(bins[j:]):
+                quota[i] = remaining // num_large + int(n < remaining % num_large)
+            break
+        return quota
+
+    def sample_importance(self, k: int, **kwargs):
+        error = point2plane_distance(
+            kwargs["s_point"], kwargs["t_point"], kwargs["t_normal"]
+        )
+        p = error + self.eps
+        p = p / p.sum()
+        idx = torch.multinomial(p, k, replacement=False)
+        # approximated inclusion probability without replacement
+        prob = torch.clamp(k * p[idx], max=1.0)
+        return idx, prob
+
+    def sample(
+        self,
+        mask: torch.Tensor,
+        s_point: torch.Tensor,
+        s_normal: torch.Tensor,
+        t_point: torch.Tensor,
+        t_normal: torch.Tensor,
+    ):
+        """Subsamples the correspondences to a fixed budget per frame.
+
+        The residuals of the sampled pixels are reweighted with the square root of
+        the inverse inclusion probability, hence the energy of the sampled residuals
+        is an unbiased estimate of the energy of all of the correspondences.
+
+        Returns:
+            (torch.Tensor, torch.Tensor): The sampled mask of dim (B, H, W) and the
+                residual weights of dim (B, H, W).
+        """
+        sample_fn = getattr(self, f"sample_{self.mode}")
+        new_mask = torch.zeros_like(mask)
+        weights = torch.ones_like(mask, dtype=s_point.dtype)
+        for b in range(mask.shape[0]):
+            pixel_idx = mask[b].flatten().nonzero().squeeze(-1)  # (C,)
+            if pixel_idx.shape[0] <= self.budget:
+                new_mask[b] = mask[b]
+                continue
+            idx, prob = sample_fn(
+                k=self.budget,
+                s_point=s_point[b][mask[b]],
+                s_normal=s_normal[b][mask[b]],
+                t_point=t_point[b][mask[b]],
+                t_normal=t_normal[b][mask[b]],
+            )
+            new_mask[b].view(-1)[pixel_idx[idx]] = True
+            if self.reweight:
+                weights[b].view(-1)[pixel_idx[idx]] = torch.rsqrt(prob)
+        return new_mask, weights
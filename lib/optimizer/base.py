@@ -11,6 +11,53 @@ from lib.tracker.timer import TimeTracker
 log = logging.getLogger()
 
 
+class FactoredClosure:
+    """Residual closure that supports the two-stage jacobian computation.
+
+    Each dense residual depends only on the three vertices of the rasterized face,
+    hence instead of differentiating the full closure per parameter tangent, the
+    jacobian of the model outputs, e.g. the vertices of dim (B, V, 3, N), is computed
+    once. The residual rows are then formed by barycentric interpolation and the
+    analytic derivatives of the residuals.
+
+    Args:
+        residual_closure: The default closure that returns F, (F, info).
+        model_closure: Returns the model outputs that are differentiated, e.g. a dict
+            with the vertices (B, V, 3) and the landmarks (B, L, 3).
+        jacobian_closure: Maps the model jacobians and the param jacobians to the
+            jacobian of the residuals of dim (M, N).
+        system_closure: Optional, maps the model outputs, the model jacobians and the
+            param jacobians directly to the normal equations (H, grad_f), e.g. from
+            residuals that are reduced to vertex space.
+        energy_closure: Optional, returns the energy and the energy per term without
+            the per-pixel residuals, e.g. from the quadratic forms in vertex space.
+        num_residuals: The number of residual rows of the energy closure.
+    """
+
+    def __init__(
+        self,
+        residual_closure: Callable,
+        model_closure: Callable,
+        jacobian_closure: Callable,
+        system_closure: Callable | None = None,
+        energy_closure: Callable | None = None,
+        num_residuals: int = 0,
+    ):
+        self.residual_closure = residual_closure
+        self.model_closure = model_closure
+        self.jacobian_closure = jacobian_closure
+        self.system_closure = system_closure
+        self.energy_closure = energy_closure
+        self.num_residuals = num_residuals
+
+    def __call__(self, *args):
+        return self.residual_closure(*args)
+
+    def model_aux_closure(self, *args):
+        m_out = self.model_closure(*args)
+        return m_out, m_out
+
+
 class DifferentiableOptimizer:
     def __init__(
         self,
@@ -26,6 +73,7 @@ class DifferentiableOptimizer:
         self._step_size_factor = 1.0
         self.time_tracker = TimeTracker()
         self.residual_tracker: list = []
+        self.last_residuals: dict[str, torch.Tensor] = {}  # of the last loss step
 
         # convergence criterias
         self.eps_step = eps_step
@@ -191,16 +239,86 @@ class DifferentiableOptimizer:
         return float(loss)
 
     def loss_step(self, closure: Callable[[dict[str, torch.Tensor]], torch.Tensor]):
+        if isinstance(closure, FactoredClosure) and closure.energy_closure:
+            self.last_residuals = {}  # the reduced terms have no residual rows
+            return closure.energy_closure(*self._aktive_params.values())
         F, (_, info) = closure(*self._aktive_params.values())
+        self.last_residuals = {k: r.detach() for k, r in info.items()}
         loss = (F**2).sum()
         info = {k: (r**2).sum() for k, r in info.items()}
         return loss, info
 
+    def params_jacobian(self):
+        """The jacobian of each flat flame param w.r.t. the active params (numel, N)."""
+        N = self._numel
+        eye = torch.eye(N, device=self._gather_flat_param().device)
+        p_jacobian = {}
+        offset = 0
+        for p_name, param in self._aktive_params.items():
+            numel = param.numel()
+            p_jacobian[p_name] = eye[offset : offset + numel]
+            offset += numel
+        for p_name, param in self._default_params.items():
+            p_jacobian[p_name] = eye.new_zeros(param.numel(), N)
+        return p_jacobian
+
+    def model_jacobian_step(
+        self,
+        closure: FactoredClosure,
+        strategy: str = "forward-mode",
+    ):
+        fn = jacfwd if strategy == "forward-mode" else jacrev
+        jacobian_fn = fn(
+            func=closure.model_aux_closure,
+            argnums=tuple(range(len(self._aktive_params))),
+            has_aux=True,
+        )
+        # the jacobians of the model outputs, e.g. vertices of dim (B, V, 3, N)
+        jacobians, m_out = jacobian_fn(*self._aktive_params.values())
+        m_jacobian = {
+            key: torch.cat([j.flatten(-2) for j in jacobian], dim=-1)
+            for key, jacobian in jacobians.items()
+        }
+        return m_jacobian, m_out
+
+    def factored_jacobian_step(
+        self,
+        closure: FactoredClosure,
+        strategy: str = "forward-mode",
+    ):
+        m_jacobian, _ = self.model_jacobian_step(closure, strategy=strategy)
+        J = closure.jacobian_closure(
+            m_jacobian=m_jacobian,
+            p_jacobian=self.params_jacobian(),
+        )  # (M, N)
+        F, _ = closure(*self._aktive_params.values())
+        self.residual_tracker.append(int(J.shape[0]))
+        return J, F
+
+    def system_step(
+        self,
+        closure: FactoredClosure,
+        strategy: str = "forward-mode",
+    ):
+        """Computes the normal equations without forming the pixel jacobian."""
+        assert closure.system_closure is not None
+        m_jacobian, m_out = self.model_jacobian_step(closure, strategy=strategy)
+        H, grad_f = closure.system_closure(
+            params=self.residual_params(self._aktive_params.values()),
+            m_out=m_out,
+            m_jacobian=m_jacobian,
+            p_jacobian=self.params_jacobian(),
+        )  # (N, N) and (N,)
+        self.residual_tracker.append(closure.num_residuals)
+        return H, grad_f
+
     def jacobian_step(
         self,
         closure: Callable[[dict[str, torch.Tensor]], torch.Tensor],
         strategy: str = "forward-mode",
     ):
+        if isinstance(closure, FactoredClosure):
+            return self.factored_jacobian_step(closure, strategy=strategy)
         fn = jacfwd if strategy == "forward-mode" else jacrev
         jacobian_fn = fn(
             func=closure,
@@ -0,0 +1,143 @@
+import logging
+
+import torch
+
+log = logging.getLogger()
+
+
+class FrameConvergence:
+    """Tracks the convergence of the frames of a window and freezes them.
+
+    After each outer iteration the change of the local params and of the mean
+    energy of the dense residuals is measured per frame. The frames that converged
+    for `patience` outer iterations are frozen, e.g. their local params are removed
+    from the active params and their rows from the batch, hence J and H shrink as
+    the window converges. The global params, e.g. the shape, are shared over the
+    window and keep optimizing with the active frames. At a new milestone of the
+    coarse to fine scheduler the frames are thawed, because the residuals change.
+
+    Args:
+        eps_params: The max abs change of the local params of a converged frame.
+        eps_energy: The max relative change of the energy of a converged frame.
+        patience: The number of converged outer iterations until a frame freezes.
+        min_frames: The min number of active frames.
+    """
+
+    def __init__(
+        self,
+        eps_params: float = 1e-4,
+        eps_energy: float = 1e-3,
+        patience: int = 1,
+        min_frames: int = 1,
+    ):
+        self.eps_params = eps_params
+        self.eps_energy = eps_energy
+        self.patience = patience
+        self.min_frames = min_frames
+        self.reset(num_frames=0, local_params=[])
+
+    def reset(self, num_frames: int, local_params: list[str]):
+        self.num_frames = num_frames
+        self.local_params = local_params
+        self.active = list(range(num_frames))  # the positions in the window
+        self.frozen: dict[int, dict[str, torch.Tensor]] = {}
+        self.counts = [0] * num_frames
+        self.prev_params: dict[str, torch.Tensor] | None = None
+        self.prev_energy: torch.Tensor | None = None
+        self.frozen_steps = 0  # the sum of the frozen frames over the iterations
+
+    def select_batch(self, batch: dict):
+        """The rows of the active frames of the fetched batch."""
+        if len(self.active) == self.num_frames:
+            return batch
+        idxs = torch.tensor(self.active)
+        out = {}
+        for key, value in batch.items():
+            if isinstance(value, torch.Tensor) and value.shape[0] == self.num_frames:
+                value = value[idxs.to(value.device)]
+            out[key] = value
+        return out
+
+    def frame_energy(self, mask: torch.Tensor, residuals: list[torch.Tensor]):
+        """The mean energy of the dense residual rows per active frame.
+
+        Args:
+            mask (torch.Tensor): The mask of the correspondences of dim (B, ...).
+            residuals (list[torch.Tensor]): The dense residuals with one row per
+                correspondence, e.g. of dim (C,) or (C, 3).
+        """
+        frame = mask.nonzero()[:, 0]  # the frame of each row (C,)
+        energy = torch.zeros(mask.shape[0], device=mask.device)
+        count = torch.zeros(mask.shape[0], device=mask.device)
+        for r in residuals:
+            assert r.shape[0] == frame.shape[0], "Not rows of the correspondences."
+            r = r.reshape(frame.shape[0], -1).pow(2).sum(-1)
+            energy.index_add_(0, frame, r.to(energy.dtype))
+        count.index_add_(0, frame, torch.ones_like(frame, dtype=count.dtype))
+        return energy / count.clamp(min=1)
+
+    def update(self, params: dict, energy: torch.Tensor | None = None):
+        """Counts the converged frames, returns the positions to freeze."""
+        local = {k: v.detach() for k, v in params.items() if k in self.local_params}
+        prev_params, prev_energy = self.prev_params, self.prev_energy
+        self.prev_params, self.prev_energy = local, energy
+        self.frozen_steps += len(self.frozen)
+        if prev_params is None:
+            return []
+        deltas = [(v - prev_params[k]).abs().amax(-1) for k, v in local.items()]
+        delta = torch.stack(deltas).amax(0)  # (B,)
+        converged = delta < self.eps_params
+        if energy is not None and prev_energy is not None:
+            change = (energy - prev_energy).abs() / prev_energy.clamp(min=1e-12)
+            converged &= change < self.eps_energy
+        for i, c in enumerate(converged.tolist()):
+            self.counts[self.active[i]] = self.counts[self.active[i]] + 1 if c else 0
+        freeze = [
+            i for i, pos in enumerate(self.active) if self.counts[pos] >= self.patience
+        ]
+        return freeze[: max(len(self.active) - self.min_frames, 0)]
+
+    def freeze(self, params: dict, freeze: list[int]):
+        """Moves the local params of the frozen frames, returns the active params."""
+        keep = [i for i in range(len(self.active)) if i not in freeze]
+        for i in freeze:
+            self.frozen[self.active[i]] = {
+                k: params[k][i].detach().clone() for k in self.local_params
+            }
+        self.active = [self.active[i] for i in keep]
+        self.prev_params = None  # the shapes changed
+        idxs = torch.tensor(keep)
+        out = {}
+        for k, v in params.items():
+            if k in self.local_params:
+                v = v.detach()[idxs.to(v.device)].clone()
+            out[k] = v
+        return out
+
+    def merge(self, params: dict):
+        """The params of the full window in the original order, thaws all frames."""
+        if not self.frozen:
+            return params
+        out = {}
+        for k, v in params.items():
+            if k not in self.local_params:
+                out[k] = v
+                continue
+            rows = dict(zip(self.active, v.detach()))
+            rows.update({pos: frame[k] for pos, frame in self.frozen.items()})
+            out[k] = torch.stack([rows[pos] for pos in range(self.num_frames)])
+        self.active = list(range(self.num_frames))
+        self.frozen = {}
+        self.counts = [0] * self.num_frames
+        self.prev_params = None
+        self.prev_energy = None
+        return out
+
+    def print_summary(self, frame_iters: int, frozen_steps: int | None = None):
+        """The frame iterations that were frozen, e.g. removed from J and H."""
+        if frozen_steps is None:
+            frozen_steps = self.frozen_steps
+        saved = frozen_steps / max(frame_iters, 1) * 100
+        log.info(
+            f"Frozen frame iterations: {frozen_steps} of {frame_iters} ({saved:.1f}%)"
+        )
@@ -6,13 +6,16 @@ import torch
 
 from lib.model.flame.flame import Flame
 from lib.model.regularize import DummyRegularizeModule
+from lib.model.sampler import ResidualSampler
 from lib.model.weighting import DummyWeightModule
-from lib.optimizer.base import DifferentiableOptimizer
+from lib.optimizer.base import DifferentiableOptimizer, FactoredClosure
 from lib.optimizer.residuals import LandmarkResiduals, Residuals
+from lib.optimizer.rigid import landmark_rigid_init
 from lib.renderer.renderer import Renderer
 from lib.tracker.logger import FlameLogger
 from lib.tracker.timer import TimeTracker
 from lib.utils.distance import point2plane_distance, point2point_distance
+from lib.utils.mesh import area_vertex_normals
 from lib.utils.progress import reset_progress
 
 log = logging.getLogger()
@@ -29,6 +32,7 @@ class OptimizerFramework(L.LightningModule):
             "weighting",
             "residuals",
             "regularize",
+            "sampler",
         ]
         self.save_hyperparameters(logger=False, ignore=ignore)
         self._default_w_module = DummyWeightModule()
@@ -264,6 +268,8 @@ class OptimizerFramework(L.LightningModule):
         optim_stats = defaultdict(list)
         for optim_out in out["optim_outs"]:
             for key, value in optim_out.items():
+                if value is None:  # e.g. no pixel jacobian in the reduced mode
+                    continue
                 optim_stats[f"min_{key}"].append(value.min())
                 optim_stats[f"max_{key}"].append(value.max())
                 optim_stats[f"mean_{key}"].append(value.mean())
@@ -316,6 +322,8 @@ class NeuralOptimizer(OptimizerFramework):
         verbose: bool = True,
         max_iters: int = 1,
         max_optims: int = 1,
+        jacobian_mode: str = "closure",  # closure, vertex, reduced
+        sampler: ResidualSampler | None = None,
         **kwargs,
     ):
         super().__init__(**kwargs)
@@ -329,6 +337,9 @@ class NeuralOptimizer(OptimizerFramework):
         self.residuals = residuals
         self.max_iters = max_iters
         self.max_optims = max_optims
+        assert jacobian_mode in ["closure", "vertex", "reduced"]
+        self.jacobian_mode = jacobian_mode
+        self.sampler = sampler
         # debugging
         self.time_tracker = TimeTracker()
         self._logger = logger
@@ -368,6 +379,23 @@ class NeuralOptimizer(OptimizerFramework):
                 t_point=out["point"],
                 t_normal=out["normal"],
             )
+            # subsample the correspondences, reused in the inner loop
+            s_weights = torch.ones_like(mask, dtype=batch["point"].dtype)
+            if self.sampler is not None:
+                mask, s_weights = self.sampler.sample(
+                    mask=mask,
+                    s_point=batch["point"],
+                    s_normal=batch["normal"],
+                    t_point=out["point"],
+                    t_normal=out["normal"],
+                )
+            # precompute the interpolation of the masked pixels
+            interpolation = self.renderer.interpolation_operator(
+                vertices_idx=out["vertices_idx"],
+                bary_coords=out["bary_coords"],
+                mask=mask,
+                num_vertices=out["vertices"].shape[1],
+            )
             optim_masks.append(mask)
             self.time_tracker.stop("correspondences")
 
@@ -380,6 +408,7 @@ class NeuralOptimizer(OptimizerFramework):
                 t_normal=out["normal"],
             )
             optim_weights.append(w_out["weights"])
+            weights = w_out["weights"][mask] * s_weights[mask]
             self.time_tracker.stop("weighting")
             # regress regularization
             self.time_tracker.start("regularization")
@@ -396,12 +425,7 @@ class NeuralOptimizer(OptimizerFramework):
                 new_params = self.optimizer.residual_params(args)
                 m_out = self.flame(**new_params)
                 # recompute to perform interpolation of the point inside closure
-                t_point = self.renderer.mask_interpolate(
-                    vertices_idx=out["vertices_idx"],
-                    bary_coords=out["bary_coords"],
-                    attributes=m_out["vertices"],
-                    mask=mask,
-                )
+                t_point = interpolation.interpolate(m_out["vertices"])
 
                 # perform the residuals
                 F, info = self.residuals.step(
@@ -412,17 +436,115 @@ class NeuralOptimizer(OptimizerFramework):
                     s_landmark=batch["landmark"],
                     s_landmark_mask=batch["landmark_mask"],
                     t_landmark=m_out["landmark"],
-                    weights=w_out["weights"][mask],
+                    weights=weights,
                     reg_priors=r_out["priors"],
                     reg_weights=r_out["weights"],
                     params=new_params,
                 )
                 return F, (F, info)  # first jacobian, then two aux
 
+            def model_closure(*args):
+                new_params = self.optimizer.residual_params(args)
+                return self.flame(**new_params)
+
+            def jacobian_closure(m_jacobian: dict, p_jacobian: dict):
+                # pixel jacobian rows from the per-vertex jacobian
+                return self.residuals.jacobian_step(
+                    s_normal=batch["normal"][mask],
+                    t_normal=out["normal"][mask],
+                    s_landmark_mask=batch["landmark_mask"],
+                    t_point_jacobian=interpolation.apply(m_jacobian["vertices"]),
+                    t_landmark_jacobian=m_jacobian["landmark"],
+                    weights=weights,
+                    reg_weights=r_out["weights"],
+                    params_jacobian=p_jacobian,
+                )
+
+            forms: dict = {}
+            rest = self.residuals
+            if self.jacobian_mode == "reduced":
+                # collapse the dense terms once per outer iteration into vertex space
+                forms = self.residuals.reduce(
+                    vertices_idx=interpolation.vertices_idx,
+                    bary_coords=interpolation.bary_coords,
+                    num_vertices=interpolation.matrix.shape[1],
+                    s_point=batch["point"][mask],
+                    t_normal=out["normal"][mask],
+                    weights=weights,
+                )
+                rest = self.residuals.split(exclude=list(forms.keys()))
+
+            # the kwargs of the remaining terms, e.g. landmarks and regularization
+            rest_kwargs = dict(
+                s_normal=batch["normal"][mask],
+                s_point=batch["point"][mask],
+                t_normal=out["normal"][mask],
+                s_landmark=batch["landmark"],
+                s_landmark_mask=batch["landmark_mask"],
+                weights=weights,
+                reg_priors=r_out["priors"],
+                reg_weights=r_out["weights"],
+            )
+
+            def rest_closure(params, m_out):
+                return rest.step(
+                    t_point=interpolation.interpolate(m_out["vertices"]),
+                    t_landmark=m_out["landmark"],
+                    params=params,
+                    **rest_kwargs,
+                )
+
+            def system_closure(params, m_out, m_jacobian, p_jacobian):
+                H, grad_f = 0, 0
+                for form in forms.values():
+                    form_H, form_grad_f = form.system(
+                        vertices=m_out["vertices"],
+                        vertices_jacobian=m_jacobian["vertices"],
+                    )
+                    H, grad_f = H + form_H, grad_f + form_grad_f
+                if rest is None:
+                    return H, grad_f
+                F, _ = rest_closure(params, m_out)
+                J = rest.jacobian_step(
+                    t_point_jacobian=interpolation.apply(m_jacobian["vertices"]),
+                    t_landmark_jacobian=m_jacobian["landmark"],
+                    params_jacobian=p_jacobian,
+                    **rest_kwargs,
+                )
+                return H + 2 * J.T @ J, grad_f + 2 * J.T @ F
+
+            def energy_closure(*args):
+                # the energy of the reduced terms without the pixel residuals
+                new_params = self.optimizer.residual_params(args)
+                m_out = self.flame(**new_params)
+                info = {n: form.energy(m_out["vertices"]) for n, form in forms.items()}
+                if rest is not None:
+                    _, rest_info = rest_closure(new_params, m_out)
+                    info.update({k: (r**2).sum() for k, r in rest_info.items()})
+                return sum(info.values()), info
+
+            num_residuals = len(forms) * interpolation.vertices_idx.shape[0]
+            if forms and rest is not None:
+                with torch.no_grad():
+                    params = self.optimizer.get_params()
+                    F, _ = rest_closure(params, self.flame(**params))
+                num_residuals += F.shape[0]
+
+            closure = residual_closure
+            if self.jacobian_mode in ["vertex", "reduced"]:
+                closure = FactoredClosure(
+                    residual_closure=residual_closure,
+                    model_closure=model_closure,
+                    jacobian_closure=jacobian_closure,
+                    system_closure=system_closure if forms else None,
+                    energy_closure=energy_closure if forms else None,
+                    num_residuals=num_residuals,
+                )
+
             # inner optimization loop
             self.time_tracker.start("inner_loop")
             for optim_step in range(self.max_optims):
-                optim_out = self.optimizer.step(residual_closure)
+                optim_out = self.optimizer.step(closure)
                 optim_outs.append(optim_out)
             self.time_tracker.stop("inner_loop")
         self.time_tracker.stop("outer_loop")
@@ -450,6 +572,8 @@ class ICPOptimizer(OptimizerFramework):
         optimizer: DifferentiableOptimizer,
         save_interval: int = 1,
         verbose: bool = True,
+        jacobian_mode: str = "closure",  # closure, vertex, reduced
+        sampler: ResidualSampler | None = None,
     ):
         super().__init__()
         # optimizer settings
@@ -458,6 +582,9 @@ class ICPOptimizer(OptimizerFramework):
         self.renderer = renderer
         self.optimizer = optimizer
         self.residuals = residuals
+        assert jacobian_mode in ["closure", "vertex", "reduced"]
+        self.jacobian_mode = jacobian_mode
+        self.sampler = sampler
         # debuging
         self.verbose = verbose
         self.save_interval = save_interval
@@ -475,10 +602,25 @@ class ICPOptimizer(OptimizerFramework):
         coarse2fine = batch["coarse2fine"]
         scheduler = batch["scheduler"]
         step_size = batch["step_size"]
+        # a budget can skip outer iterations, the milestones need to be included
+        iter_steps = batch.get("iter_steps", range(max_iters))
+
+        # skip the rendering and the correspondences if no residual depends on them
+        dense = "dense" in self.residuals.inputs
+
+        # freeze the converged frames of the window, the global params are shared
+        convergence = batch.get("convergence") if dense else None
+        if convergence is not None:
+            params = batch["params"]
+            local_params = [p for p in params if p not in self.flame.global_params]
+            convergence.reset(
+                num_frames=params[local_params[0]].shape[0],
+                local_params=local_params,
+            )
 
         # outer optimization loop
         self.time_tracker.start("outer_loop")
-        for iter_step in range(max_iters):
+        for iter_step in iter_steps:
             self.time_tracker.start("outer_step")
             # prepare logging
             reset_progress(inner_progress, max_optims)
@@ -492,6 +634,13 @@ class ICPOptimizer(OptimizerFramework):
                 iter_step=iter_step,
             )
             batch = datamodule.fetch()
+            if convergence is not None:
+                # thaw the frames at a milestone, e.g. the residuals or params change
+                milestone = coarse2fine.dirty or not scheduler.skip(iter_step)
+                if milestone and convergence.frozen:
+                    params = convergence.merge(self.optimizer.get_params())
+                    self.optimizer.set_params(params)
+                batch = convergence.select_batch(batch)
             self.time_tracker.stop("fetch_data")
 
             # configure the optimizer
@@ -510,20 +659,72 @@ class ICPOptimizer(OptimizerFramework):
             # find correspondences
             self.time_tracker.start("find_correspondences")
             with torch.no_grad():
-                # render the current state of the model
-                out = self.flame.render(
-                    renderer=self.renderer,
-                    params=self.optimizer.get_params(),
-                )
-                # establish correspondences
-                mask, mask_info = self.c_module.mask(
-                    s_mask=batch["mask"],
-                    s_point=batch["point"],
-                    s_normal=batch["normal"],
-                    t_mask=out["mask"],
-                    t_point=out["point"],
-                    t_normal=out["normal"],
-                )
+                if dense:
+                    if self.c_module.rasterize:
+                        # render the current state of the model
+                        out = self.flame.render(
+                            renderer=self.renderer,
+                            params=self.optimizer.get_params(),
+                        )
+                        c_out = dict(
+                            s_point=batch["point"],
+                            s_normal=batch["normal"],
+                            t_point=out["point"],
+                            t_normal=out["normal"],
+                        )
+                        # establish correspondences
+                        mask, mask_info = self.c_module.mask(
+                            s_mask=batch["mask"],
+                            t_mask=out["mask"],
+                            **c_out,
+                        )
+                    else:
+                        # nearest neighbors of the vertices without rasterization
+                        out = self.flame(**self.optimizer.get_params())
+                        faces = self.flame.face_faces
+                        if self.flame.vertices_mask == "full":
+                            faces = self.flame.full_faces
+                        t_normal = area_vertex_normals(out["vertices"], faces)
+                        c_out = self.c_module.predict(
+                            s_mask=batch["mask"],
+                            s_point=batch["point"],
+                            s_normal=batch["normal"],
+                            t_point=out["vertices"],
+                            t_normal=t_normal,
+                            frame_idx=batch["frame_idx"],
+                        )
+                        mask, mask_info = self.c_module.mask(
+                            t_mask=t_normal.norm(dim=-1) > 0,  # vertices of the faces
+                            **c_out,
+                        )
+                    # subsample the correspondences, reused in the inner loop
+                    weights = None
+                    if self.sampler is not None:
+                        mask, s_weights = self.sampler.sample(
+                            mask=mask,
+                            s_point=c_out["s_point"],
+                            s_normal=c_out["s_normal"],
+                            t_point=c_out["t_point"],
+                            t_normal=c_out["t_normal"],
+                        )
+                        weights = s_weights[mask]
+                    # precompute the interpolation of the masked pixels or vertices
+                    if self.c_module.rasterize:
+                        interpolation = self.renderer.interpolation_operator(
+                            vertices_idx=out["vertices_idx"],
+                            bary_coords=out["bary_coords"],
+                            mask=mask,
+                            num_vertices=out["vertices"].shape[1],
+                        )
+                    else:
+                        interpolation = self.renderer.vertex_operator(mask=mask)
+                    # the fixed correspondences of the inner loop
+                    s_point = c_out["s_point"][mask]
+                    s_normal = c_out["s_normal"][mask]
+                    t_normal = c_out["t_normal"][mask]
+                else:  # only sparse terms, e.g. landmarks and regularization
+                    interpolation, weights = None, None
+                    s_point = s_normal = t_normal = batch["point"].new_zeros((0, 3))
             self.time_tracker.stop("find_correspondences")
 
             # setup the residual computation
@@ -532,25 +733,121 @@ class ICPOptimizer(OptimizerFramework):
                 new_params = self.optimizer.residual_params(args)
                 m_out = self.flame(**new_params)
                 # recompute to perform interpolation of the point inside closure
-                t_point = self.renderer.mask_interpolate(
-                    vertices_idx=out["vertices_idx"],
-                    bary_coords=out["bary_coords"],
-                    attributes=m_out["vertices"],
-                    mask=mask,
-                )
+                t_point = None
+                if interpolation is not None:
+                    t_point = interpolation.interpolate(m_out["vertices"])
                 # perform the residuals
                 F, info = self.residuals.step(
-                    s_normal=batch["normal"][mask],
-                    s_point=batch["point"][mask],
+                    s_normal=s_normal,
+                    s_point=s_point,
                     s_landmark=batch["landmark"],
                     s_landmark_mask=batch["landmark_mask"],
-                    t_normal=out["normal"][mask],
+                    t_normal=t_normal,
                     t_point=t_point,
                     t_landmark=m_out["landmark"],
+                    weights=weights,
                     params=new_params,
                 )
                 return F, (F, info)
 
+            def model_closure(*args):
+                new_params = self.optimizer.residual_params(args)
+                return self.flame(**new_params)
+
+            def jacobian_closure(m_jacobian: dict, p_jacobian: dict):
+                # pixel jacobian rows from the per-vertex jacobian
+                t_point_jacobian = None
+                if interpolation is not None:
+                    t_point_jacobian = interpolation.apply(m_jacobian["vertices"])
+                return self.residuals.jacobian_step(
+                    s_normal=s_normal,
+                    t_normal=t_normal,
+                    s_landmark_mask=batch["landmark_mask"],
+                    t_point_jacobian=t_point_jacobian,
+                    t_landmark_jacobian=m_jacobian["landmark"],
+                    weights=weights,
+                    params_jacobian=p_jacobian,
+                )
+
+            forms: dict = {}
+            rest = self.residuals
+            if self.jacobian_mode == "reduced" and interpolation is not None:
+                # collapse the dense terms once per outer iteration into vertex space
+                forms = self.residuals.reduce(
+                    vertices_idx=interpolation.vertices_idx,
+                    bary_coords=interpolation.bary_coords,
+                    num_vertices=interpolation.matrix.shape[1],
+                    s_point=s_point,
+                    t_normal=t_normal,
+                    weights=weights,
+                )
+                rest = self.residuals.split(exclude=list(forms.keys()))
+
+            # the kwargs of the remaining terms, e.g. landmarks and regularization
+            rest_kwargs = dict(
+                s_normal=s_normal,
+                s_point=s_point,
+                t_normal=t_normal,
+                s_landmark=batch["landmark"],
+                s_landmark_mask=batch["landmark_mask"],
+                weights=weights,
+            )
+
+            def rest_closure(params, m_out):
+                return rest.step(
+                    t_point=interpolation.interpolate(m_out["vertices"]),
+                    t_landmark=m_out["landmark"],
+                    params=params,
+                    **rest_kwargs,
+                )
+
+            def system_closure(params, m_out, m_jacobian, p_jacobian):
+                H, grad_f = 0, 0
+                for form in forms.values():
+                    form_H, form_grad_f = form.system(
+                        vertices=m_out["vertices"],
+                        vertices_jacobian=m_jacobian["vertices"],
+                    )
+                    H, grad_f = H + form_H, grad_f + form_grad_f
+                if rest is None:
+                    return H, grad_f
+                F, _ = rest_closure(params, m_out)
+                J = rest.jacobian_step(
+                    t_point_jacobian=interpolation.apply(m_jacobian["vertices"]),
+                    t_landmark_jacobian=m_jacobian["landmark"],
+                    params_jacobian=p_jacobian,
+                    **rest_kwargs,
+                )
+                return H + 2 * J.T @ J, grad_f + 2 * J.T @ F
+
+            def energy_closure(*args):
+                # the energy of the reduced terms without the pixel residuals
+                new_params = self.optimizer.residual_params(args)
+                m_out = self.flame(**new_params)
+                info = {n: form.energy(m_out["vertices"]) for n, form in forms.items()}
+                if rest is not None:
+                    _, rest_info = rest_closure(new_params, m_out)
+                    info.update({k: (r**2).sum() for k, r in rest_info.items()})
+                return sum(info.values()), info
+
+            num_residuals = len(forms) * s_point.shape[0]
+            if forms and rest is not None:
+                with torch.no_grad():
+                    params = self.optimizer.get_params()
+                    F, _ = rest_closure(params, self.flame(**params))
+                num_residuals += F.shape[0]
+
+            closure = residual_closure
+            if self.jacobian_mode in ["vertex", "reduced"]:
+                closure = FactoredClosure(
+                    residual_closure=residual_closure,
+                    model_closure=model_closure,
+                    jacobian_closure=jacobian_closure,
+                    system_closure=system_closure if forms else None,
+                    energy_closure=energy_closure if forms else None,
+                    num_residuals=num_residuals,
+                )
+
             # inner optimization loop
             self.time_tracker.start("inner_loop")
             for optim_step in range(max_optims):
@@ -558,12 +855,12 @@ class ICPOptimizer(OptimizerFramework):
 
                 # optimize step
                 self.time_tracker.start("optimizer_step")
-                self.optimizer.step(residual_closure)
+                self.optimizer.step(closure)
                 self.time_tracker.stop("optimizer_step")
 
                 # metrics and loss logging
                 self.time_tracker.start("inner_logging")
-                loss, info = self.optimizer.loss_step(residual_closure)
+                loss, info = self.optimizer.loss_step(closure)
                 inner_progress.set_postfix({"loss": loss})
                 self.logger.log_loss(loss=loss, info=info)
                 self.logger.log_gradients(optimizer=self.optimizer, verbose=False)
@@ -574,39 +871,57 @@ class ICPOptimizer(OptimizerFramework):
                 self.time_tracker.stop("inner_step")
             self.time_tracker.stop("inner_loop")
 
+            # freeze the frames whose params and dense energy converged
+            if convergence is not None:
+                self.time_tracker.start("frame_convergence")
+                # the residuals of the loss step after the last optimizer step
+                info = self.optimizer.last_residuals
+                residuals = [info[n] for n in self.residuals.dense_names if n in info]
+                energy = None
+                if dense and residuals:
+                    energy = convergence.frame_energy(mask=mask, residuals=residuals)
+                freeze = convergence.update(self.optimizer.get_params(), energy)
+                if freeze:
+                    params = convergence.freeze(self.optimizer.get_params(), freeze)
+                    self.optimizer.set_params(params)
+                outer_progress.set_postfix({"frozen": len(convergence.frozen)})
+                self.time_tracker.stop("frame_convergence")
+
             # progress logging
             self.time_tracker.start("outer_logging")
-            self.logger.log_live(
-                frame_idx=batch["frame_idx"],
-                s_color=batch["color"],
-                t_mask=out["mask"],
-                t_color=out["color"],
-            )
-            if (iter_step % self.save_interval) == 0 and self.verbose:
-                self.logger.log_mask(
-                    frame_idx=batch["frame_idx"],
-                    masks=mask_info,
-                )
-                self.logger.log_error(
-                    frame_idx=batch["frame_idx"],
-                    s_point=batch["point"],
-                    s_normal=batch["normal"],
-                    t_mask=out["mask"],
-                    t_point=out["point"],
-                    t_normal=out["normal"],
-                )
-                self.logger.log_render(
+            if dense and self.c_module.rasterize:  # the images need rasterization
+                self.logger.log_live(
                     frame_idx=batch["frame_idx"],
-                    s_mask=batch["mask"],
-                    s_point=batch["point"],
                     s_color=batch["color"],
                     t_mask=out["mask"],
-                    t_point=out["point"],
                     t_color=out["color"],
-                    t_normal_image=out["normal_image"],
-                    t_depth_image=out["depth_image"],
-                    t_landmark=out["landmark"],
                 )
+            if (iter_step % self.save_interval) == 0 and self.verbose:
+                if dense and self.c_module.rasterize:
+                    self.logger.log_mask(
+                        frame_idx=batch["frame_idx"],
+                        masks=mask_info,
+                    )
+                    self.logger.log_error(
+                        frame_idx=batch["frame_idx"],
+                        s_point=batch["point"],
+                        s_normal=batch["normal"],
+                        t_mask=out["mask"],
+                        t_point=out["point"],
+                        t_normal=out["normal"],
+                    )
+                    self.logger.log_render(
+                        frame_idx=batch["frame_idx"],
+                        s_mask=batch["mask"],
+                        s_point=batch["point"],
+                        s_color=batch["color"],
+                        t_mask=out["mask"],
+                        t_point=out["point"],
+                        t_color=out["color"],
+                        t_normal_image=out["normal_image"],
+                        t_depth_image=out["depth_image"],
+                        t_landmark=out["landmark"],
+                    )
                 self.logger.log_input_batch(
                     frame_idx=batch["frame_idx"],
                     s_mask=batch["mask"],
@@ -622,6 +937,11 @@ class ICPOptimizer(OptimizerFramework):
             self.time_tracker.stop("outer_step")
         self.time_tracker.stop("outer_loop")
 
+        # the params of the full window, with the frozen frames
+        if convergence is not None and convergence.frozen:
+            self.optimizer.set_params(convergence.merge(self.optimizer.get_params()))
+            batch = datamodule.fetch()
+
         # # final state logging
         self.logger.log_tracking(
             params=self.optimizer.get_params(),
@@ -669,11 +989,19 @@ class VertexOptimizer(OptimizerFramework):
 
 
 class LandmarkRigidOptimizer(OptimizerFramework):
+    """Solves the transl and global pose from the landmarks.
+
+    The rigid pose is optionally aligned in closed form with the weighted
+    Kabsch/Umeyama algorithm, the Gauss-Newton iterations refine the pose.
+    """
+
     def __init__(
         self,
         flame: Flame,
         optimizer: DifferentiableOptimizer,
         max_iters: int = 1,
+        closed_form: bool = False,
+        estimate_scale: bool = False,
         **kwargs,
     ):
         super().__init__(**kwargs)
@@ -681,8 +1009,20 @@ class LandmarkRigidOptimizer(OptimizerFramework):
         self.optimizer = optimizer
         self.residuals = LandmarkResiduals()
         self.max_iters = max_iters
+        self.closed_form = closed_form
+        self.estimate_scale = estimate_scale
 
     def forward(self, batch: dict):
+        if self.closed_form:
+            batch["params"] = landmark_rigid_init(
+                flame=self.flame,
+                params=batch["params"],
+                landmark=batch["landmark"],
+                landmark_mask=batch["landmark_mask"],
+                estimate_scale=self.estimate_scale,
+            )
+            if self.max_iters == 0:
+                return dict(params=batch["params"])
         self.optimizer.set_params(batch["params"])
         self.optimizer._p_names = ["transl", "global_pose"]  # type: ignore
 
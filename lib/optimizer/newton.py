@@ -4,7 +4,7 @@ from typing import Callable
 
 import torch
 
-from lib.optimizer.base import DifferentiableOptimizer
+from lib.optimizer.base import DifferentiableOptimizer, FactoredClosure
 from lib.optimizer.solver import LinearSystemSolver
 
 log = logging.getLogger()
@@ -62,6 +62,12 @@ class NewtonOptimizer(DifferentiableOptimizer):
         self.step_count += 1
 
     def apply_jacobian(self, closure: Callable[..., torch.Tensor]):
+        if isinstance(closure, FactoredClosure) and closure.system_closure:
+            # the normal equations are assembled in vertex space, there is no J
+            self.time_tracker.start("system_closure")
+            H, grad_f = self.system_step(closure, strategy=self.strategy)
+            self.time_tracker.stop()
+            return None, None, H, grad_f
         self.time_tracker.start("jacobian_closure")
         J, F = self.jacobian_step(closure, strategy=self.strategy)  # (M, N)
         assert J.shape[1] == self._numel
@@ -215,7 +221,7 @@ class LevenbergMarquardt(NewtonOptimizer):
         # prepare the init delta vectors
         self.time_tracker.start("apply_jacobian")
         J, F, H, grad_f = self.apply_jacobian(closure)
-        M, N = J.shape
+        M = self.residual_tracker[-1]  # the number of residuals
 
         # prepare the init delta vectors
         self.time_tracker.start("clone_param", stop=True)
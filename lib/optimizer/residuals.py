@@ -1,8 +1,74 @@
+from dataclasses import dataclass
+
 import torch
 from torch import nn
 
 
+@dataclass
+class VertexQuadraticForm:
+    """The energy of dense residuals collapsed into vertex space.
+
+    For fixed correspondences, normals and barycentric coordinates the energy of the
+    pixel residuals r_c = a_c^T n_c^T (s_c - [v_c0, v_c1, v_c2]) can be expressed as a
+    quadratic form over the vertices, which is independent of the image resolution:
+
+        E(v) = const - 2 * sum_i h_i^T v_i + sum_ij v_i^T Q_ij v_j
+
+    Attributes:
+        pairs (torch.Tensor): The flat vertex idxs of the vertex pairs (i, j) of dim
+            (P, 2), which share at least one pixel.
+        Q (torch.Tensor): The 3x3 blocks per vertex pair of dim (P, 3, 3).
+        h (torch.Tensor): The linear term per vertex of dim (B*V, 3).
+        const (torch.Tensor): The constant energy term.
+    """
+
+    pairs: torch.Tensor
+    Q: torch.Tensor
+    h: torch.Tensor
+    const: torch.Tensor
+
+    def energy(self, vertices: torch.Tensor):
+        v = vertices.reshape(-1, 3)  # (B*V, 3)
+        Qv = (self.Q @ v[self.pairs[:, 1]].unsqueeze(-1)).squeeze(-1)  # (P, 3)
+        quadratic = (v[self.pairs[:, 0]] * Qv).sum()
+        return self.const - 2 * (self.h * v).sum() + quadratic
+
+    def system(self, vertices: torch.Tensor, vertices_jacobian: torch.Tensor):
+        """Computes the normal equations from the per-vertex jacobian.
+
+        Args:
+            vertices (torch.Tensor): The current vertices of dim (B, V, 3).
+            vertices_jacobian (torch.Tensor): The jacobian of dim (B, V, 3, N).
+
+        Returns:
+            (torch.Tensor, torch.Tensor): The hessian approximation H = 2 * J^T J of
+                dim (N, N) and the gradient grad_f = 2 * J^T F of dim (N,).
+        """
+        v = vertices.reshape(-1, 3)  # (B*V, 3)
+        Jv = vertices_jacobian.reshape(v.shape[0], 3, -1)  # (B*V, 3, N)
+        i, j = self.pairs[:, 0], self.pairs[:, 1]
+
+        # gradient of the energy w.r.t. the vertices dE/dv_i = 2 * (Q_ij v_j - h_i)
+        Qv = (self.Q @ v[j].unsqueeze(-1)).squeeze(-1)  # (P, 3)
+        Qv = torch.zeros_like(v).index_add_(0, i, Qv)  # (B*V, 3)
+        grad_v = 2 * (Qv - self.h)  # (B*V, 3)
+        grad_f = torch.einsum("vk,vkn->n", grad_v, Jv)  # (N,)
+
+        # the hessian approximation H = 2 * sum_ij Jv_i^T Q_ij Jv_j
+        QJ = self.Q @ Jv[j]  # (P, 3, N)
+        N = Jv.shape[-1]
+        H = 2 * Jv[i].reshape(-1, N).T @ QJ.reshape(-1, N)  # (N, N)
+        return H, grad_f
+
+
 class Residuals(nn.Module):
+    # the inputs the residuals depend on, the framework skips the work of the others:
+    #   dense: the image correspondences, e.g. rasterization and correspondences
+    #   landmark: the detected and the flame landmarks
+    #   vertices: the source and the flame vertices
+    #   params: the flame params, e.g. for the regularization
+    requires: tuple[str, ...] = ("dense",)
+
     def __init__(self, weight: float = 1.0):
         super().__init__()
         self.weight = weight
@@ -11,6 +77,15 @@ class Residuals(nn.Module):
     def names(self):
         return [self.name]
 
+    @property
+    def inputs(self) -> set[str]:
+        return set(self.requires)
+
+    @property
+    def dense_names(self) -> list[str]:
+        """The names of the terms with rows per correspondence, e.g. per pixel."""
+        return self.names if "dense" in self.requires else []
+
     def forward(self, **kwargs):
         raise NotImplementedError()
 
@@ -20,6 +95,33 @@ class Residuals(nn.Module):
         info = {n: r for n, r in zip(self.names, residuals)}
         return F.reshape(-1), info  # (C,)
 
+    def jacobian(self, **kwargs):
+        """The analytic jacobian blocks of the residuals, same order as forward.
+
+        The derivatives are formed with the chain rule from the jacobians of the
+        model outputs, which are passed as kwargs:
+            t_point_jacobian: The jacobian of the interpolated points (C, 3, N)
+            t_landmark_jacobian: The jacobian of the landmarks (B, L, 3, N)
+            t_vertices_jacobian: The jacobian of the vertices (B, V, 3, N)
+            params_jacobian: The jacobian per flame param of dim (numel, N)
+        """
+        raise NotImplementedError()
+
+    def jacobian_step(self, **kwargs):
+        jacobians = self.jacobian(**kwargs)
+        J = torch.cat([j.reshape(-1, j.shape[-1]) for j in jacobians])
+        return J  # (C, N)
+
+    def reduce(self, **kwargs) -> dict[str, VertexQuadraticForm]:
+        """Collapses the residuals into vertex space, if the term supports it."""
+        return {}
+
+    def split(self, exclude: list[str] = []):
+        """Returns the residuals without the excluded terms or None if empty."""
+        if self.name in exclude:
+            return None
+        return self
+
 
 ####################################################################################
 # ChainedLoss
@@ -35,18 +137,45 @@ class ChainedResiduals(Residuals):
     def names(self):
         return [f.name for f in self.chain.values()]
 
+    @property
+    def inputs(self) -> set[str]:
+        return set().union(*[f.inputs for f in self.chain.values()])
+
+    @property
+    def dense_names(self) -> list[str]:
+        return [n for f in self.chain.values() for n in f.dense_names]
+
     def forward(self, **kwargs):
         residuals = []
         for f in self.chain.values():
             residuals.extend(f(**kwargs))
         return residuals
 
+    def jacobian(self, **kwargs):
+        jacobians = []
+        for f in self.chain.values():
+            jacobians.extend(f.jacobian(**kwargs))
+        return jacobians
+
+    def reduce(self, **kwargs):
+        forms = {}
+        for f in self.chain.values():
+            forms.update(f.reduce(**kwargs))
+        return forms
+
+    def split(self, exclude: list[str] = []):
+        chain = {k: f for k, f in self.chain.items() if f.name not in exclude}
+        if not chain:
+            return None
+        return ChainedResiduals(chain=chain)
+
 
 ####################################################################################
 # Dense Loss Terms
 ####################################################################################
 class Point2PlaneResiduals(Residuals):
     name: str = "point2plane"
+    requires = ("dense",)
 
     def forward(self, **kwargs):
         s_point = kwargs["s_point"]
@@ -58,9 +187,65 @@ class Point2PlaneResiduals(Residuals):
             return [self.weight * residuals * weights]
         return [self.weight * residuals]
 
+    def jacobian(self, **kwargs):
+        t_point_jacobian = kwargs["t_point_jacobian"]  # (C, 3, N)
+        t_normal = kwargs["t_normal"]  # the normals are fixed in the inner loop
+        weights = kwargs.get("weights")
+        jacobian = -(t_normal.unsqueeze(-1) * t_point_jacobian).sum(-2)  # (C, N)
+        if weights is not None:
+            return [self.weight * jacobian * weights.unsqueeze(-1)]
+        return [self.weight * jacobian]
+
+    def reduce(self, **kwargs):
+        """Pre-aggregates the pixel rows into per-vertex-pair 3x3 blocks.
+
+        Args:
+            vertices_idx (torch.Tensor): The flat vertex idxs per pixel (C, 3).
+            bary_coords (torch.Tensor): The barycentric coordinates per pixel (C, 3).
+            num_vertices (int): The number of flat vertices, e.g. B*V.
+            s_point (torch.Tensor): The source points of dim (C, 3).
+            t_normal (torch.Tensor): The fixed target normals of dim (C, 3).
+            weights (torch.Tensor | None): The per pixel weights of dim (C,).
+        """
+        vertices_idx = kwargs["vertices_idx"]  # (C, 3)
+        bary_coords = kwargs["bary_coords"]  # (C, 3)
+        num_vertices = kwargs["num_vertices"]
+        s_point = kwargs["s_point"]
+        t_normal = kwargs["t_normal"]
+        weights = kwargs.get("weights")
+        C = vertices_idx.shape[0]
+
+        w = torch.full((C,), self.weight, device=s_point.device)
+        if weights is not None:
+            w = w * weights
+        a = w.unsqueeze(-1) * bary_coords  # (C, 3)
+
+        # the 3x3 blocks a_ci * a_cj * n_c n_c^T for every vertex pair of a pixel
+        i = vertices_idx.unsqueeze(-1).expand(C, 3, 3).reshape(-1)  # (9C,)
+        j = vertices_idx.unsqueeze(-2).expand(C, 3, 3).reshape(-1)  # (9C,)
+        coeff = (a.unsqueeze(-1) * a.unsqueeze(-2)).reshape(C, 9)  # (C, 9)
+        nnT = t_normal.unsqueeze(-1) * t_normal.unsqueeze(-2)  # (C, 3, 3)
+        blocks = coeff[..., None, None] * nnT.unsqueeze(1)  # (C, 9, 3, 3)
+
+        # accumulate the blocks of the same vertex pair
+        keys, inverse = torch.unique(i * num_vertices + j, return_inverse=True)
+        Q = blocks.new_zeros(keys.shape[0], 3, 3)
+        Q = Q.index_add(0, inverse, blocks.reshape(-1, 3, 3))  # (P, 3, 3)
+        pairs = torch.stack([keys // num_vertices, keys % num_vertices], dim=-1)
+
+        # the linear term h_i = sum_c a_ci * n_c * (w_c * n_c^T s_c)
+        ns = w * (t_normal * s_point).sum(-1)  # (C,)
+        h_c = a.unsqueeze(-1) * (ns.unsqueeze(-1) * t_normal).unsqueeze(1)  # (C,3,3)
+        h = h_c.new_zeros(num_vertices, 3)
+        h = h.index_add(0, vertices_idx.reshape(-1), h_c.reshape(-1, 3))
+
+        form = VertexQuadraticForm(pairs=pairs, Q=Q, h=h, const=(ns**2).sum())
+        return {self.name: form}
+
 
 class Point2PointResiduals(Residuals):
     name: str = "point2point"
+    requires = ("dense",)
 
     def forward(self, **kwargs):
         s_point = kwargs["s_point"]
@@ -71,9 +256,18 @@ class Point2PointResiduals(Residuals):
             return [self.weight * residuals * weights]
         return [self.weight * residuals]
 
+    def jacobian(self, **kwargs):
+        t_point_jacobian = kwargs["t_point_jacobian"]  # (C, 3, N)
+        weights = kwargs.get("weights")
+        if weights is not None:
+            weights = weights.reshape(-1, *([1] * (t_point_jacobian.dim() - 1)))
+            return [-self.weight * t_point_jacobian * weights]
+        return [-self.weight * t_point_jacobian]
+
 
 class SymmetricICPResiduals(Residuals):
     name: str = "symmetricICP"
+    requires = ("dense",)
 
     def forward(self, **kwargs):
         s_point = kwargs["s_point"]
@@ -86,6 +280,15 @@ class SymmetricICPResiduals(Residuals):
             return [self.weight * residuals * weights]
         return [self.weight * residuals]
 
+    def jacobian(self, **kwargs):
+        t_point_jacobian = kwargs["t_point_jacobian"]  # (C, 3, N)
+        normal = kwargs["s_normal"] + kwargs["t_normal"]  # (C, 3)
+        weights = kwargs.get("weights")
+        jacobian = -(normal.unsqueeze(-1) * t_point_jacobian).sum(-2)  # (C, N)
+        if weights is not None:
+            return [self.weight * jacobian * weights.unsqueeze(-1)]
+        return [self.weight * jacobian]
+
 
 ####################################################################################
 # Regularization Loss Terms
@@ -93,6 +296,8 @@ class SymmetricICPResiduals(Residuals):
 
 
 class RegularizationResiduals(Residuals):
+    requires = ("params",)
+
     def __init__(self, name: str, weight: float = 1.0):
         super().__init__()
         self.weight = weight
@@ -102,11 +307,17 @@ class RegularizationResiduals(Residuals):
         params = kwargs["params"][self.name]
         if params is not None:
             return [self.weight * params.view(-1)]
-        device = kwargs["s_point"].device
+        device = kwargs["t_landmark"].device  # the dense inputs might be skipped
         return [torch.tensor([], device=device)]
 
+    def jacobian(self, **kwargs):
+        params_jacobian = kwargs["params_jacobian"][self.name]  # (numel, N)
+        return [self.weight * params_jacobian]
+
 
 class NeuralRegularizationResiduals(Residuals):
+    requires = ("params",)
+
     def __init__(self, name: str, weight: float = 1.0):
         super().__init__()
         self.weight = weight
@@ -119,6 +330,11 @@ class NeuralRegularizationResiduals(Residuals):
         residuals = (params - reg_priors).view(-1)
         return [self.weight * residuals * reg_weights.view(-1)]
 
+    def jacobian(self, **kwargs):
+        params_jacobian = kwargs["params_jacobian"][self.name]  # (numel, N)
+        reg_weights = kwargs["reg_weights"][self.name]
+        return [self.weight * params_jacobian * reg_weights.view(-1, 1)]
+
 
 ####################################################################################
 # Sparse Keypoints
@@ -127,6 +343,7 @@ class NeuralRegularizationResiduals(Residuals):
 
 class LandmarkResiduals(Residuals):
     name: str = "landmark"
+    requires = ("landmark",)
 
     def forward(self, **kwargs):
         mask = kwargs["s_landmark_mask"]
@@ -135,6 +352,11 @@ class LandmarkResiduals(Residuals):
         residuals = (s_landmark[mask] - t_landmark[mask]).flatten()
         return [self.weight * residuals]
 
+    def jacobian(self, **kwargs):
+        mask = kwargs["s_landmark_mask"]
+        t_landmark_jacobian = kwargs["t_landmark_jacobian"]  # (B, L, 3, N)
+        return [-self.weight * t_landmark_jacobian[mask]]  # (K, 3, N)
+
 
 ####################################################################################
 # Direct Correspondences
@@ -143,12 +365,17 @@ class LandmarkResiduals(Residuals):
 
 class VertexResiduals(Residuals):
     name: str = "vertex"
+    requires = ("vertices",)
 
     def forward(self, **kwargs):
         t_vertices = kwargs["t_vertices"]
         s_vertices = kwargs["s_vertices"]
         return [self.weight * (t_vertices - s_vertices)]
 
+    def jacobian(self, **kwargs):
+        t_vertices_jacobian = kwargs["t_vertices_jacobian"]  # (B, V, 3, N)
+        return [self.weight * t_vertices_jacobian]
+
 
 ####################################################################################
 # Deep Features
@@ -157,6 +384,7 @@ class VertexResiduals(Residuals):
 
 class FeatureResiduals(Residuals):
     name: str = "feature"
+    requires = ("dense",)
 
     def forward(self, **kwargs):
         t_vertices = kwargs["t_feature"]
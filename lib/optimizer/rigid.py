@@ -0,0 +1,122 @@
+import torch
+
+from lib.model.flame.flame import Flame
+from lib.model.flame.lbs import matrix_to_axis_angle
+
+
+def weighted_umeyama(
+    source: torch.Tensor,
+    target: torch.Tensor,
+    weights: torch.Tensor,
+    estimate_scale: bool = False,
+):
+    """The weighted similarity transform that aligns the source to the target.
+
+    Solves min sum_i w_i |target_i - (s R source_i + t)|^2 in closed form, with the
+    reflection correction of Umeyama, if the scale is not estimated this is the
+    weighted Kabsch algorithm.
+
+    Args:
+        source: The source points of dim (B, N, 3).
+        target: The target points of dim (B, N, 3).
+        weights: The weights of the correspondences (B, N), e.g. the mask.
+        estimate_scale: Whether the scale is estimated or fixed to 1.
+
+    Returns:
+        (tuple): The rotation (B, 3, 3), the translation (B, 3) and the scale (B,).
+    """
+    weights = weights.to(source.dtype)
+    w = weights / weights.sum(-1, keepdim=True).clamp(min=1e-8)  # (B, N)
+    source_mean = (w[..., None] * source).sum(1)  # (B, 3)
+    target_mean = (w[..., None] * target).sum(1)  # (B, 3)
+    source_c = source - source_mean[:, None]
+    target_c = target - target_mean[:, None]
+
+    # the weighted cross covariance of the centered points
+    cov = torch.einsum("bn,bni,bnj->bij", w, target_c, source_c)  # (B, 3, 3)
+    U, S, Vh = torch.linalg.svd(cov)
+    d = torch.sign(torch.linalg.det(U) * torch.linalg.det(Vh))
+    D = torch.ones_like(S)
+    D[:, -1] = torch.where(d == 0, torch.ones_like(d), d)
+    R = U @ torch.diag_embed(D) @ Vh  # (B, 3, 3)
+
+    scale = torch.ones_like(S[:, 0])
+    if estimate_scale:
+        var = (w * source_c.pow(2).sum(-1)).sum(-1)  # (B,)
+        scale = (S * D).sum(-1) / var.clamp(min=1e-8)
+    transl = target_mean - scale[:, None] * (R @ source_mean[..., None])[..., 0]
+    return R, transl, scale
+
+
+def landmark_rigid_init(
+    flame: Flame,
+    params: dict,
+    landmark: torch.Tensor,
+    landmark_mask: torch.Tensor,
+    estimate_scale: bool = False,
+    min_landmarks: int = 3,
+):
+    """Initializes the global pose and translation of flame from the landmarks.
+
+    The landmarks of flame without the rigid transformation are aligned to the
+    detected landmarks with the weighted Kabsch/Umeyama algorithm. The global pose
+    rotates the vertices around the root joint and the scale is applied after the
+    translation, e.g. s * (R (x - j) + j + t), hence the translation is recovered
+    from the similarity transform with the root joint of the shaped mesh.
+
+    Args:
+        flame: The flame model.
+        params: The params of the window, the local params are of dim (B, D).
+        landmark: The detected landmarks in camera space (B, L, 3).
+        landmark_mask: The valid landmarks (B, L).
+        estimate_scale: Whether the flame scale is estimated, the scale is shared
+            over the window, hence the mean of the frames is used, otherwise the
+            scale of the params is kept.
+        min_landmarks: The frames with less valid landmarks keep their params.
+
+    Returns:
+        (dict): The params with the updated global_pose, transl and scale.
+    """
+    rigid_params = dict(params)
+    zeros = torch.zeros_like(params["transl"])  # (B, 3)
+    rigid_params["global_pose"] = zeros
+    rigid_params["transl"] = zeros
+    rigid_params["scale"] = torch.ones_like(params["scale"])
+    with torch.no_grad():
+        source = flame(**rigid_params)["landmark"]  # (B, L, 3)
+        # the root joint of the shaped mesh, without any pose
+        shaped_params = {k: torch.zeros_like(v) for k, v in rigid_params.items()}
+        shaped_params["shape_params"] = params["shape_params"]
+        shaped_params["expression_params"] = params["expression_params"]
+        shaped_params["scale"] = rigid_params["scale"]
+        vertices = flame(**shaped_params)["vertices"]  # (B, V, 3)
+        root = torch.einsum("v,bvi->bi", flame.J_regressor[0], vertices)  # (B, 3)
+
+        R, t, scale = weighted_umeyama(
+            source=source - root[:, None],
+            target=landmark,
+            weights=landmark_mask,
+            estimate_scale=estimate_scale,
+        )
+    valid = landmark_mask.sum(-1) >= min_landmarks  # (B,)
+    if not valid.any():
+        return params
+    if estimate_scale:  # the scale is a global param, shared over the window
+        s = scale[valid].mean()
+    else:  # the scale of the window is kept
+        s = params["scale"].detach().reshape(-1)[0].to(landmark.dtype)
+    # the translation of the similarity transform with the shared scale
+    w = landmark_mask.to(landmark.dtype)
+    w = w / w.sum(-1, keepdim=True).clamp(min=1)
+    aligned = s * torch.einsum("bij,bnj->bni", R, source - root[:, None])
+    t = (w[..., None] * (landmark - aligned)).sum(1)  # (B, 3)
+
+    # s (R (x - j) + j + transl) = s R (x - j) + t, hence transl = t / s - j
+    out = dict(params)
+    global_pose = matrix_to_axis_angle(R)  # (B, 3)
+    transl = t / s - root
+    out["global_pose"] = torch.where(valid[:, None], global_pose, params["global_pose"])
+    out["transl"] = torch.where(valid[:, None], transl, params["transl"])
+    if estimate_scale:
+        out["scale"] = torch.full_like(params["scale"], s.item())
+    return out
@@ -1,6 +1,12 @@
 from lib.rasterizer import Fragments, Rasterizer
 
 from .camera import Camera
-from .renderer import Renderer
+from .renderer import InterpolationOperator, Renderer
 
-__all__ = ["Camera", "Renderer", "Fragments", "Rasterizer"]
+__all__ = [
+    "Camera",
+    "Renderer",
+    "InterpolationOperator",
+    "Fragments",
+    "Rasterizer",
+]
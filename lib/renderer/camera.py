@@ -239,18 +239,27 @@ class Camera:
         b_mask = v2.functional.resize((depth == 0).unsqueeze(0), size=size).squeeze(0)
         depth = v2.functional.resize(depth.unsqueeze(0), size=size).squeeze(0)
 
+        p_camera = self.unproject_depth_map(depth)
+
+        p_camera[b_mask, :] = 0.0
+        mask = ~b_mask
+
+        return p_camera, mask
+
+    def unproject_depth_map(self, depth: torch.Tensor):
+        """Unprojects a positive depth map of the current resolution (..., H, W).
+
+        Returns:
+            (torch.Tensor): The points in camera coordinates of dim (..., H, W, 3).
+        """
         depth_camera = -depth.unsqueeze(-1).to(self.device)
         x_ndc = torch.linspace(-1, 1, steps=self.width, device=self.device)
         y_ndc = torch.linspace(1, -1, steps=self.height, device=self.device)
         y_grid, x_grid = torch.meshgrid(y_ndc, x_ndc, indexing="ij")
         xy_ndc = torch.stack([x_grid, y_grid], dim=-1)
+        xy_ndc = xy_ndc.expand(*depth_camera.shape[:-1], 2)
         xy_depth = torch.concatenate([xy_ndc, depth_camera], dim=-1)
-        p_camera = self.unproject_points(xy_depth=xy_depth)
-
-        p_camera[b_mask, :] = 0.0
-        mask = ~b_mask
-
-        return p_camera, mask
+        return self.unproject_points(xy_depth=xy_depth)
 
     def to(self, device: str = "cuda"):
         self.projection_matrix = self.projection_matrix.to(device)
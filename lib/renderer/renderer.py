@@ -1,3 +1,5 @@
+from dataclasses import dataclass
+
 import torch
 
 from lib.rasterizer import Fragments, Rasterizer
@@ -6,6 +8,50 @@ from lib.tracker.timer import TimeTracker
 from lib.utils.mesh import vertex_normals
 
 
+@dataclass
+class InterpolationOperator:
+    """Precomputed barycentric interpolation of the masked pixels.
+
+    The operator is build once per correspondence pass and can be reused for every
+    closure evaluation of the inner optimization loop, because the pixel to vertex
+    assignment and the barycentric coordinates do not change within that loop.
+
+    Attributes:
+        vertices_idx (torch.Tensor): The flat vertex idxs of the pixels of dim (C, 3),
+            already offset by the batch, e.g. the idxs are between 0..B*V-1.
+        bary_coords (torch.Tensor): The barycentric coordinates of dim (C, 3).
+        matrix (torch.Tensor): The sparse CSR matrix of dim (C, B*V) which stores
+            the barycentric weights per pixel row.
+    """
+
+    vertices_idx: torch.Tensor
+    bary_coords: torch.Tensor
+    matrix: torch.Tensor
+
+    def interpolate(self, attributes: torch.Tensor):
+        """Interpolates the vertex attributes of dim (B, V, D) to dim (C, D).
+
+        This uses the precomputed gather idxs, which is compatible with the functional
+        transforms of the jacobian computation, e.g. jacfwd and jacrev.
+        """
+        D = attributes.shape[-1]
+        vertex_attribute = attributes.reshape(-1, D)[self.vertices_idx]  # (C, 3, D)
+        return (self.bary_coords.unsqueeze(-1) * vertex_attribute).sum(-2)  # (C, D)
+
+    def apply(self, attributes: torch.Tensor):
+        """Interpolates the vertex attributes of dim (B, V, ...) with one sparse matmul.
+
+        Every trailing dimension is interpolated, hence this can also be used to
+        propagate the per-vertex jacobian of dim (B, V, 3, N) to the pixel jacobian of
+        dim (C, 3, N).
+        """
+        B, V = attributes.shape[:2]
+        shape = attributes.shape[2:]
+        flat_attributes = attributes.reshape(B * V, -1)  # (B*V, D')
+        out = self.matrix @ flat_attributes  # (C, D')
+        return out.reshape(-1, *shape)
+
+
 class Renderer:
     def __init__(
         self,
@@ -105,6 +151,79 @@ class Renderer:
         attributes = (bary_coords * vertex_attribute).sum(-2)  # (B, H, W, D)
         return attributes
 
+    def interpolation_operator(
+        self,
+        vertices_idx: torch.Tensor,  # (B, H, W, 3)
+        bary_coords: torch.Tensor,  # (B, H, W, 3)
+        mask: torch.Tensor,  # (B, H, W)
+        num_vertices: int,
+    ) -> InterpolationOperator:
+        """Builds the sparse barycentric interpolation operator for the masked pixels.
+
+        Args:
+            vertices_idx (torch.Tensor): The vertex idxs per pixel of dim (B, H, W, 3).
+            bary_coords (torch.Tensor): The barycentric coords per pixel (B, H, W, 3).
+            mask (torch.Tensor): The correspondence mask of dim (B, H, W).
+            num_vertices (int): The number of vertices V of the mesh.
+
+        Returns:
+            (InterpolationOperator): The operator with the C x B*V CSR matrix.
+        """
+        B = vertices_idx.shape[0]
+        vertices_offset = num_vertices * torch.arange(B, device=vertices_idx.device)
+        v_idx = vertices_idx + vertices_offset.view(B, 1, 1, 1)  # (B, H, W, 3)
+        v_idx = v_idx[mask]  # (C, 3)
+        b_coords = bary_coords[mask]  # (C, 3)
+
+        # the column idxs of a CSR matrix need to be sorted in each row
+        v_idx, order = v_idx.sort(dim=-1)
+        b_coords = b_coords.gather(-1, order)
+
+        C = v_idx.shape[0]
+        crow_indices = torch.arange(0, 3 * C + 1, 3, device=v_idx.device)
+        matrix = torch.sparse_csr_tensor(
+            crow_indices=crow_indices,
+            col_indices=v_idx.reshape(-1),
+            values=b_coords.reshape(-1),
+            size=(C, B * num_vertices),
+        )
+        return InterpolationOperator(
+            vertices_idx=v_idx,
+            bary_coords=b_coords,
+            matrix=matrix,
+        )
+
+    def vertex_operator(self, mask: torch.Tensor) -> InterpolationOperator:
+        """Builds the operator that selects the masked vertices, e.g. without raster.
+
+        Args:
+            mask (torch.Tensor): The correspondence mask of the vertices of dim (B, V).
+
+        Returns:
+            (InterpolationOperator): The operator with the C x B*V selection matrix.
+        """
+        B, V = mask.shape
+        idx = torch.nonzero(mask.reshape(-1)).squeeze(-1)  # (C,)
+        C = idx.shape[0]
+
+        # every row selects one vertex, the barycentric coordinates are (1, 0, 0)
+        v_idx = idx.unsqueeze(-1).expand(C, 3)  # (C, 3)
+        b_coords = torch.zeros((C, 3), device=mask.device)
+        b_coords[:, 0] = 1.0
+
+        crow_indices = torch.arange(0, C + 1, device=mask.device)
+        matrix = torch.sparse_csr_tensor(
+            crow_indices=crow_indices,
+            col_indices=idx,
+            values=torch.ones(C, device=mask.device),
+            size=(C, B * V),
+        )
+        return InterpolationOperator(
+            vertices_idx=v_idx,
+            bary_coords=b_coords,
+            matrix=matrix,
+        )
+
     def render(
         self,
         vertices: torch.Tensor,
@@ -0,0 +1,183 @@
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+from prettytable import PrettyTable
+
+from lib.tracker.scheduler import CoarseToFineScheduler
+from lib.tracker.timer import TimeTracker
+
+log = logging.getLogger()
+
+
+@dataclass
+class BudgetPlan:
+    scale: int
+    max_iters: int
+    max_optims: int
+
+    def coarse2fine(self):
+        return CoarseToFineScheduler(milestones=[0], scales=[self.scale])
+
+
+class BudgetController:
+    """Chooses the scale and the iterations of a frame to meet a time budget.
+
+    The cost of a frame is modeled as overhead + iters * (outer + optims * inner),
+    where the outer cost, e.g. the rendering and the correspondences, and the inner
+    cost, e.g. one optimizer step, are measured per scale from the `TimeTracker` of
+    the optimizer and smoothed with an exponential moving average. The scales that
+    are not measured yet are extrapolated with the number of pixels. The plan is the
+    finest scale that fits at least `min_iters` outer iterations, with as many
+    steps as fit into the remaining budget, preferring the outer iterations.
+
+    Args:
+        budget_ms: The time budget per frame in ms, e.g. 47 for 21 fps.
+        scales: The candidate scales, they need to be preprocessed.
+        min_iters: The min number of outer iterations at the chosen scale.
+        max_iters: The max number of outer iterations.
+        max_optims: The max number of inner steps per outer iteration.
+        margin: The fraction of the budget that is planned, to absorb the jitter.
+        momentum: The weight of the previous measurement in the moving average.
+    """
+
+    def __init__(
+        self,
+        budget_ms: float = 47.0,
+        scales: list[int] = [8, 4, 2],
+        min_iters: int = 1,
+        max_iters: int = 5,
+        max_optims: int = 3,
+        margin: float = 0.9,
+        momentum: float = 0.7,
+    ):
+        self.budget_ms = budget_ms
+        self.scales = sorted(scales, reverse=True)  # coarse to fine
+        self.min_iters = min_iters
+        self.max_iters = max_iters
+        self.max_optims = max_optims
+        self.margin = margin
+        self.momentum = momentum
+        self.outer_ms: dict[int, float] = {}
+        self.inner_ms: dict[int, float] = {}
+        self.overhead_ms = 0.0
+        self.frames: list[dict] = []
+
+    @property
+    def misses(self):
+        return sum(f["miss"] for f in self.frames)
+
+    def smooth(self, previous: float | None, value: float):
+        if previous is None:
+            return value
+        return self.momentum * previous + (1 - self.momentum) * value
+
+    def cost(self, scale: int):
+        """The estimated outer and inner cost in ms at the scale."""
+        if scale in self.outer_ms:
+            return self.outer_ms[scale], self.inner_ms[scale]
+        if not self.outer_ms:
+            return None
+        # extrapolate from the nearest measured scale with the number of pixels
+        measured = min(self.outer_ms, key=lambda s: abs(np.log(s / scale)))
+        ratio = (measured / scale) ** 2
+        return self.outer_ms[measured] * ratio, self.inner_ms[measured] * ratio
+
+    def plan(self):
+        """The plan of the next frame within the budget."""
+        plan = BudgetPlan(self.scales[0], self.min_iters, 1)  # warm up, or no fit
+        available = self.budget_ms * self.margin - self.overhead_ms
+        best_key = None
+        for scale in self.scales:
+            cost = self.cost(scale)
+            if cost is None:
+                break
+            outer_ms, inner_ms = cost
+            for iters in range(self.min_iters, self.max_iters + 1):
+                for optims in range(1, self.max_optims + 1):
+                    if iters * (outer_ms + optims * inner_ms) > available:
+                        continue
+                    key = (-scale, iters * optims, iters)
+                    if best_key is None or key > best_key:
+                        best_key = key
+                        plan = BudgetPlan(scale, iters, optims)
+        return plan
+
+    def update(
+        self,
+        plan: BudgetPlan,
+        frame_ms: float,
+        time_tracker: TimeTracker | None = None,
+        frame_idx: int | None = None,
+    ):
+        """Updates the cost model with the measurements of the tracked frame."""
+        steps = plan.max_iters * plan.max_optims
+        tracks = time_tracker.tracks if time_tracker is not None else {}
+        outer_steps = tracks.get("outer_step", [])[-plan.max_iters :]
+        inner_steps = tracks.get("inner_step", [])[-steps:]
+        if outer_steps and inner_steps:
+            inner_ms = float(np.mean([t.time_ms for t in inner_steps]))
+            outer_total = sum(t.time_ms for t in outer_steps)
+            outer_ms = outer_total / len(outer_steps) - plan.max_optims * inner_ms
+            overhead_ms = frame_ms - outer_total
+        else:  # without the measurements of the optimizer steps
+            inner_ms, overhead_ms = 0.0, 0.0
+            outer_ms = frame_ms / plan.max_iters
+        scale = plan.scale
+        self.inner_ms[scale] = self.smooth(self.inner_ms.get(scale), inner_ms)
+        outer_ms = self.smooth(self.outer_ms.get(scale), max(outer_ms, 0.0))
+        self.outer_ms[scale] = outer_ms
+        self.overhead_ms = self.smooth(self.overhead_ms or None, max(overhead_ms, 0))
+
+        miss = frame_ms > self.budget_ms
+        if miss:
+            log.warning(
+                f"Deadline miss: frame {frame_idx} took {frame_ms:.1f}ms "
+                f"(budget {self.budget_ms:.1f}ms, scale={plan.scale}, "
+                f"iters={plan.max_iters}, optims={plan.max_optims})"
+            )
+        self.frames.append(
+            dict(
+                frame_idx=frame_idx,
+                frame_ms=frame_ms,
+                miss=miss,
+                scale=plan.scale,
+                max_iters=plan.max_iters,
+                max_optims=plan.max_optims,
+            )
+        )
+
+    def print_summary(self):
+        if not self.frames:
+            return ""
+        frame_ms = np.array([f["frame_ms"] for f in self.frames])
+        scales = [f["scale"] for f in self.frames]
+        table = PrettyTable()
+        table.field_names = [
+            "budget_ms",
+            "frames",
+            "misses",
+            "miss_rate",
+            "mean_ms",
+            "p95_ms",
+            "scales",
+            "mean_iters",
+            "mean_optims",
+        ]
+        table.align = "r"
+        table.add_row(
+            [
+                self.budget_ms,
+                len(self.frames),
+                self.misses,
+                f"{self.misses / len(self.frames) * 100:.1f}%",
+                frame_ms.mean().round(3),
+                np.percentile(frame_ms, 95).round(3),
+                " ".join(f"{s}:{scales.count(s)}" for s in self.scales),
+                np.mean([f["max_iters"] for f in self.frames]).round(2),
+                np.mean([f["max_optims"] for f in self.frames]).round(2),
+            ]
+        )
+        table_text = "\n" + table.get_string()
+        log.info(table_text)
+        return table_text
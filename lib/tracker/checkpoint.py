@@ -0,0 +1,98 @@
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import torch
+
+from lib.optimizer.base import DifferentiableOptimizer
+
+log = logging.getLogger()
+
+
+def optimizer_state(optimizer: DifferentiableOptimizer):
+    """The state of the optimizer that is carried over to the next window.
+
+    Only the named state is stored, e.g. the damping factor of Levenberg-Marquardt,
+    the state of the pytorch optimizers is keyed by the param tensors and is rebuilt
+    for every window anyway.
+    """
+    try:
+        state = optimizer.get_state()
+    except NotImplementedError:
+        return {}
+    if not isinstance(state, dict) or not all(isinstance(k, str) for k in state):
+        return {}
+    return dict(state)
+
+
+class TrajectoryStore:
+    """Persists the tracked windows of each tracker stage incrementally on disk.
+
+    Every window is written to its own file, e.g. <root_dir>/<stage>/000042.pt, with
+    the params, the frame idxs, the optimizer and scheduler state and the iteration
+    stats. The files are written to a temporary file first and renamed, hence a
+    killed run leaves only completed windows behind. With `resume` the trackers
+    continue after the last completed window of their stage, otherwise the stored
+    windows of the stage are removed when the stage starts.
+
+    Args:
+        root_dir: The directory of the trajectory, which needs to be the same for the
+            runs of an experiment and sequence, e.g. not in the output dir of a run.
+        resume: Whether the stored windows are reused.
+    """
+
+    def __init__(self, root_dir: str, resume: bool = False):
+        self.root_dir = Path(root_dir)
+        self.resume = resume
+        self.num_windows: dict[str, int] = {}  # the stored windows per stage
+
+    def stage_dir(self, stage: str):
+        return self.root_dir / stage
+
+    def paths(self, stage: str):
+        return sorted(self.stage_dir(stage).glob("*.pt"))
+
+    def start(self, stage: str, device: str | torch.device = "cpu"):
+        """The completed windows of the stage, which are skipped by the tracker."""
+        stage_dir = self.stage_dir(stage)
+        if not self.resume:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+        stage_dir.mkdir(parents=True, exist_ok=True)
+        if not self.resume:
+            self.num_windows[stage] = 0
+            return []
+        windows = [torch.load(p, map_location=device) for p in self.paths(stage)]
+        self.num_windows[stage] = len(windows)
+        if windows:
+            log.info(f"Resume {stage} tracking after {len(windows)} windows.")
+        return windows
+
+    def truncate(self, stage: str, num_windows: int):
+        """Removes the windows after the first `num_windows`, e.g. after a mismatch."""
+        for path in self.paths(stage)[num_windows:]:
+            path.unlink()
+        self.num_windows[stage] = min(self.num_windows.get(stage, 0), num_windows)
+
+    def append(
+        self,
+        stage: str,
+        params: dict,
+        frame_idx: list[int],
+        state: dict = {},
+        stats: dict = {},
+    ):
+        """Writes the tracked window after the stored windows of the stage."""
+        assert stage in self.num_windows, "The stage needs to be started first."
+        stage_dir = self.stage_dir(stage)
+        window = dict(
+            params={k: v.detach().cpu() for k, v in params.items()},
+            frame_idx=list(frame_idx),
+            state=state,
+            stats=stats,
+        )
+        path = stage_dir / f"{self.num_windows[stage]:06}.pt"
+        tmp_path = path.with_suffix(".tmp")
+        torch.save(window, tmp_path)
+        os.replace(tmp_path, path)
+        self.num_windows[stage] += 1
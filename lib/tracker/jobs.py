@@ -0,0 +1,274 @@
+import copy
+import json
+import logging
+import queue
+import shutil
+import time
+import traceback
+from pathlib import Path
+
+import hydra
+import torch
+import torch.multiprocessing as mp
+import wandb
+from omegaconf import DictConfig, OmegaConf
+from prettytable import PrettyTable
+from tqdm import tqdm
+
+from lib.model import Flame
+from lib.renderer import Renderer
+from lib.tracker.pipeline import build_pipeline
+from lib.tracker.segment import SegmentParallelTracker
+
+log = logging.getLogger()
+
+
+def track_sequence(
+    cfg: DictConfig,
+    renderer: Renderer | None = None,
+    flame: Flame | None = None,
+):
+    """Runs the init, joint, sequential tracking and the evaluation of a sequence.
+
+    Returns:
+        (dict): The renderer and flame, which can be reused for the next sequence,
+            and the params of the sequential tracking.
+    """
+    pipeline = build_pipeline(cfg, renderer=renderer, flame=flame)
+    renderer = pipeline["renderer"]
+    flame = pipeline["flame"]
+    logger = pipeline["logger"]
+    datamodule = pipeline["datamodule"]
+    framework = pipeline["framework"]
+    data_dir = Path(cfg.data.data_dir) / cfg.data.dataset_name
+
+    # the tracked windows of every stage are persisted, e.g. to resume a killed run
+    checkpoint = None
+    if cfg.get("checkpoint") is not None:
+        checkpoint = hydra.utils.instantiate(cfg.checkpoint)
+
+    log.info("==> initializing initial tracking ...")
+    trainer = hydra.utils.instantiate(
+        cfg.init_tracker,
+        optimizer=framework,
+        datamodule=datamodule,
+        checkpoint=checkpoint,
+    )
+    log.info("==> start optimization ...")
+    init_params = trainer.optimize()
+
+    log.info("==> initializing joint tracking ...")
+    trainer = hydra.utils.instantiate(
+        cfg.joint_tracker,
+        optimizer=framework,
+        datamodule=datamodule,
+        checkpoint=checkpoint,
+        default_params=init_params,
+    )
+    log.info("==> start optimization ...")
+    joint_params = trainer.optimize()
+
+    log.info("==> initializing sequential tracking ...")
+    framework.optimizer.store_system = True
+    trainer = hydra.utils.instantiate(
+        cfg.sequential_tracker,
+        optimizer=framework,
+        datamodule=datamodule,
+        checkpoint=checkpoint,
+        default_params=joint_params,
+    )
+    if cfg.segment_tracker.num_segments > 1:
+        log.info("==> start segment parallel optimization ...")
+        segment_tracker = SegmentParallelTracker(
+            cfg=cfg,
+            start_frame=trainer.start_frame,
+            end_frame=trainer.end_frame,
+            default_params=joint_params,
+            **cfg.segment_tracker,
+        )
+        sequential_params = segment_tracker.optimize()
+        if cfg.segment_tracker.compare_serial:
+            log.info("==> start serial optimization for comparison ...")
+            start = time.perf_counter()
+            serial_params = trainer.optimize()
+            segment_tracker.compare(
+                store=sequential_params,
+                serial_store=serial_params,
+                serial_time_ms=(time.perf_counter() - start) * 1000,
+                flame=flame,
+            )
+    else:
+        log.info("==> start optimization ...")
+        sequential_params = trainer.optimize()
+        if trainer.predictor is not None or trainer.static_detector is not None:
+            path = Path(cfg.paths.output_dir) / "iter_stats.json"
+            with open(path, "w") as f:
+                json.dump(trainer.iter_stats, f, indent=2)
+
+    # the frames of the evaluation are loaded without the prefetcher
+    datamodule.teardown()
+
+    log.info("==> prepare evaluation ...")
+    for out in tqdm(sequential_params):
+        logger.prepare_evaluation(
+            renderer=renderer,
+            datamodule=datamodule,
+            flame=flame,
+            params=out["params"],
+            frame_idx=out["frame_idx"],
+        )
+
+    if trainer.final_video:
+        log.info("==> create video ...")
+        logger.log_tracking_video("render_normal", framerate=16)
+        logger.log_tracking_video("render_merged", framerate=16)
+        logger.log_tracking_video("error_point_to_plane", framerate=16)
+        logger.log_tracking_video("batch_color", framerate=16)
+        log.info("==> sync video ...")
+        logger.log_tracking_video_wandb()
+
+    if cfg.store_params:
+        log.info("==> store flame params ...")
+        source_dir = Path(logger.save_dir) / "params"  # type: ignore
+        target_dir = Path(data_dir) / "params"
+        shutil.copytree(source_dir, target_dir, dirs_exist_ok=True)
+        log.info("==> store track video ...")
+        source_dir = Path(logger.save_dir) / "video"  # type: ignore
+        target_dir = Path(data_dir) / "video"
+        shutil.copytree(source_dir, target_dir, dirs_exist_ok=True)
+
+    return dict(renderer=renderer, flame=flame, params=sequential_params)
+
+
+def list_sequences(cfg: DictConfig):
+    """The sequences of the job config, by default every sequence in the data dir."""
+    if cfg.get("sequences"):
+        return list(cfg.sequences)
+    return sorted(p.name for p in Path(cfg.data.data_dir).iterdir() if p.is_dir())
+
+
+def sequence_config(cfg: DictConfig, dataset_name: str):
+    """The resolved config of one sequence, with its own output dir.
+
+    The config is resolved in the main process, because the hydra resolvers are not
+    available in the spawned workers.
+    """
+    cfg = copy.deepcopy(cfg)
+    cfg.data.dataset_name = dataset_name
+    cfg.paths.output_dir = str(Path(cfg.paths.output_dir) / dataset_name)
+    cfg.logger.name = dataset_name
+    return OmegaConf.create(OmegaConf.to_container(cfg, resolve=True))
+
+
+def run_worker(
+    rank: int,
+    flame: Flame,
+    jobs: mp.Queue,
+    results: mp.Queue,
+    max_retries: int = 1,
+):
+    """Tracks the sequences of the job queue until the sentinel is received.
+
+    The flame model is shared with the main process and the renderer, e.g. the
+    rasterizer context, is reused across the jobs of the worker, only the camera is
+    updated to the intrinsics of the next sequence.
+    """
+    renderer = None
+    while (cfg := jobs.get()) is not None:
+        dataset_name = cfg.data.dataset_name
+        start = time.perf_counter()
+        result = dict(sequence=dataset_name, worker=rank, status="failed", error="")
+        for attempt in range(1, max_retries + 2):
+            result["attempts"] = attempt
+            try:
+                out = track_sequence(cfg, renderer=renderer, flame=flame)
+                renderer = out["renderer"]
+                result["status"] = "done"
+                break
+            except Exception:
+                result["error"] = traceback.format_exc()
+                log.error(f"==> {dataset_name} failed ({attempt=}) ...")
+                log.error(result["error"])
+                torch.cuda.empty_cache()
+            finally:
+                if wandb.run is not None:  # one wandb run per sequence
+                    wandb.finish()
+        result["time_s"] = round(time.perf_counter() - start, 3)
+        results.put(result)
+
+
+class JobRunner:
+    """Schedules the tracking pipeline of multiple sequences over a worker pool.
+
+    The flame bases are loaded once in the main process and shared with the workers,
+    e.g. via shared memory on the cpu and via cuda ipc on the gpu. Failed sequences
+    are retried and reported in the summary instead of stopping the other jobs.
+
+    Args:
+        cfg: The config of the optimization, the dataset name is set per sequence.
+        sequences: The dataset names of the sequences.
+        num_workers: The number of worker processes, 0 runs in the main process.
+        max_retries: The number of retries of a failed sequence.
+    """
+
+    def __init__(
+        self,
+        cfg: DictConfig,
+        sequences: list[str],
+        num_workers: int = 1,
+        max_retries: int = 1,
+    ):
+        self.cfg = cfg
+        self.sequences = sequences
+        self.num_workers = min(num_workers, len(sequences))
+        self.max_retries = max_retries
+        self.results: list[dict] = []
+
+    def run(self):
+        log.info(f"==> initializing model <{self.cfg.model._target_}> ...")
+        flame: Flame = hydra.utils.instantiate(self.cfg.model).to(self.cfg.device)
+        flame.share_memory()
+
+        ctx = mp.get_context("spawn")
+        jobs, results = ctx.Queue(), ctx.Queue()
+        for dataset_name in self.sequences:
+            jobs.put(sequence_config(self.cfg, dataset_name))
+        for _ in range(max(self.num_workers, 1)):
+            jobs.put(None)
+
+        if self.num_workers <= 0:
+            run_worker(0, flame, jobs, results, self.max_retries)
+            self.results = [results.get() for _ in self.sequences]
+            return self.results
+
+        args = (flame, jobs, results, self.max_retries)
+        context = mp.spawn(
+            run_worker,
+            args=args,
+            nprocs=self.num_workers,
+            join=False,
+            start_method="spawn",
+        )
+        # collect the results while the workers are running, the flame tensors of
+        # the main process need to stay alive until the workers are done
+        self.results = []
+        while len(self.results) < len(self.sequences):
+            try:
+                self.results.append(results.get(timeout=1.0))
+            except queue.Empty:
+                if context.join(timeout=0):
+                    break
+        context.join()
+        return self.results
+
+    def failed(self):
+        return [r["sequence"] for r in self.results if r["status"] != "done"]
+
+    def print_summary(self):
+        table = PrettyTable()
+        table.field_names = ["sequence", "worker", "status", "attempts", "time_s"]
+        table.align = "r"
+        table.align["sequence"] = "l"  # type: ignore
+        for result in sorted(self.results, key=lambda r: r["sequence"]):
+            table.add_row([result[k] for k in table.field_names])
+        log.info("\n" + table.get_string())
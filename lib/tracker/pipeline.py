@@ -0,0 +1,85 @@
+import logging
+from pathlib import Path
+
+import hydra
+from omegaconf import DictConfig
+
+from lib.data.loader import load_intrinsics
+from lib.model import Flame
+from lib.renderer import Camera, Rasterizer, Renderer
+
+log = logging.getLogger()
+
+
+def build_renderer(cfg: DictConfig, renderer: Renderer | None = None):
+    """The renderer with the intrinsics of the sequence, an existing one is reused."""
+    data_dir = Path(cfg.data.data_dir) / cfg.data.dataset_name
+    K = load_intrinsics(data_dir=data_dir, return_tensor="pt")
+    if renderer is not None:  # keep the rasterizer context, only update the camera
+        renderer.camera.K = K
+        renderer.camera.original_width = cfg.data.width
+        renderer.camera.original_height = cfg.data.height
+        renderer.camera.near = cfg.data.near
+        renderer.camera.far = cfg.data.far
+        renderer.update(scale=1)
+        return renderer
+    camera = Camera(
+        K=K,
+        width=cfg.data.width,
+        height=cfg.data.height,
+        near=cfg.data.near,
+        far=cfg.data.far,
+    )
+    rasterizer = Rasterizer(width=camera.width, height=camera.height)
+    return Renderer(camera=camera, rasterizer=rasterizer)
+
+
+def build_pipeline(
+    cfg: DictConfig,
+    renderer: Renderer | None = None,
+    flame: Flame | None = None,
+):
+    """Instantiates the modules of the tracking pipeline of one sequence.
+
+    Returns:
+        (dict): The renderer, flame, logger, datamodule and framework.
+    """
+    log.info("==> initializing camera and rasterizer ...")
+    renderer = build_renderer(cfg, renderer=renderer)
+
+    if flame is None:
+        log.info(f"==> initializing model <{cfg.model._target_}> ...")
+        flame = hydra.utils.instantiate(cfg.model)
+
+    log.info(f"==> initializing logger <{cfg.logger._target_}> ...")
+    logger = hydra.utils.instantiate(cfg.logger)
+
+    log.info(f"==> initializing datamodule <{cfg.data._target_}> ...")
+    datamodule = hydra.utils.instantiate(cfg.data)
+
+    log.info(f"==> initializing correspondence <{cfg.correspondence._target_}> ...")
+    correspondence = hydra.utils.instantiate(cfg.correspondence)
+
+    log.info(f"==> initializing residuals <{cfg.residuals._target_}> ...")
+    residuals = hydra.utils.instantiate(cfg.residuals)
+
+    log.info(f"==> initializing optimizer <{cfg.optimizer._target_}> ...")
+    optimizer = hydra.utils.instantiate(cfg.optimizer)
+
+    log.info(f"==> initializing framework <{cfg.framework._target_}> ...")
+    framework = hydra.utils.instantiate(
+        cfg.framework,
+        flame=flame,
+        logger=logger,
+        renderer=renderer,
+        correspondence=correspondence,
+        residuals=residuals,
+        optimizer=optimizer,
+    )
+    return dict(
+        renderer=renderer,
+        flame=flame,
+        logger=logger,
+        datamodule=datamodule,
+        framework=framework,
+    )
@@ -0,0 +1,158 @@
+import math
+
+import numpy as np
+import torch
+
+from lib.model.flame.lbs import batch_rodrigues, matrix_to_axis_angle
+
+# the tolerance of the prediction error of the params, an error of the tolerance
+# lowers the confidence to exp(-1)
+TOLERANCE = {
+    "global_pose": 0.02,  # rad
+    "neck_pose": 0.02,  # rad
+    "jaw_pose": 0.02,  # rad
+    "eye_pose": 0.05,  # rad
+    "transl": 0.005,  # m
+    "expression_params": 0.2,
+}
+POSE_PARAMS = ["global_pose", "neck_pose", "jaw_pose", "eye_pose"]
+
+
+class MotionPredictor:
+    """Predicts the params of the next window from the tracked windows.
+
+    The base predictor keeps the params of the previous window, which is the default
+    initialization of the sequential tracking. The confidence of the next prediction
+    is measured on the previous prediction, e.g. exp(-error / tolerance) averaged
+    over the params, and sets the iteration budget of the window, hence well
+    predicted frames converge in a handful of iterations.
+
+    Args:
+        min_iters: The iteration budget with full confidence.
+        p_names: The params to predict, the remaining params are copied.
+        tolerance: The prediction error per param with a confidence of exp(-1).
+    """
+
+    order: int = 0  # the number of previous windows that are required
+
+    def __init__(
+        self,
+        min_iters: int = 5,
+        p_names: list[str] = list(TOLERANCE.keys()),
+        tolerance: dict[str, float] = {},
+    ):
+        self.min_iters = min_iters
+        self.p_names = p_names
+        self.tolerance = {**TOLERANCE, **tolerance}
+        self.reset()
+
+    def reset(self):
+        self.history: list[dict] = []
+        self.prediction: dict | None = None
+        self.confidence = 0.0
+
+    def get_state(self):
+        return dict(
+            history=self.history,
+            prediction=self.prediction,
+            confidence=self.confidence,
+        )
+
+    def set_state(self, state: dict):
+        for key, value in state.items():
+            setattr(self, key, value)
+
+    def extrapolate(self, p_name: str, history: list[torch.Tensor]):
+        return history[-1]
+
+    def predict(self, params: dict):
+        """The initial params of the next window."""
+        if len(self.history) <= self.order:
+            self.prediction = None
+            return params
+        prediction = dict(params)
+        for p_name in self.p_names:
+            if p_name in params:
+                history = [h[p_name] for h in self.history]
+                prediction[p_name] = self.extrapolate(p_name, history)
+        self.prediction = prediction
+        return prediction
+
+    def prediction_error(self, params: dict):
+        """The error of the prediction relative to the tolerance per param."""
+        errors = {}
+        for p_name in self.p_names:
+            if p_name in params:
+                diff = params[p_name] - self.prediction[p_name]  # type: ignore
+                rmse = diff.pow(2).mean().sqrt().item()
+                errors[p_name] = rmse / self.tolerance.get(p_name, 1.0)
+        return errors
+
+    def update(self, params: dict, predicted: bool = True):
+        """Adds the tracked params of the window and updates the confidence.
+
+        The confidence is only scored if the window was initialized with the
+        prediction, otherwise, e.g. for static windows, it is kept.
+        """
+        if not predicted:
+            self.prediction = None
+        elif self.prediction is None:
+            self.confidence = 0.0
+        else:
+            errors = self.prediction_error(params)
+            self.confidence = float(np.mean([math.exp(-e) for e in errors.values()]))
+        tracked = {k: params[k].detach().clone() for k in self.p_names if k in params}
+        self.history = (self.history + [tracked])[-3:]
+
+    def iter_budget(self, max_iters: int):
+        """The number of outer iterations, interpolated with the confidence."""
+        budget = max_iters - self.confidence * (max_iters - self.min_iters)
+        return int(min(max(round(budget), 1), max_iters))
+
+
+class ConstantVelocityPredictor(MotionPredictor):
+    """Extrapolates the params linearly from the last two windows."""
+
+    order = 1
+
+    def extrapolate(self, p_name: str, history: list[torch.Tensor]):
+        return 2 * history[-1] - history[-2]
+
+
+class ConstantAccelerationPredictor(MotionPredictor):
+    """Extrapolates the params quadratically from the last three windows."""
+
+    order = 2
+
+    def extrapolate(self, p_name: str, history: list[torch.Tensor]):
+        return 3 * history[-1] - 3 * history[-2] + history[-3]
+
+
+class DampedSO3Predictor(MotionPredictor):
+    """Extrapolates the damped velocity, the rotations on SO(3).
+
+    The joint rotations are extrapolated with the damped relative rotation of the
+    last two windows, e.g. exp(damping * log(R_t R_t-1^T)) R_t, such that the
+    rotation stays valid for large motions, the translation and the expression
+    coefficients are extrapolated linearly with the damped velocity.
+
+    Args:
+        damping: The fraction of the last motion that is continued.
+    """
+
+    order = 1
+
+    def __init__(self, damping: float = 0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.damping = damping
+
+    def extrapolate(self, p_name: str, history: list[torch.Tensor]):
+        current, previous = history[-1], history[-2]
+        if p_name not in POSE_PARAMS:
+            return current + self.damping * (current - previous)
+        # the pose params are a stack of axis-angle vectors, e.g. (B, 6) for the eyes
+        R_t = batch_rodrigues(current.reshape(-1, 3))
+        R_prev = batch_rodrigues(previous.reshape(-1, 3))
+        delta = matrix_to_axis_angle(R_t @ R_prev.transpose(-1, -2))
+        R_pred = batch_rodrigues(self.damping * delta) @ R_t
+        return matrix_to_axis_angle(R_pred).reshape(current.shape)
@@ -56,6 +56,11 @@ class CoarseToFineScheduler(Scheduler):
             rasterizer=renderer.rasterizer,
         )
 
+    def used_scales(self, max_iters: int):
+        """The scales in the order they are used by the outer loop of a window."""
+        iters = max(max_iters, 1)  # the first scale is used without iterations too
+        return [s for m, s in zip(self.milestones, self.scales) if m < iters]
+
 
 class OptimizerScheduler(Scheduler):
     """The finetune scheduler manages which flame params are unfreezed.
@@ -0,0 +1,237 @@
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import hydra
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import wandb
+from omegaconf import DictConfig, OmegaConf
+from prettytable import PrettyTable
+
+from lib.model import Flame
+from lib.tracker.pipeline import build_pipeline
+
+log = logging.getLogger()
+
+
+@dataclass
+class Segment:
+    """The frames [start_frame, end_frame) are tracked, [keep_start, keep_end) kept."""
+
+    start_frame: int
+    keep_start: int
+    keep_end: int
+    end_frame: int
+
+
+def split_segments(
+    start_frame: int,
+    end_frame: int,
+    num_segments: int,
+    overlap: int = 5,
+    kernel_size: int = 1,
+    stride: int = 1,
+    dilation: int = 1,
+):
+    """Splits the frame range into overlapping segments on the grid of the windows.
+
+    The grid holds the first frame of every window, e.g. every `stride * dilation`
+    frame, hence the windows of the segments are the windows of the serial tracking.
+    Each segment starts `overlap` windows before the windows it keeps, such that the
+    tracking is warmed up at the seam, and ends after the last frame of its last
+    kept window, such that the windows that start in the kept range are complete.
+    """
+    grid = list(range(start_frame, end_frame, stride * dilation))
+    bounds = np.linspace(0, len(grid), num_segments + 1).round().astype(int)
+    segments = []
+    for i in range(num_segments):
+        first, last = int(bounds[i]), int(bounds[i + 1])
+        if first == last:
+            continue
+        last_frame = grid[last - 1] + (kernel_size - 1) * dilation
+        segments.append(
+            Segment(
+                start_frame=grid[max(first - overlap, 0)],
+                keep_start=grid[first],
+                keep_end=grid[last - 1] + 1,
+                end_frame=min(last_frame + 1, end_frame),
+            )
+        )
+    return segments
+
+
+def stitch_segments(stores: list[list[dict]], segments: list[Segment]):
+    """Merges the stores of the segments, the warm-up windows are dropped."""
+    store = []
+    for segment_store, segment in zip(stores, segments):
+        for out in segment_store:
+            if segment.keep_start <= out["frame_idx"][0] < segment.keep_end:
+                store.append(out)
+    return store
+
+
+def segment_config(cfg: DictConfig, segment_idx: int):
+    """The config of one segment with its own output dir and logger run.
+
+    The config is resolved, hence every path in the output dir of the sequence is
+    moved to the dir of the segment, e.g. the logger and the stored systems.
+    """
+    output_dir = str(cfg.paths.output_dir)
+    segment_dir = str(Path(output_dir) / "segments" / f"{segment_idx:02}")
+
+    def move(value):
+        if isinstance(value, dict):
+            return {k: move(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [move(v) for v in value]
+        if isinstance(value, str) and (
+            value == output_dir or value.startswith(output_dir + "/")
+        ):
+            return segment_dir + value[len(output_dir) :]
+        return value
+
+    cfg = OmegaConf.create(move(OmegaConf.to_container(cfg, resolve=True)))
+    name = cfg.logger.get("name") or cfg.data.dataset_name
+    cfg.logger.name = f"{name}_segment{segment_idx:02}"
+    return cfg
+
+
+def track_segment(cfg: DictConfig, segment: Segment, default_params: dict):
+    """Tracks the frames of one segment in a worker process."""
+    pipeline = build_pipeline(cfg)
+    pipeline["framework"].optimizer.store_system = True
+    tracker = hydra.utils.instantiate(
+        cfg.sequential_tracker,
+        optimizer=pipeline["framework"],
+        datamodule=pipeline["datamodule"],
+        default_params={k: v.to(cfg.device) for k, v in default_params.items()},
+        start_frame=segment.start_frame,
+        end_frame=segment.end_frame,
+    )
+    try:
+        store = tracker.optimize()
+    finally:
+        pipeline["datamodule"].teardown()
+        if wandb.run is not None:  # one wandb run per segment
+            wandb.finish()
+    return [
+        dict(
+            params={k: v.detach().cpu() for k, v in out["params"].items()},
+            frame_idx=out["frame_idx"],
+        )
+        for out in store
+    ]
+
+
+class SegmentParallelTracker:
+    """Tracks overlapping segments of the sequence in parallel worker processes.
+
+    Every segment starts from the shared params of the joint tracking and warms up
+    on the `overlap` frames before its first kept frame, the warm-up windows are
+    dropped when the segments are stitched. Each worker builds its own pipeline,
+    e.g. flame, renderer and framework, from the config of its segment, which logs
+    into its own output dir and logger run.
+
+    Args:
+        cfg: The resolved config of the optimization.
+        start_frame: The first frame of the sequence.
+        end_frame: The end of the frame range (exclusive).
+        num_segments: The number of segments.
+        overlap: The number of warm-up frames before each seam.
+        num_workers: The number of worker processes.
+    """
+
+    def __init__(
+        self,
+        cfg: DictConfig,
+        start_frame: int,
+        end_frame: int,
+        num_segments: int = 4,
+        overlap: int = 5,
+        num_workers: int | None = None,
+        default_params: dict = {},
+        **kwargs,
+    ):
+        self.final_video = True
+        # the hydra resolvers are not available in the spawned workers
+        self.cfg = OmegaConf.create(OmegaConf.to_container(cfg, resolve=True))
+        self.overlap = overlap
+        self.num_workers = num_workers or num_segments
+        self.default_params = {k: v.detach().cpu() for k, v in default_params.items()}
+        self.segments = split_segments(
+            start_frame=start_frame,
+            end_frame=end_frame,
+            num_segments=num_segments,
+            overlap=overlap,
+            kernel_size=cfg.sequential_tracker.kernel_size,
+            stride=cfg.sequential_tracker.stride,
+            dilation=cfg.sequential_tracker.dilation,
+        )
+        self.time_ms = 0.0
+
+    def optimize(self):
+        start = time.perf_counter()
+        args = [
+            (segment_config(self.cfg, i), segment, self.default_params)
+            for i, segment in enumerate(self.segments)
+        ]
+        with mp.get_context("spawn").Pool(self.num_workers) as pool:
+            stores = pool.starmap(track_segment, args)
+        store = stitch_segments(stores, self.segments)
+        self.time_ms = (time.perf_counter() - start) * 1000
+        device = self.cfg.device
+        for out in store:
+            out["params"] = {k: v.to(device) for k, v in out["params"].items()}
+        return store
+
+    def seam_frames(self):
+        """The first frames after each seam, which are tracked after the warm-up."""
+        frames = []
+        for segment in self.segments[1:]:
+            step = self.cfg.sequential_tracker.stride
+            step *= self.cfg.sequential_tracker.dilation
+            end = min(segment.keep_start + self.overlap * step, segment.keep_end)
+            frames.extend(range(segment.keep_start, end, step))
+        return frames
+
+    def compare(
+        self,
+        store: list[dict],
+        serial_store: list[dict],
+        serial_time_ms: float,
+        flame: Flame,
+    ):
+        """Reports the speedup and the vertex error in mm to the serial tracking."""
+        params = {out["frame_idx"][0]: out["params"] for out in store}
+        serial_params = {out["frame_idx"][0]: out["params"] for out in serial_store}
+
+        def vertex_error(frame_idxs: list[int]):
+            errors = []
+            for frame_idx in frame_idxs:
+                if frame_idx not in params or frame_idx not in serial_params:
+                    continue
+                with torch.no_grad():
+                    vertices = flame(**params[frame_idx])["vertices"]
+                    serial_vertices = flame(**serial_params[frame_idx])["vertices"]
+                error = torch.norm(vertices - serial_vertices, dim=-1).mean() * 1000
+                errors.append(error.item())
+            return np.mean(errors) if errors else float("nan")
+
+        stats = dict(
+            segments=len(self.segments),
+            workers=self.num_workers,
+            serial_ms=round(serial_time_ms, 3),
+            parallel_ms=round(self.time_ms, 3),
+            speedup=round(serial_time_ms / max(self.time_ms, 1e-08), 3),
+            seam_error_mm=round(vertex_error(self.seam_frames()), 4),
+            mean_error_mm=round(vertex_error(list(params.keys())), 4),
+        )
+        table = PrettyTable()
+        table.field_names = list(stats.keys())
+        table.align = "r"
+        table.add_row(list(stats.values()))
+        log.info("\n" + table.get_string())
+        return stats
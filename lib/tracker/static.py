@@ -0,0 +1,100 @@
+import logging
+
+import torch
+
+log = logging.getLogger()
+
+
+class StaticFrameDetector:
+    """Detects the windows that barely change from the last optimized window.
+
+    The change is measured on the downscaled input buffers, e.g. the overlap of the
+    masks, the depth difference and the normal angle on the pixels that are valid in
+    both frames. The reference is the last window that was fully optimized, such
+    that a slow drift over many static frames is still detected.
+
+    Args:
+        scale: The scale of the buffers that are compared, by default the first scale
+            of the coarse to fine schedule, whose batch is prefetched anyway.
+        mode: Either "skip" to reuse the previous params or "verify" to run a single
+            outer iteration at the finest scale.
+        max_depth_mm: The max 90th percentile of the depth difference in mm.
+        max_normal: The max mean of 1 - cos of the normal angle.
+        min_overlap: The min intersection over union of the masks.
+    """
+
+    def __init__(
+        self,
+        scale: int | None = None,
+        mode: str = "verify",
+        max_depth_mm: float = 2.0,
+        max_normal: float = 0.01,
+        min_overlap: float = 0.97,
+    ):
+        assert mode in ["skip", "verify"]
+        self.scale = scale
+        self.mode = mode
+        self.max_depth_mm = max_depth_mm
+        self.max_normal = max_normal
+        self.min_overlap = min_overlap
+        self.reset()
+
+    def reset(self):
+        self.reference: dict | None = None
+        self.skipped = 0
+        self.verified = 0
+
+    def change(self, reference: dict, window: dict):
+        """The change statistics between the frames of two windows."""
+        mask = reference["mask"] & window["mask"]
+        union = (reference["mask"] | window["mask"]).sum()
+        overlap = mask.sum() / union.clamp(min=1)
+        depth = reference["point"][..., 2] - window["point"][..., 2]
+        depth_mm = (depth[mask].abs() * 1000).float()
+        cos = (reference["normal"] * window["normal"]).sum(-1)
+        normal = (1 - cos[mask]).float()
+        if depth_mm.numel() == 0:
+            return dict(overlap=0.0, depth_mm=float("inf"), normal=float("inf"))
+        return dict(
+            overlap=overlap.item(),
+            depth_mm=torch.quantile(depth_mm, 0.9).item(),
+            normal=normal.mean().item(),
+        )
+
+    def is_static(self, window: dict):
+        if self.reference is None:
+            return False
+        if self.reference["mask"].shape != window["mask"].shape:
+            return False  # the window size changed
+        change = self.change(self.reference, window)
+        return (
+            change["overlap"] >= self.min_overlap
+            and change["depth_mm"] <= self.max_depth_mm
+            and change["normal"] <= self.max_normal
+        )
+
+    def detect(self, datamodule, frame_idxs: list[int], scale: int = 1):
+        """Whether the window is static, the window is the next reference if not.
+
+        The buffers are fetched through the datamodule, e.g. from the prefetched
+        batches of the window, the scale is used if the detector has none.
+        """
+        scale = self.scale if self.scale is not None else scale
+        batch = datamodule.fetch_window(scale, frame_idxs)
+        window = {k: batch[k] for k in ["mask", "point", "normal"]}
+        with torch.no_grad():
+            static = self.is_static(window)
+        if static:
+            if self.mode == "skip":
+                self.skipped += 1
+            else:
+                self.verified += 1
+        else:
+            self.reference = window
+        return static
+
+    def print_summary(self, num_windows: int):
+        log.info(
+            f"Static windows: {self.skipped} skipped, {self.verified} verified "
+            f"of {num_windows} windows ({self.mode=})"
+        )
@@ -1,22 +1,61 @@
 import logging
+import time
 
+import numpy as np
 import torch
+from prettytable import PrettyTable
 from tqdm import tqdm
 
-from lib.data.datamodule import DPHMDataModule
+from lib.data.datamodule import DPHMDataModule, StreamDataModule
+from lib.data.preprocessing import preprocess_frames
+from lib.data.stream import FrameSource
 from lib.data.synthetic import generate_params
+from lib.optimizer.convergence import FrameConvergence
 from lib.optimizer.framework import LandmarkRigidOptimizer, OptimizerFramework
 from lib.optimizer.residuals import LandmarkResiduals
+from lib.optimizer.rigid import landmark_rigid_init
+from lib.renderer.camera import Camera
+from lib.tracker.budget import BudgetController
+from lib.tracker.checkpoint import TrajectoryStore, optimizer_state
+from lib.tracker.predictor import MotionPredictor
 from lib.tracker.scheduler import (
     CoarseToFineScheduler,
     OptimizerScheduler,
     StepSizeScheduler,
 )
+from lib.tracker.static import StaticFrameDetector
+from lib.tracker.timer import TimeTracker
 from lib.utils.progress import close_progress, reset_progress
 
 log = logging.getLogger()
 
 
+def resume_stage(tracker):
+    """The stored params of a single window stage, e.g. the init or joint tracking."""
+    if tracker.checkpoint is None:
+        return None
+    device = tracker.optimizer.flame.device
+    stored = tracker.checkpoint.start(tracker.mode, device=device)
+    if not stored or stored[-1]["frame_idx"] != list(tracker.init_idxs):
+        tracker.checkpoint.truncate(tracker.mode, 0)
+        return None
+    if state := stored[-1]["state"]["optimizer"]:
+        tracker.optimizer.optimizer.set_state(state)
+    return stored[-1]["params"]
+
+
+def store_stage(tracker, params: dict):
+    """Appends the params of a single window stage to the trajectory store."""
+    if tracker.checkpoint is None:
+        return
+    tracker.checkpoint.append(
+        stage=tracker.mode,
+        params=params,
+        frame_idx=tracker.init_idxs,
+        state=dict(optimizer=optimizer_state(tracker.optimizer.optimizer)),
+    )
+
+
 class InitTracker:
     def __init__(
         self,
@@ -29,9 +68,24 @@ class InitTracker:
         max_optims: int = 1,
         save_interval: int = 1,
         init_idxs: list[int] = [],
+        closed_form: bool = False,
+        estimate_scale: bool = False,
+        num_hypotheses: int = 1,
+        sigmas: dict = {},
+        prune_interval: int = 1,
+        keep_ratio: float = 0.5,
+        checkpoint: TrajectoryStore | None = None,
         default_params: dict = {},
     ):
         self.mode = "init"
+        self.checkpoint = checkpoint
+        self.closed_form = closed_form
+        self.estimate_scale = estimate_scale
+        self.num_hypotheses = num_hypotheses
+        self.sigmas = sigmas
+        self.prune_interval = prune_interval
+        self.keep_ratio = keep_ratio
+        assert num_hypotheses == 1 or max_iters > 0, "The hypotheses need iterations."
         self.datamodule = datamodule
         self.coarse2fine = coarse2fine
         self.scheduler = scheduler
@@ -51,6 +105,9 @@ class InitTracker:
         return tqdm(total=self.max_optims, desc="Inner Loop", leave=True, position=2)
 
     def optimize(self):
+        if (params := resume_stage(self)) is not None:
+            return params
+
         # override residuals
         prev_residuals = self.optimizer.residuals
         self.optimizer.residuals = LandmarkResiduals()
@@ -72,16 +129,125 @@ class InitTracker:
         batch["step_size"] = self.step_size
         batch["datamodule"] = self.datamodule
 
+        self.datamodule.update_schedule(
+            schedule=[self.init_idxs],
+            scales=self.coarse2fine.used_scales(self.max_iters),
+        )
         self.datamodule.update_idxs(self.init_idxs)
-        with torch.no_grad():
-            out = self.optimizer(batch)
+        if self.closed_form:
+            batch["params"] = self.rigid_init(batch["params"])
+        out = dict(params=batch["params"])
+        if self.num_hypotheses > 1:
+            out = dict(params=self.optimize_hypotheses(batch))
+        elif self.max_iters > 0:  # refine with the landmark residuals
+            with torch.no_grad():
+                out = self.optimizer(batch)
         close_progress([batch["outer_progress"], batch["inner_progress"]])
 
         # store previous residuals
         self.optimizer.residuals = prev_residuals
 
+        store_stage(self, out["params"])
         return out["params"]
 
+    def hypotheses(self, params: dict, num: int):
+        """Repeats the params along the batch and perturbs all but the first copy.
+
+        The perturbations are sampled with `generate_params` and the sigmas, only the
+        local params are perturbed, because the global params, e.g. the shape and
+        the scale, are shared over the batch.
+        """
+        flame = self.optimizer.flame
+        F = len(self.init_idxs)
+        noisy = generate_params(flame, window_size=num * F, sigmas=self.sigmas)
+        base = generate_params(flame, window_size=num * F)
+        out = {}
+        for p_name, value in params.items():
+            if p_name in flame.global_params:
+                out[p_name] = value
+                continue
+            eps = noisy[p_name] - base[p_name]  # (K * F, D)
+            eps[:F] = 0.0  # the first hypothesis is the initialization itself
+            out[p_name] = value.repeat(num, 1) + eps
+        return out
+
+    def select_hypotheses(self, params: dict, idxs: torch.Tensor):
+        """The params of the selected hypotheses, hypotheses are the major dim."""
+        flame = self.optimizer.flame
+        F = len(self.init_idxs)
+        out = {}
+        for p_name, value in params.items():
+            if p_name in flame.global_params:
+                out[p_name] = value
+                continue
+            value = value.reshape(-1, F, value.shape[-1])  # (K, F, D)
+            out[p_name] = value[idxs].reshape(-1, value.shape[-1])
+        return out
+
+    def hypotheses_loss(self, params: dict, num: int):
+        """The landmark error per hypothesis of dim (K,)."""
+        self.datamodule.update_idxs(self.init_idxs)
+        data = self.datamodule.fetch()
+        landmark = data["landmark"].repeat(num, 1, 1)  # (K * F, L, 3)
+        mask = data["landmark_mask"].repeat(num, 1).to(landmark.dtype)
+        t_landmark = self.optimizer.flame(**params)["landmark"]
+        error = ((t_landmark - landmark) ** 2).sum(-1) * mask  # (K * F, L)
+        error = error.sum(-1) / mask.sum(-1).clamp(min=1)
+        return error.reshape(num, -1).mean(-1)
+
+    def optimize_hypotheses(self, batch: dict):
+        """Optimizes the hypotheses jointly in one batch and prunes the worst.
+
+        Every `prune_interval` outer iterations only the `keep_ratio` best hypotheses
+        are kept, the last one is optimized for the remaining iterations.
+        """
+        num = self.num_hypotheses
+        batch["params"] = self.hypotheses(batch["params"], num)
+        iter_step = 0
+        while iter_step < self.max_iters:
+            end = self.max_iters
+            if num > 1:
+                end = min(iter_step + self.prune_interval, self.max_iters)
+            batch["iter_steps"] = list(range(iter_step, end))
+            reset_progress(batch["outer_progress"], len(batch["iter_steps"]))
+            self.datamodule.update_idxs(self.init_idxs * num)
+            with torch.no_grad():
+                out = self.optimizer(batch)
+            batch["params"] = {k: v.clone() for k, v in out["params"].items()}
+            iter_step = end
+            if num == 1:
+                continue
+            # prune the hypotheses with the largest landmark error
+            with torch.no_grad():
+                loss = self.hypotheses_loss(batch["params"], num)
+            keep = int(np.ceil(num * self.keep_ratio))
+            if iter_step >= self.max_iters:
+                keep = 1
+            idxs = loss.argsort()[:keep]
+            log.info(f"Hypotheses {iter_step=}: {loss.tolist()} keep {idxs.tolist()}")
+            batch["params"] = self.select_hypotheses(batch["params"], idxs)
+            num = keep
+        self.datamodule.update_idxs(self.init_idxs)
+        batch.pop("iter_steps")
+        return batch["params"]
+
+    def rigid_init(self, params: dict):
+        """The closed-form rigid pose from the landmarks of the init frames."""
+        self.coarse2fine.schedule(
+            datamodule=self.datamodule,
+            renderer=self.optimizer.renderer,
+            iter_step=0,
+        )
+        data = self.datamodule.fetch()
+        with torch.no_grad():
+            return landmark_rigid_init(
+                flame=self.optimizer.flame,
+                params=params,
+                landmark=data["landmark"],
+                landmark_mask=data["landmark_mask"],
+                estimate_scale=self.estimate_scale,
+            )
+
 
 class JointTracker:
     def __init__(
@@ -95,9 +261,13 @@ class JointTracker:
         max_optims: int = 1,
         save_interval: int = 1,
         init_idxs: list[int] = [],
+        convergence: FrameConvergence | None = None,
+        checkpoint: TrajectoryStore | None = None,
         default_params: dict = {},
     ):
         self.mode = "joint"
+        self.checkpoint = checkpoint
+        self.convergence = convergence
         self.datamodule = datamodule
         self.coarse2fine = coarse2fine
         self.scheduler = scheduler
@@ -117,6 +287,9 @@ class JointTracker:
         return tqdm(total=self.max_optims, desc="Inner Loop", leave=True, position=2)
 
     def optimize(self):
+        if (params := resume_stage(self)) is not None:
+            return params
+
         # build the batch
         batch = {}
         batch["params"] = self.default_params
@@ -129,11 +302,20 @@ class JointTracker:
         batch["scheduler"] = self.scheduler
         batch["step_size"] = self.step_size
         batch["datamodule"] = self.datamodule
+        batch["convergence"] = self.convergence
 
+        self.datamodule.update_schedule(
+            schedule=[self.init_idxs],
+            scales=self.coarse2fine.used_scales(self.max_iters),
+        )
         self.datamodule.update_idxs(self.init_idxs)
         with torch.no_grad():
             out = self.optimizer(batch)
         close_progress([batch["outer_progress"], batch["inner_progress"]])
+        if self.convergence is not None:
+            frame_iters = len(self.init_idxs) * self.max_iters
+            self.convergence.print_summary(frame_iters=frame_iters)
+        store_stage(self, out["params"])
         return out["params"]
 
 
@@ -153,10 +335,19 @@ class SequentialTracker:
         dilation: int = 1,
         start_frame: int = 0,
         end_frame: int = 126,
+        predictor: MotionPredictor | None = None,
+        static_detector: StaticFrameDetector | None = None,
+        convergence: FrameConvergence | None = None,
+        checkpoint: TrajectoryStore | None = None,
         default_params: dict = {},
     ):
         self.mode = "sequential"
+        self.checkpoint = checkpoint
         self.final_video = True
+        self.predictor = predictor
+        self.static_detector = static_detector
+        self.convergence = convergence
+        self.iter_stats: list[dict] = []
         self.datamodule = datamodule
         self.coarse2fine = coarse2fine
         self.scheduler = scheduler
@@ -206,6 +397,71 @@ class SequentialTracker:
     def init_frames(self, init_params: dict):
         return init_params
 
+    def iter_steps(self, budget: int):
+        """The outer iterations of the budget, every milestone is included."""
+        milestones = set()
+        for scheduler in [self.coarse2fine, self.scheduler, self.step_size]:
+            milestones.update(m for m in scheduler.milestones if m < self.max_iters)
+        steps = np.linspace(0, self.max_iters - 1, budget).round().astype(int)
+        return sorted(milestones | set(steps.tolist()))
+
+    def get_state(self):
+        """The state that is carried over to the next window."""
+        state = dict(
+            optimizer=optimizer_state(self.optimizer.optimizer),
+            scheduler=list(self.scheduler.state),
+        )
+        if self.predictor is not None:
+            state["predictor"] = self.predictor.get_state()
+        return state
+
+    def set_state(self, state: dict):
+        if state["optimizer"]:
+            self.optimizer.optimizer.set_state(state["optimizer"])
+        self.scheduler.state = list(state["scheduler"])
+        if self.predictor is not None and "predictor" in state:
+            self.predictor.set_state(state["predictor"])
+
+    def resume(self, windows: list[list[int]]):
+        """The stored windows of the trajectory that match the windows to track."""
+        if self.checkpoint is None:
+            return []
+        device = self.optimizer.flame.device
+        stored = self.checkpoint.start(self.mode, device=device)
+        num_windows = 0
+        for window, frame_idxs in zip(stored, windows):
+            if window["frame_idx"] != frame_idxs:
+                break
+            num_windows += 1
+        if num_windows < len(stored):
+            log.warning(f"The stored windows differ after {num_windows} windows.")
+            self.checkpoint.truncate(self.mode, num_windows)
+        return stored[:num_windows]
+
+    def print_iteration_stats(self):
+        """Summarizes the outer iterations per frame compared to the full budget."""
+        if not self.iter_stats:
+            return
+        iters = np.array([s["iters"] for s in self.iter_stats])
+        confidence = np.array([s["confidence"] for s in self.iter_stats])
+        table = PrettyTable()
+        table.field_names = ["Frames", "Mean", "Median", "Min", "Max", "Saved", "Conf"]
+        table.align = "r"
+        total = len(iters) * self.max_iters
+        table.add_row(
+            [
+                len(iters),
+                f"{iters.mean():.2f}",
+                f"{np.median(iters):.0f}",
+                iters.min(),
+                iters.max(),
+                f"{(1 - iters.sum() / total) * 100:.1f}%",
+                f"{confidence.mean():.3f}",
+            ]
+        )
+        log.info(f"Outer iterations per window (max_iters={self.max_iters}):")
+        log.info("\n" + table.get_string())
+
     def optimize(self):
         store = []
 
@@ -229,19 +485,300 @@ class SequentialTracker:
         batch["coarse2fine"] = self.coarse2fine
         batch["scheduler"] = self.scheduler
         batch["step_size"] = self.step_size
+        batch["convergence"] = self.convergence
+
+        self.iter_stats = []
+        if self.predictor is not None:
+            self.predictor.reset()
+        if self.static_detector is not None:
+            self.static_detector.reset()
+
+        # continue after the last completed window of the trajectory store
+        windows = list(self.frame_idxs_iter())
+        resumed = self.resume(windows)
+        for window in resumed:
+            store.append(dict(params=window["params"], frame_idx=window["frame_idx"]))
+            self.iter_stats.append(window["stats"])
+        if resumed:
+            batch["params"] = {k: v.clone() for k, v in resumed[-1]["params"].items()}
+            self.set_state(resumed[-1]["state"])
+            frame_progress.update(len(resumed))
+        windows = windows[len(resumed) :]
+
+        # load the upcoming windows in the background
+        self.datamodule.update_schedule(
+            schedule=windows,
+            scales=self.coarse2fine.used_scales(self.max_iters),
+        )
+
+        for frame_idxs in windows:
+            static_mode = None
+            if self.static_detector is not None and self.static_detector.detect(
+                datamodule=self.datamodule,
+                frame_idxs=frame_idxs,
+                scale=self.coarse2fine.scales[0],
+            ):
+                static_mode = self.static_detector.mode
+            batch.pop("iter_steps", None)
+            if static_mode == "verify":
+                # a single outer iteration at the finest scale of the schedule
+                batch["iter_steps"] = [max(self.coarse2fine.milestones)]
+            elif static_mode is None and self.predictor is not None:
+                # initialize from the motion model, the budget from its confidence
+                batch["params"] = self.predictor.predict(batch["params"])
+                budget = self.predictor.iter_budget(self.max_iters)
+                batch["iter_steps"] = self.iter_steps(budget)
+            iters = len(batch.get("iter_steps", range(self.max_iters)))
+            if static_mode == "skip":
+                # reuse the params of the previous window
+                iters = 0
+                batch["params"] = {k: v.clone() for k, v in batch["params"].items()}
+            else:
+                reset_progress(outer_progress, iters)
+                self.datamodule.update_idxs(frame_idxs)
+                with torch.no_grad():
+                    out = self.optimizer(batch)
+                # updatae the params
+                batch["params"] = {k: v.clone() for k, v in out["params"].items()}
+            store.append(dict(params=batch["params"], frame_idx=frame_idxs))
+            stats = dict(frame_idx=frame_idxs[0], iters=iters, confidence=0.0)
+            stats["static"] = static_mode is not None
+            stats["frozen"] = 0
+            if self.convergence is not None and static_mode != "skip":
+                stats["frozen"] = self.convergence.frozen_steps
+            if self.predictor is not None:
+                stats["confidence"] = self.predictor.confidence
+                self.predictor.update(batch["params"], predicted=static_mode is None)
+            self.iter_stats.append(stats)
+            if self.checkpoint is not None:
+                self.checkpoint.append(
+                    stage=self.mode,
+                    params=batch["params"],
+                    frame_idx=frame_idxs,
+                    state=self.get_state(),
+                    stats=stats,
+                )
+            frame_progress.update(1)
+
+        # close the progresses
+        close_progress([frame_progress, outer_progress, inner_progress])
+        if self.static_detector is not None:
+            self.static_detector.print_summary(num_windows=len(store))
+        if self.predictor is not None or self.static_detector is not None:
+            self.print_iteration_stats()
+        if self.convergence is not None:
+            frame_iters = sum(s["iters"] for s in self.iter_stats) * self.kernal_size
+            frozen_steps = sum(s["frozen"] for s in self.iter_stats)
+            self.convergence.print_summary(frame_iters, frozen_steps=frozen_steps)
+
+        return store
+
+
+class StreamingTracker:
+    """Tracks the frames of a live source as they arrive.
+
+    Each frame is preprocessed on the fly (mask, point, normal and the downscaled
+    maps) and tracked from the params of the previous frame. To bound the latency
+    the frames that waited longer than `max_latency_ms` are dropped as long as a
+    newer frame is available, hence the tracker always catches up with the sensor.
+    The latency is measured from the arrival of the frame until its params are
+    tracked.
+
+    Args:
+        source: The source of the raw RGB-D frames.
+        camera: The camera at the full resolution used for the preprocessing.
+        max_latency_ms: Drop older frames, None tracks every frame.
+        timeout: Stop if no frame arrived within the time in s.
+        max_frames: Stop after the number of tracked frames.
+        budget: Chooses the scale and the iterations per frame for a time budget,
+            otherwise the settings of the config are used.
+    """
+
+    def __init__(
+        self,
+        datamodule: StreamDataModule,
+        optimizer: OptimizerFramework,
+        scheduler: OptimizerScheduler,
+        coarse2fine: CoarseToFineScheduler,
+        step_size: StepSizeScheduler,
+        source: FrameSource,
+        camera: Camera,
+        max_iters: int = 1,
+        max_optims: int = 1,
+        save_interval: int = 1,
+        inf_depth: float = 0.6,
+        dilation: int = 30,
+        num_landmarks: int = 105,
+        max_latency_ms: float | None = 100.0,
+        timeout: float = 5.0,
+        max_frames: int | None = None,
+        budget: BudgetController | None = None,
+        default_params: dict = {},
+    ):
+        self.mode = "sequential"
+        self.datamodule = datamodule
+        self.coarse2fine = coarse2fine
+        self.scheduler = scheduler
+        self.step_size = step_size
+        self.max_iters = max_iters
+        self.max_optims = max_optims
+        self.optimizer = optimizer
+        self.optimizer.save_interval = save_interval  # type: ignore
+        self.default_params = {
+            k: v[0].detach().cpu().tolist() for k, v in default_params.items()
+        }
+        self.source = source
+        self.camera = camera
+        self.inf_depth = inf_depth
+        self.dilation = dilation
+        self.num_landmarks = num_landmarks
+        self.max_latency_ms = max_latency_ms
+        self.timeout = timeout
+        self.max_frames = max_frames
+        self.budget = budget
+        self.time_tracker = TimeTracker()
+        self.latencies: list[float] = []
+        self.finished: list[float] = []
+        self.dropped = 0
+
+    def outer_progress(self):
+        return tqdm(total=self.max_iters, desc="Outer Loop", position=1)
+
+    def inner_progress(self):
+        return tqdm(total=self.max_optims, desc="Inner Loop", leave=True, position=2)
+
+    @property
+    def scales(self):
+        if self.budget is None:
+            return self.coarse2fine.scales
+        return sorted(set(self.budget.scales) | set(self.coarse2fine.scales))
+
+    def age_ms(self, frame: dict):
+        return (time.perf_counter() - frame["arrival"]) * 1000
+
+    def next_frame(self):
+        frame = self.source.get(timeout=self.timeout)
+        if frame is None or self.max_latency_ms is None:
+            return frame
+        # skip the frames that are too old, if there is a newer one
+        while self.age_ms(frame) > self.max_latency_ms and self.source.pending():
+            newer = self.source.get(timeout=0)
+            if newer is None:
+                break
+            frame = newer
+            self.dropped += 1
+        return frame
+
+    def add_frame(self, frame: dict):
+        """Preprocess the raw frame and add it to the datamodule."""
+        landmark = frame.get("landmark")
+        if landmark is None:  # the landmarks are masked out
+            landmark = torch.zeros((self.num_landmarks, 2), dtype=torch.int64)
+        out = preprocess_frames(
+            color=frame["color"][None].to(self.camera.device),
+            depth=frame["depth"][None].to(self.camera.device),
+            camera=self.camera,
+            scales=self.scales,
+            inf_depth=self.inf_depth,
+            dilation=self.dilation,
+            landmark=landmark[None].to(self.camera.device),
+        )
+        if frame.get("landmark") is None:
+            out["landmark_mask"] = torch.zeros_like(out["landmark_mask"])
+        self.datamodule.add_frames([frame["frame_idx"]], out)
+
+    def latency_stats(self):
+        """The percentiles of the latency in ms and the throughput of the tracker."""
+        latencies = np.asarray(self.latencies)
+        dropped = self.dropped + self.source.dropped
+        stats = dict(frames=len(latencies), dropped=dropped)
+        if len(latencies):
+            for q in [50, 90, 95, 99]:
+                stats[f"p{q}"] = np.percentile(latencies, q).round(3)
+            stats["max"] = latencies.max().round(3)
+        if len(self.finished) > 1:
+            duration = self.finished[-1] - self.finished[0]
+            stats["fps"] = round((len(self.finished) - 1) / duration, 3)
+        return stats
+
+    def print_latency(self):
+        table = PrettyTable()
+        stats = self.latency_stats()
+        table.field_names = list(stats.keys())
+        table.align = "r"
+        table.add_row(list(stats.values()))
+        table_text = "\n" + table.get_string()
+        log.info(table_text)
+        return table_text
+
+    def optimize(self):
+        store = []
+
+        outer_progress = self.outer_progress()
+        inner_progress = self.inner_progress()
+        frame_progress = tqdm(desc="Frame Loop", position=0)
+
+        # build the batch
+        batch = {}
+        batch["params"] = generate_params(
+            self.optimizer.flame,
+            window_size=1,
+            default=self.default_params,
+        )
+        batch["outer_progress"] = outer_progress
+        batch["inner_progress"] = inner_progress
+        batch["max_iters"] = self.max_iters
+        batch["max_optims"] = self.max_optims
+        batch["mode"] = self.mode
+        batch["datamodule"] = self.datamodule
+        batch["coarse2fine"] = self.coarse2fine
+        batch["scheduler"] = self.scheduler
+        batch["step_size"] = self.step_size
 
-        for frame_idxs in self.frame_idxs_iter():
-            reset_progress(outer_progress, self.max_iters)
-            self.datamodule.update_idxs(frame_idxs)
+        while self.max_frames is None or len(store) < self.max_frames:
+            frame = self.next_frame()
+            if frame is None:  # the source is exhausted
+                break
+
+            start = time.perf_counter()
+            self.time_tracker.start("preprocess")
+            self.add_frame(frame)
+            self.time_tracker.stop("preprocess")
+
+            self.time_tracker.start("track")
+            if self.budget is not None:
+                plan = self.budget.plan()
+                batch["coarse2fine"] = plan.coarse2fine()
+                batch["max_iters"] = plan.max_iters
+                batch["max_optims"] = plan.max_optims
+            reset_progress(outer_progress, batch["max_iters"])
+            self.datamodule.update_idxs([frame["frame_idx"]])
             with torch.no_grad():
                 out = self.optimizer(batch)
-            # updatae the params
             batch["params"] = {k: v.clone() for k, v in out["params"].items()}
-            store.append(dict(params=batch["params"], frame_idx=frame_idxs))
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            self.time_tracker.stop("track")
+            if self.budget is not None:
+                self.budget.update(
+                    plan=plan,
+                    frame_ms=(time.perf_counter() - start) * 1000,
+                    time_tracker=getattr(self.optimizer, "time_tracker", None),
+                    frame_idx=frame["frame_idx"],
+                )
+
+            self.latencies.append(self.age_ms(frame))
+            self.finished.append(time.perf_counter())
+            store.append(dict(params=batch["params"], frame_idx=[frame["frame_idx"]]))
             frame_progress.update(1)
+            frame_progress.set_postfix({"dropped": self.dropped + self.source.dropped})
 
         # close the progresses
         close_progress([frame_progress, outer_progress, inner_progress])
+        self.print_latency()
+        self.time_tracker.print_summary()
+        if self.budget is not None:
+            self.budget.print_summary()
 
         return store
 
@@ -83,6 +83,29 @@ def vertex_normals(vertices: torch.Tensor, faces: torch.Tensor):
     return v_normals
 
 
+def area_vertex_normals(vertices: torch.Tensor, faces: torch.Tensor):
+    """Calculates the area weighted vertex normals with a scatter over the faces.
+
+    This avoids the dense (B, V, F) incidence of `vertex_normals`, vertices which
+    are not part of any face have a normal of zero.
+
+    Args:
+        vertices (torch.Tensor): The vertices of the mesh of dim (B, V, 3)
+        faces (torch.Tensor: The faces which contains the vertices idx of dim (F, 3).
+
+    Returns:
+        (torch.Tensor): Returns the normals of the vertices of dim (B, V, 3).
+    """
+    fv = vertices[:, faces]  # (B, F, 3, 3)
+    a = fv[:, :, 1] - fv[:, :, 0]
+    b = fv[:, :, 2] - fv[:, :, 0]
+    f_normals = torch.linalg.cross(a, b, dim=-1)  # (B, F, 3) length is twice the area
+    f_normals = f_normals.unsqueeze(2).expand(-1, -1, 3, -1)  # (B, F, 3, 3)
+    v_normals = torch.zeros_like(vertices)
+    v_normals = v_normals.index_add(1, faces.reshape(-1), f_normals.flatten(1, 2))
+    return torch.nn.functional.normalize(v_normals, dim=-1)  # (B, V, 3)
+
+
 def compute_normal_map(vertex_map, mask):
     # prepare the vertex map
     v_in = vertex_map.clone()
@@ -0,0 +1,77 @@
+import time
+
+import torch
+from prettytable import PrettyTable
+
+from lib.data.codec import decode_frame, encode_frame, frame_nbytes
+from lib.renderer.camera import Camera
+
+torch.manual_seed(0)
+
+scales = [1, 2, 4, 8]
+normal_modes = ["float16", "octahedral"]
+repeats = 10
+
+
+def synthetic_frame(camera: Camera):
+    """A face-like sphere cap in front of the camera with a background."""
+    y, x = torch.meshgrid(
+        torch.linspace(-1, 1, camera.height),
+        torch.linspace(-1, 1, camera.width),
+        indexing="ij",
+    )
+    r2 = x**2 + y**2
+    depth = 0.5 - 0.1 * torch.sqrt(torch.clamp(0.5 - r2, min=0.0))
+    depth = depth + 0.002 * torch.sin(20 * x) * torch.cos(15 * y)
+    mask = r2 < 0.45
+    point = camera.unproject_depth_map(depth)
+    dy, dx = torch.gradient(point, dim=(0, 1))
+    normal = torch.nn.functional.normalize(torch.cross(dx, dy, dim=-1), dim=-1)
+    point[~mask] = 0.0
+    normal[~mask] = 0.0
+    return {"mask": mask, "point": point, "normal": normal}
+
+
+table = PrettyTable()
+table.field_names = [
+    "scale",
+    "normal",
+    "raw (KB)",
+    "code (KB)",
+    "reduction",
+    "decode (frames/s)",
+    "depth err (mm)",
+    "normal err (deg)",
+]
+for scale in scales:
+    camera = Camera(scale=scale, device="cpu")
+    frame = synthetic_frame(camera)
+    mask = frame["mask"]
+    for normal_mode in normal_modes:
+        code = encode_frame(**frame, normal_mode=normal_mode)
+
+        decode_frame(code, camera=camera)  # warmup
+        start = time.perf_counter()
+        for _ in range(repeats):
+            decoded = decode_frame(code, camera=camera)
+        fps = repeats / (time.perf_counter() - start)
+
+        depth_error = (decoded["point"] - frame["point"])[mask][:, 2].abs()
+        cos = (decoded["normal"] * frame["normal"])[mask].sum(-1).clamp(-1, 1)
+        normal_error = torch.rad2deg(torch.arccos(cos))
+
+        raw_bytes = frame_nbytes(frame)
+        code_bytes = frame_nbytes(code)
+        table.add_row(
+            [
+                scale,
+                normal_mode,
+                f"{raw_bytes / 1024:.1f}",
+                f"{code_bytes / 1024:.1f}",
+                f"{raw_bytes / code_bytes:.2f}x",
+                f"{fps:.1f}",
+                f"{depth_error.max() * 1000:.3f}",
+                f"{normal_error.max():.4f}",
+            ]
+        )
+print(table)
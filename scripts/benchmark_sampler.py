@@ -0,0 +1,103 @@
+import time
+
+import torch
+from prettytable import PrettyTable
+
+from lib.model.sampler import ResidualSampler
+
+torch.manual_seed(0)
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+height = 480
+width = 640
+budgets = [500, 2000, 5000, 20000, 80000]
+modes = ["uniform", "stratified", "importance"]
+repeats = 10
+
+# synthetic face-like surface in camera space, a sphere cap with wrinkles
+y, x = torch.meshgrid(
+    torch.linspace(-0.1, 0.1, height, device=device),
+    torch.linspace(-0.13, 0.13, width, device=device),
+    indexing="ij",
+)
+z = -0.5 + torch.sqrt(torch.clamp(0.15**2 - x**2 - y**2, min=0.0))
+z = z + 0.002 * torch.sin(80 * x) * torch.cos(60 * y)
+t_point = torch.stack([x, y, z], dim=-1)[None]  # (1, H, W, 3)
+dy, dx = torch.gradient(t_point[0], dim=(0, 1))
+t_normal = torch.nn.functional.normalize(torch.cross(dx, dy, dim=-1), dim=-1)[None]
+mask = (x**2 + y**2) < 0.12**2
+mask = mask[None]  # (1, H, W)
+
+# observed points under a small rigid motion with noise and a few outliers
+omega_gt = torch.tensor([0.01, -0.02, 0.015], device=device)
+transl_gt = torch.tensor([0.002, -0.001, 0.003], device=device)
+s_point = t_point + torch.cross(omega_gt.expand_as(t_point), t_point, dim=-1)
+s_point = s_point + transl_gt + 5e-04 * torch.randn_like(t_point)
+outliers = torch.rand(mask.shape, device=device) < 0.02
+s_point[outliers] += 0.01 * torch.randn_like(s_point[outliers])
+s_normal = t_normal
+
+
+def solve(mask: torch.Tensor, weights: torch.Tensor):
+    """The linearized point-to-plane normal equations of the rigid motion."""
+    p, n, s = t_point[mask], t_normal[mask], s_point[mask]
+    w = weights[mask].unsqueeze(-1)
+    J = w * torch.cat([torch.cross(p, n, dim=-1), n], dim=-1)  # (C, 6)
+    F = w.squeeze(-1) * ((s - p) * n).sum(-1)  # (C,)
+    H = J.T @ J
+    x = torch.linalg.solve(H, J.T @ F)
+    energy = (F**2).sum()
+    return x, energy
+
+
+def synchronize():
+    if device == "cuda":
+        torch.cuda.synchronize()
+
+
+x_gt = torch.cat([omega_gt, transl_gt])
+full_x, full_energy = solve(mask, torch.ones_like(mask, dtype=torch.float32))
+
+table = PrettyTable()
+table.field_names = ["mode", "budget", "time (ms)", "param error", "energy error"]
+synchronize()
+start = time.perf_counter()
+for _ in range(repeats):
+    solve(mask, torch.ones_like(mask, dtype=torch.float32))
+synchronize()
+full_time = (time.perf_counter() - start) / repeats * 1e03
+full_error = torch.norm(full_x - x_gt) / torch.norm(x_gt)
+table.add_row(
+    ["full", int(mask.sum()), f"{full_time:.03f}", f"{full_error:.05f}", "0.00000"]
+)
+
+for mode in modes:
+    for budget in budgets:
+        sampler = ResidualSampler(mode=mode, budget=budget, reweight=True)
+        times, errors, energies = [], [], []
+        for _ in range(repeats):
+            synchronize()
+            start = time.perf_counter()
+            new_mask, weights = sampler.sample(
+                mask=mask,
+                s_point=s_point,
+                s_normal=s_normal,
+                t_point=t_point,
+                t_normal=t_normal,
+            )
+            x, energy = solve(new_mask, weights)
+            synchronize()
+            times.append((time.perf_counter() - start) * 1e03)
+            errors.append(torch.norm(x - x_gt) / torch.norm(x_gt))
+            energies.append(torch.abs(energy - full_energy) / full_energy)
+        table.add_row(
+            [
+                mode,
+                budget,
+                f"{sum(times) / repeats:.03f}",
+                f"{torch.stack(errors).mean():.05f}",
+                f"{torch.stack(energies).mean():.05f}",
+            ]
+        )
+
+print(table)
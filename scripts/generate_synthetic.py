@@ -4,11 +4,12 @@ from pathlib import Path
 
 import hydra
 import torch
-from omegaconf import DictConfig
+from omegaconf import DictConfig, OmegaConf
 from PIL import Image
 from tqdm import tqdm
 
 from lib.data.loader import load_intrinsics
+from lib.data.manifest import Manifest, code_version, fingerprint
 from lib.data.synthetic import generate_synthetic_params
 from lib.rasterizer import Rasterizer
 from lib.renderer.camera import Camera
@@ -39,46 +40,89 @@ def optimize(cfg: DictConfig):
     log.info(f"==> initializing model <{cfg.model._target_}>")
     flame = hydra.utils.instantiate(cfg.model).to(cfg.device)
 
+    # the params are random, hence they are regenerated only with a changed config
+    version = code_version(__file__)
+    params_config = dict(
+        frame_size=cfg.data.frame_size,
+        params_settings=OmegaConf.to_container(cfg.data.params_settings),
+        offset_settings=OmegaConf.to_container(cfg.data.offset_settings),
+        params_filter=OmegaConf.to_container(cfg.data.params_filter),
+    )
+    params_fingerprint = fingerprint(params_config, version)
+
     for sequence_idx in tqdm(range(cfg.data.sequence_size)):
         # define the sequence directory
         sequence_dir = Path(cfg.data.data_dir) / f"s{sequence_idx:05}"
-        # create default params for the sequence
-        default_params = generate_synthetic_params(
-            flame,
-            window_size=cfg.data.params_settings.window_size,
-            default=cfg.data.params_settings.default,
-            sigmas=cfg.data.params_settings.sigmas,
-            sparsity=cfg.data.params_settings.sparsity,
-            select=cfg.data.params_filter,
+        manifest = Manifest(
+            sequence_dir / "manifest.json", force=cfg.get("force", False)
         )
-        for frame_idx in tqdm(range(cfg.data.frame_size)):
-            # create the offset for the frame
-            offset = generate_synthetic_params(
+        params_paths = [
+            sequence_dir / f"params/{frame_idx:05}.pt"
+            for frame_idx in range(cfg.data.frame_size)
+        ]
+        stale_params = manifest.is_stale(
+            stage="synthetic",
+            artifact="params",
+            key=sequence_idx,
+            fingerprint=params_fingerprint,
+            outputs=params_paths,
+        )
+        # create default params for the sequence
+        if stale_params:
+            default_params = generate_synthetic_params(
                 flame,
-                window_size=cfg.data.offset_settings.window_size,
-                default=cfg.data.offset_settings.default,
-                sigmas=cfg.data.offset_settings.sigmas,
-                sparsity=cfg.data.offset_settings.sparsity,
+                window_size=cfg.data.params_settings.window_size,
+                default=cfg.data.params_settings.default,
+                sigmas=cfg.data.params_settings.sigmas,
+                sparsity=cfg.data.params_settings.sparsity,
                 select=cfg.data.params_filter,
             )
-            # add the offset to the default params for the sequence
-            params: dict = {}
-            for p_name, default in default_params.items():
-                params[p_name] = default + offset[p_name]
+        for frame_idx in tqdm(range(cfg.data.frame_size)):
+            path = params_paths[frame_idx]
+            if stale_params:
+                # create the offset for the frame
+                offset = generate_synthetic_params(
+                    flame,
+                    window_size=cfg.data.offset_settings.window_size,
+                    default=cfg.data.offset_settings.default,
+                    sigmas=cfg.data.offset_settings.sigmas,
+                    sparsity=cfg.data.offset_settings.sparsity,
+                    select=cfg.data.params_filter,
+                )
+                # add the offset to the default params for the sequence
+                params: dict = {}
+                for p_name, default in default_params.items():
+                    params[p_name] = default + offset[p_name]
 
-            # save the params
-            path = sequence_dir / f"params/{frame_idx:05}.pt"
-            path.parent.mkdir(parents=True, exist_ok=True)
-            torch.save({k: v.detach().cpu() for k, v in params.items()}, path)
+                # save the params
+                path.parent.mkdir(parents=True, exist_ok=True)
+                torch.save({k: v.detach().cpu() for k, v in params.items()}, path)
+            else:  # render the stale scales from the saved params
+                params = {k: v.to(cfg.device) for k, v in torch.load(path).items()}
 
             for scale in cfg.data.scales:
+                data_types = ["mask", "point", "normal", "color"]
+                outputs = [
+                    sequence_dir / f"cache/{scale}_{data_type}/{frame_idx:05}.pt"
+                    for data_type in data_types
+                ]
+                scale_config = dict(scale=scale, params=params_fingerprint)
+                scale_fingerprint = fingerprint(scale_config, version)
+                if not stale_params and not manifest.is_stale(
+                    stage="synthetic",
+                    artifact=str(scale),
+                    key=frame_idx,
+                    fingerprint=scale_fingerprint,
+                    outputs=outputs,
+                ):
+                    continue
+
                 # update the scale and render the params out
                 renderer.update(scale=scale)
                 out = flame.render(renderer=renderer, params=params)
 
                 # save the data types
-                for data_type in ["mask", "point", "normal", "color"]:
-                    path = sequence_dir / f"cache/{scale}_{data_type}/{frame_idx:05}.pt"
+                for data_type, path in zip(data_types, outputs):
                     path.parent.mkdir(parents=True, exist_ok=True)
                     data = out[data_type].detach().cpu()[0]
                     torch.save(data, path)
@@ -89,10 +133,15 @@ def optimize(cfg: DictConfig):
                 img = Image.fromarray(out["color"][0].detach().cpu().numpy())
                 img.save(path)
 
+                manifest.update("synthetic", str(scale), frame_idx, scale_fingerprint)
+
             src = Path(cfg.data.intrinsics_dir) / "calibration.json"
             dst = sequence_dir / "calibration.json"
             shutil.copyfile(src, dst)
 
+        manifest.update("synthetic", "params", sequence_idx, params_fingerprint)
+        manifest.save()
+
 
 if __name__ == "__main__":
     optimize()
@@ -0,0 +1,90 @@
+import logging
+import shutil
+from pathlib import Path
+
+import hydra
+import torch
+import torch.multiprocessing as mp
+from omegaconf import DictConfig, OmegaConf
+from tqdm import tqdm
+
+from lib.data.loader import load_intrinsics
+from lib.data.store import PackedFrameStore
+from lib.data.synthetic import generate_sequence_params, render_sequence
+from lib.rasterizer import Rasterizer
+from lib.renderer.camera import Camera
+from lib.renderer.renderer import Renderer
+from lib.utils.config import set_configs
+
+log = logging.getLogger()
+
+
+def generate_shard(rank: int, cfg: DictConfig, num_workers: int):
+    """Generates every num_workers-th sequence, starting with the rank."""
+    K = load_intrinsics(data_dir=cfg.data.intrinsics_dir, return_tensor="pt")
+    camera = Camera(
+        K=K,
+        width=cfg.data.width,
+        height=cfg.data.height,
+        near=cfg.data.near,
+        far=cfg.data.far,
+        scale=cfg.data.scale,
+    )
+    rasterizer = Rasterizer(width=camera.width, height=camera.height)
+    renderer = Renderer(rasterizer=rasterizer, camera=camera)
+    flame = hydra.utils.instantiate(cfg.model).to(cfg.device)
+
+    params_settings = OmegaConf.to_container(cfg.data.params_settings)
+    offset_settings = OmegaConf.to_container(cfg.data.offset_settings)
+    select = OmegaConf.to_container(cfg.data.params_filter)
+    batch_size = cfg.data.get("render_batch_size", 32)
+
+    sequence_idxs = range(rank, cfg.data.sequence_size, num_workers)
+    for sequence_idx in tqdm(sequence_idxs, position=rank, desc=f"Worker {rank}"):
+        # the sequences are reproducible independent of the number of workers
+        torch.manual_seed(cfg.seed + sequence_idx)
+        sequence_dir = Path(cfg.data.data_dir) / f"s{sequence_idx:05}"
+        with torch.no_grad():
+            params = generate_sequence_params(
+                flame,
+                frame_size=cfg.data.frame_size,
+                params_settings=params_settings,  # type: ignore
+                offset_settings=offset_settings,  # type: ignore
+                select=select,  # type: ignore
+            )
+            frames = render_sequence(
+                flame,
+                renderer=renderer,
+                params=params,
+                scales=cfg.data.scales,
+                batch_size=batch_size,
+            )
+
+        # write the frames and params straight to the packed format
+        arrays = {}
+        for (scale, data_type), value in frames.items():
+            arrays[PackedFrameStore.cached_name(scale, data_type)] = value
+        for p_name, value in params.items():
+            arrays[PackedFrameStore.param_name(p_name)] = value.detach().cpu()
+        PackedFrameStore.write(sequence_dir / "packed", arrays)
+
+        src = Path(cfg.data.intrinsics_dir) / "calibration.json"
+        shutil.copyfile(src, sequence_dir / "calibration.json")
+
+
+@hydra.main(version_base=None, config_path="../conf", config_name="optimize")
+def generate(cfg: DictConfig):
+    log.info("==> loading config ...")
+    cfg = set_configs(cfg)
+    num_workers = cfg.data.get("generate_workers", 1)
+
+    log.info(f"==> generate {cfg.data.sequence_size} sequences ...")
+    if num_workers <= 1:
+        generate_shard(0, cfg, num_workers=1)
+        return
+    # each worker owns a flame model and a rasterizer context
+    mp.spawn(generate_shard, args=(cfg, num_workers), nprocs=num_workers, join=True)
+
+
+if __name__ == "__main__":
+    generate()
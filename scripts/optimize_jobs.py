@@ -0,0 +1,34 @@
+import logging
+
+import hydra
+from omegaconf import DictConfig
+
+from lib.tracker.jobs import JobRunner, list_sequences
+from lib.utils.config import set_configs
+
+log = logging.getLogger()
+
+
+@hydra.main(version_base=None, config_path="../conf", config_name="jobs")
+def optimize_jobs(cfg: DictConfig):
+    log.info("==> loading config ...")
+    cfg = set_configs(cfg)
+
+    sequences = list_sequences(cfg)
+    log.info(f"==> schedule {len(sequences)} sequences ...")
+    runner = JobRunner(
+        cfg=cfg,
+        sequences=sequences,
+        num_workers=cfg.num_workers,
+        max_retries=cfg.max_retries,
+    )
+    runner.run()
+    runner.print_summary()
+
+    # the failures are reported after all the other sequences are tracked
+    if failed := runner.failed():
+        raise RuntimeError(f"Tracking failed for the sequences: {failed}")
+
+
+if __name__ == "__main__":
+    optimize_jobs()
@@ -0,0 +1,31 @@
+import logging
+
+import hydra
+from omegaconf import DictConfig
+from tqdm import tqdm
+
+from lib.data.store import convert_sequence
+
+log = logging.getLogger()
+
+
+@hydra.main(version_base=None, config_path="../conf", config_name="optimize")
+def pack(cfg: DictConfig):
+    log.info("==> loading config ...")
+    if "dataset_name" in cfg.data:
+        datasets = [cfg.data.dataset_name]
+    else:  # the sequences of the training datasets
+        datasets = cfg.data.train_dataset.datasets + cfg.data.val_dataset.datasets
+
+    log.info(f"==> packing {len(datasets)} sequences ...")
+    for dataset in tqdm(datasets):
+        store = convert_sequence(
+            data_dir=cfg.data.data_dir,
+            dataset=dataset,
+            scales=cfg.data.get("scales"),
+        )
+        log.info(f"==> packed {dataset} with {store.frame_count} frames ...")
+
+
+if __name__ == "__main__":
+    pack()
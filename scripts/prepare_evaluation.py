@@ -4,12 +4,13 @@ from pathlib import Path
 
 import hydra
 import torch
-from omegaconf import DictConfig
+from omegaconf import DictConfig, OmegaConf
 from PIL import Image
 from tqdm import tqdm
 
 from lib.data.dataset import DPHMDataset
 from lib.data.loader import load_intrinsics
+from lib.data.manifest import Manifest, code_version, file_stats, fingerprint
 from lib.data.synthetic import generate_params
 from lib.rasterizer import Rasterizer
 from lib.renderer.camera import Camera
@@ -40,24 +41,47 @@ def optimize(cfg: DictConfig):
     log.info(f"==> initializing model <{cfg.model._target_}>")
     flame = hydra.utils.instantiate(cfg.model).to(cfg.device)
 
+    version = code_version(__file__)
+    # the full model config, e.g. the number of shape and expression params
+    model_config = OmegaConf.to_container(cfg.model, resolve=True)
+    config = dict(scale=cfg.data.scale, model=model_config)
     data_dirs = sorted(list(Path(cfg.data.data_dir).iterdir()))
     for data_dir in tqdm(data_dirs):
         try:
+            path = data_dir / "manifest.json"
+            manifest = Manifest(path, force=cfg.get("force", False))
             dataset = DPHMDataset(data_dir=cfg.data.data_dir, scale=cfg.data.scale)
             for frame_idx in list(dataset.iter_frame_idx(dataset=data_dir.name)):
+                mask_path = (
+                    data_dir / f"cache/{cfg.data.scale}_face_mask/{frame_idx:05}.pt"
+                )
+                vertices_path = data_dir / f"vertices/{frame_idx:05}.pt"
+                inputs = file_stats(data_dir / f"params/{frame_idx:05}.pt")
+                value = fingerprint(config, version, inputs)
+                if not manifest.is_stale(
+                    stage="evaluation",
+                    artifact=f"{cfg.data.scale}_face_mask",
+                    key=frame_idx,
+                    fingerprint=value,
+                    outputs=[mask_path, vertices_path],
+                ):
+                    continue
+
                 params = dataset.load_param(dataset=data_dir.name, frame_idx=frame_idx)
                 params = {k: v.to(cfg.device) for k, v in params.items()}
                 out = flame.render(
                     renderer=renderer, params=params, vertices_mask="face"
                 )
 
-                path = data_dir / f"cache/{cfg.data.scale}_face_mask/{frame_idx:05}.pt"
-                path.parent.mkdir(parents=True, exist_ok=True)
-                torch.save(out["mask"][0].detach().cpu(), path)
+                mask_path.parent.mkdir(parents=True, exist_ok=True)
+                torch.save(out["mask"][0].detach().cpu(), mask_path)
+
+                vertices_path.parent.mkdir(parents=True, exist_ok=True)
+                torch.save(out["vertices"][0].detach().cpu(), vertices_path)
 
-                path = data_dir / f"vertices/{frame_idx:05}.pt"
-                path.parent.mkdir(parents=True, exist_ok=True)
-                torch.save(out["vertices"][0].detach().cpu(), path)
+                artifact = f"{cfg.data.scale}_face_mask"
+                manifest.update("evaluation", artifact, frame_idx, value)
+            manifest.save()
         except Exception as e:
             log.info(data_dir)
 
@@ -1,4 +1,5 @@
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 import hydra
@@ -6,28 +7,129 @@ import numpy as np
 import torch
 from omegaconf import DictConfig
 from PIL import Image
-from torchvision.transforms import v2
 from torchvision.transforms.functional import pil_to_tensor
 from tqdm import tqdm
 
+from lib.data import codec as frame_codec
+from lib.data import preprocessing
+from lib.data.codec import encode_frame
 from lib.data.loader import load_intrinsics
-from lib.data.preprocessing import biliteral_filter, point2normal
+from lib.data.manifest import Manifest, code_version, file_stats, fingerprint
+from lib.data.preprocessing import preprocess_frames
 from lib.model.flame.utils import load_static_landmark_embedding
 from lib.renderer import Camera
 
 log = logging.getLogger()
 
 
+def init_worker():
+    # one thread per process, the parallelism comes from the frame chunks
+    torch.set_num_threads(1)
+
+
+def load_frames(data_dir: Path, idxs: list[int], depth_factor: float):
+    """Loads the color (B, H, W, 3) and the depth in m (B, H, W) of the frames."""
+    colors, depths = [], []
+    for idx in idxs:
+        path = data_dir / "color" / f"{idx:05}.png"
+        colors.append(pil_to_tensor(Image.open(path)).permute(1, 2, 0))
+        path = data_dir / "depth" / f"{idx:05}.png"
+        raw_depth = pil_to_tensor(Image.open(path)).to(torch.float32)[0]
+        depths.append(raw_depth / depth_factor)
+    return torch.stack(colors), torch.stack(depths)
+
+
+def input_paths(data_dir: Path, idx: int):
+    return [
+        data_dir / "color" / f"{idx:05}.png",
+        data_dir / "depth" / f"{idx:05}.png",
+        data_dir / "color/Mediapipe_landmarks" / f"{idx:05}.npy",
+    ]
+
+
+def output_paths(data_dir: Path, idx: int, artifact: str, codec: bool = False):
+    if artifact == "landmark":
+        data_types = ["landmark", "landmark_mask"]
+    elif codec:
+        data_types = [f"cache/{artifact}_color", f"cache/{artifact}_code"]
+    else:
+        data_types = ["color", "mask", "normal", "point"]
+        data_types = [f"cache/{artifact}_{t}" for t in data_types]
+    return [data_dir / t / f"{idx:05}.pt" for t in data_types]
+
+
+def load_landmarks(data_dir: Path, idxs: list[int], camera: Camera, media_idx):
+    """The pixels (u, v) of the mediapipe landmarks of dim (B, L, 2)."""
+    landmarks = []
+    for idx in idxs:
+        path = data_dir / "color/Mediapipe_landmarks" / f"{idx:05}.npy"
+        landmark = torch.tensor(np.load(path))
+        landmark[:, 0] *= camera.width
+        landmark[:, 1] *= camera.height
+        landmarks.append(landmark[media_idx].long())
+    return torch.stack(landmarks)
+
+
+def process_chunk(
+    idxs: list[int],
+    data_dir: Path,
+    camera: Camera,
+    media_idx: np.ndarray,
+    depth_factor: float,
+    inf_depth: float,
+    scales: list[int],
+    dilation: int,
+    codec: bool = False,
+):
+    """Preprocess a chunk of frames, the maps of the chunk are processed batched."""
+    color, depth = load_frames(data_dir, idxs, depth_factor=depth_factor)
+    out = preprocess_frames(
+        color=color,
+        depth=depth,
+        camera=camera,
+        scales=scales,
+        inf_depth=inf_depth,
+        dilation=dilation,
+        landmark=load_landmarks(data_dir, idxs, camera=camera, media_idx=media_idx),
+    )
+
+    # the outputs of the chunk are collected and written together
+    outputs: dict[str, list] = {
+        "landmark": list(out["landmark"]),
+        "landmark_mask": list(out["landmark_mask"]),
+    }
+    for scale in scales:
+        down = out[scale]
+        outputs[f"cache/{scale}_color"] = list(down["color"])
+        if codec:  # uint16 depth, bit-packed mask and octahedral normals
+            outputs[f"cache/{scale}_code"] = [
+                encode_frame(m, p, n)
+                for m, p, n in zip(down["mask"], down["point"], down["normal"])
+            ]
+        else:
+            outputs[f"cache/{scale}_mask"] = list(down["mask"])
+            outputs[f"cache/{scale}_normal"] = list(down["normal"])
+            outputs[f"cache/{scale}_point"] = list(down["point"])
+
+    # save results, clone such that the views do not serialize the full batch
+    for data_type, values in outputs.items():
+        folder = data_dir / data_type
+        folder.mkdir(parents=True, exist_ok=True)
+        for idx, value in zip(idxs, values):
+            if torch.is_tensor(value):
+                value = value.clone()
+            torch.save(value, folder / f"{idx:05}.pt")
+
+    return len(idxs)
+
+
 @hydra.main(version_base=None, config_path="../conf", config_name="optimize")
 def optimize(cfg: DictConfig):
     log.info("==> loading config ...")
-    depth_factor: float = cfg.data.depth_factor
-    inf_depth: float = cfg.data.inf_depth
-    scales: list[int] = cfg.data.scales
-    dilation: int = cfg.data.dilation
     data_dir = Path(cfg.data.data_dir) / cfg.data.dataset_name
     flame_dir = cfg.model.flame_dir
-    cache_dir = Path(data_dir) / "cache"
+    num_workers: int = cfg.data.get("preprocess_workers", 0)
+    chunk_size: int = cfg.data.get("preprocess_chunk_size", 16)
 
     log.info("==> initializing camera and rasterizer ...")
     K = load_intrinsics(data_dir=data_dir, return_tensor="pt")
@@ -46,102 +148,85 @@ def optimize(cfg: DictConfig):
     media_idx = flame_landmarks["lm_mediapipe_idx"]
 
     max_length = len(list((Path(data_dir) / "depth").iterdir()))
-    for idx in tqdm(range(max_length)):
-        # load the color image
-        path = Path(data_dir) / "color" / f"{idx:05}.png"
-        color = pil_to_tensor(Image.open(path)).permute(1, 2, 0)
-
-        # load the depth image and transform to m
-        path = Path(data_dir) / "depth" / f"{idx:05}.png"
-        img = Image.open(path)
-        raw_depth = pil_to_tensor(img).to(torch.float32)[0]
-        depth = raw_depth / depth_factor  # (H,W)
-
-        # select the foreground based on a depth threshold
-        f_mask = (depth < inf_depth) & (depth != 0)
-
-        # convert pointmap to normalmap
-        depth[~f_mask] = depth[f_mask].max()
-        point, _ = camera.depth_map_transform(depth)
-        normal, n_mask = point2normal(point)
-
-        # smooth the normal maps
-        normal = biliteral_filter(
-            image=normal,
-            dilation=dilation,
-            sigma_color=150,
-            sigma_space=150,
-        )
-
-        # create the final mask based on normal and depth
-        mask = f_mask & n_mask
-
-        # mask the default values
-        color[~mask] = 255
-        normal[~mask] = 0
-        point[~mask] = 0
-
-        # create landmarks
-        path = Path(data_dir) / "color/Mediapipe_landmarks" / f"{idx:05}.npy"
-        landmark = torch.tensor(np.load(path))
-        landmark[:, 0] *= camera.width
-        landmark[:, 1] *= camera.height
-        landmark = landmark[media_idx].long()
-        u = landmark[:, 0]
-        v = landmark[:, 1]
-        landmarks = point[v, u]
-        path = Path(data_dir) / f"landmark/{idx:05}.pt"
-        path.parent.mkdir(parents=True, exist_ok=True)
-        torch.save(landmarks, path)
-        landmarks_mask = mask[v, u]
-        path = Path(data_dir) / f"landmark_mask/{idx:05}.pt"
-        path.parent.mkdir(parents=True, exist_ok=True)
-        torch.save(landmarks_mask, path)
-
+    scales = list(cfg.data.scales)
+    codec = cfg.data.get("codec", False)
+
+    log.info("==> find the stale frames ...")
+    manifest = Manifest(data_dir / "manifest.json", force=cfg.get("force", False))
+    version = code_version(__file__, preprocessing.__file__, frame_codec.__file__)
+    config = dict(
+        depth_factor=cfg.data.depth_factor,
+        inf_depth=cfg.data.inf_depth,
+        dilation=cfg.data.dilation,
+    )
+    artifacts = ["landmark"] + [str(scale) for scale in scales]
+    fingerprints: dict[int, dict[str, str]] = {}
+    stale: dict[int, list[int]] = {}  # the stale scales of the stale frames
+    for idx in range(max_length):
+        inputs = file_stats(*input_paths(data_dir, idx))
+        fingerprints[idx] = {"landmark": fingerprint(config, version, inputs)}
         for scale in scales:
-            # downscale the images
-            size = (int(camera.height / scale), int(camera.width / scale))
-            image = v2.functional.resize(
-                inpt=mask.to(torch.float32).unsqueeze(0),
-                size=size,
+            scale_config = dict(config, scale=scale, codec=codec)
+            fingerprints[idx][str(scale)] = fingerprint(scale_config, version, inputs)
+        is_stale = {
+            artifact: manifest.is_stale(
+                stage="preprocess",
+                artifact=artifact,
+                key=idx,
+                fingerprint=fingerprints[idx][artifact],
+                outputs=output_paths(data_dir, idx, artifact, codec=codec),
+            )
+            for artifact in artifacts
+        }
+        if any(is_stale.values()):
+            stale[idx] = [s for s in scales if is_stale[str(s)]]
+
+    # the chunks are built from the stale frames, with the union of the stale scales
+    stale_idxs = list(stale.keys())
+    chunks = []
+    for i in range(0, len(stale_idxs), chunk_size):
+        chunk = stale_idxs[i : i + chunk_size]
+        chunk_scales = [s for s in scales if any(s in stale[idx] for idx in chunk)]
+        chunks.append((chunk, chunk_scales))
+    kwargs = dict(
+        data_dir=data_dir,
+        camera=camera,
+        media_idx=media_idx,
+        depth_factor=cfg.data.depth_factor,
+        inf_depth=cfg.data.inf_depth,
+        dilation=cfg.data.dilation,
+        codec=codec,
+    )
+
+    def complete(chunk: list[int], chunk_scales: list[int]):
+        for idx in chunk:
+            for artifact in ["landmark"] + [str(scale) for scale in chunk_scales]:
+                value = fingerprints[idx][artifact]
+                manifest.update("preprocess", artifact, idx, value)
+        manifest.save()  # resumable after each chunk
+        progress.update(len(chunk))
+
+    log.info(
+        f"==> preprocess {len(stale_idxs)}/{max_length} stale frames "
+        f"with {num_workers} workers ..."
+    )
+    progress = tqdm(total=len(stale_idxs))
+    if num_workers == 0:
+        for chunk, chunk_scales in chunks:
+            process_chunk(chunk, scales=chunk_scales, **kwargs)
+            complete(chunk, chunk_scales)
+        return
+    with ProcessPoolExecutor(num_workers, initializer=init_worker) as executor:
+        futures = {
+            executor.submit(process_chunk, chunk, scales=chunk_scales, **kwargs): (
+                chunk,
+                chunk_scales,
             )
-            down_mask = image[0] == 1.0
-
-            down_color = v2.functional.resize(
-                inpt=color.permute(2, 0, 1),
-                size=size,
-            ).permute(1, 2, 0)
-            down_color[~down_mask] = 255
-
-            down_normal = v2.functional.resize(
-                inpt=normal.permute(2, 0, 1),
-                size=size,
-            ).permute(1, 2, 0)
-            down_normal = torch.nn.functional.normalize(down_normal, dim=-1)
-            down_normal[~down_mask] = 0
-
-            down_point = v2.functional.resize(
-                inpt=point.permute(2, 0, 1),
-                size=size,
-            ).permute(1, 2, 0)
-            down_point[~down_mask] = 0
-
-            # save results
-            path = cache_dir / f"{scale}_mask" / f"{idx:05}.pt"
-            path.parent.mkdir(parents=True, exist_ok=True)
-            torch.save(down_mask, path)
-
-            path = cache_dir / f"{scale}_color" / f"{idx:05}.pt"
-            path.parent.mkdir(parents=True, exist_ok=True)
-            torch.save(down_color, path)
-
-            path = cache_dir / f"{scale}_normal" / f"{idx:05}.pt"
-            path.parent.mkdir(parents=True, exist_ok=True)
-            torch.save(down_normal, path)
-
-            path = cache_dir / f"{scale}_point" / f"{idx:05}.pt"
-            path.parent.mkdir(parents=True, exist_ok=True)
-            torch.save(down_point, path)
+            for chunk, chunk_scales in chunks
+        }
+        for future in as_completed(futures):
+            future.result()
+            complete(*futures[future])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+import logging
+from pathlib import Path
+
+import hydra
+import torch
+from omegaconf import DictConfig
+
+from lib.data.datamodule import StreamDataModule
+from lib.data.loader import load_intrinsics
+from lib.data.stream import DirectoryFrameSource
+from lib.model import Flame
+from lib.model.flame.utils import load_static_landmark_embedding
+from lib.renderer import Camera, Rasterizer, Renderer
+from lib.tracker.logger import FlameLogger
+from lib.utils.config import set_configs
+
+log = logging.getLogger()
+
+
+@hydra.main(version_base=None, config_path="../conf", config_name="stream")
+def stream(cfg: DictConfig):
+    log.info("==> loading config ...")
+    cfg = set_configs(cfg)
+
+    log.info("==> initializing camera and rasterizer ...")
+    data_dir = Path(cfg.data.data_dir) / cfg.data.dataset_name
+    K = load_intrinsics(data_dir=data_dir, return_tensor="pt")
+    camera = Camera(
+        K=K,
+        width=cfg.data.width,
+        height=cfg.data.height,
+        near=cfg.data.near,
+        far=cfg.data.far,
+    )
+    rasterizer = Rasterizer(width=camera.width, height=camera.height)
+    renderer = Renderer(camera=camera, rasterizer=rasterizer)
+    # the full resolution camera of the on the fly preprocessing
+    full_camera = Camera(
+        K=K,
+        width=cfg.data.width,
+        height=cfg.data.height,
+        near=cfg.data.near,
+        far=cfg.data.far,
+        scale=1,
+        device=cfg.device,
+    )
+
+    log.info(f"==> initializing model <{cfg.model._target_}> ...")
+    flame: Flame = hydra.utils.instantiate(cfg.model)
+    media_idx = load_static_landmark_embedding(cfg.model.flame_dir)["lm_mediapipe_idx"]
+
+    log.info(f"==> initializing logger <{cfg.logger._target_}> ...")
+    logger: FlameLogger = hydra.utils.instantiate(cfg.logger)
+
+    log.info("==> initializing stream datamodule ...")
+    datamodule = StreamDataModule(device=cfg.device, buffer_size=cfg.buffer_size)
+
+    log.info(f"==> initializing correspondence <{cfg.correspondence._target_}> ...")
+    correspondence = hydra.utils.instantiate(cfg.correspondence)
+
+    log.info(f"==> initializing residuals <{cfg.residuals._target_}> ...")
+    residuals = hydra.utils.instantiate(cfg.residuals)
+
+    log.info(f"==> initializing optimizer <{cfg.optimizer._target_}> ...")
+    optimizer = hydra.utils.instantiate(cfg.optimizer)
+
+    log.info(f"==> initializing framework <{cfg.framework._target_}> ...")
+    framework = hydra.utils.instantiate(
+        cfg.framework,
+        flame=flame,
+        logger=logger,
+        renderer=renderer,
+        correspondence=correspondence,
+        residuals=residuals,
+        optimizer=optimizer,
+    )
+
+    log.info(f"==> initializing source <{cfg.source._target_}> ...")
+    kwargs = {}
+    if cfg.source._target_.endswith(DirectoryFrameSource.__name__):
+        kwargs["media_idx"] = media_idx
+    source = hydra.utils.instantiate(cfg.source, **kwargs).start()
+
+    log.info("==> initializing streaming tracking ...")
+    trainer = hydra.utils.instantiate(
+        cfg.streaming_tracker,
+        optimizer=framework,
+        datamodule=datamodule,
+        source=source,
+        camera=full_camera,
+        num_landmarks=len(media_idx),
+    )
+
+    log.info("==> wait for the first frame ...")
+    frame = source.get(timeout=None)
+    assert frame is not None, "The source is exhausted before the first frame."
+    trainer.add_frame(frame)
+    init_idxs = [frame["frame_idx"]]
+
+    log.info("==> start initial tracking on the first frame ...")
+    init_tracker = hydra.utils.instantiate(
+        cfg.init_tracker,
+        optimizer=framework,
+        datamodule=datamodule,
+        init_idxs=init_idxs,
+    )
+    init_params = init_tracker.optimize()
+
+    log.info("==> start joint tracking on the first frame ...")
+    joint_tracker = hydra.utils.instantiate(
+        cfg.joint_tracker,
+        optimizer=framework,
+        datamodule=datamodule,
+        default_params=init_params,
+        init_idxs=init_idxs,
+    )
+    joint_params = joint_tracker.optimize()
+
+    log.info("==> start streaming tracking ...")
+    trainer.default_params = {
+        k: v[0].detach().cpu().tolist() for k, v in joint_params.items()
+    }
+    stream_params = trainer.optimize()
+    source.close()
+
+    log.info("==> store flame params ...")
+    path = Path(cfg.paths.output_dir) / "stream_params.pt"
+    torch.save(stream_params, path)
+
+
+if __name__ == "__main__":
+    stream()
@@ -0,0 +1,58 @@
+import torch
+
+from lib.optimizer.residuals import Point2PlaneResiduals
+
+torch.manual_seed(0)
+
+B, V, C, N = 2, 50, 400, 7
+
+# random mesh state with a random per-vertex jacobian (B, V, 3, N)
+vertices = torch.randn(B, V, 3, dtype=torch.float64)
+vertices_jacobian = torch.randn(B, V, 3, N, dtype=torch.float64)
+
+# random correspondences with flat vertex idxs and barycentric coordinates
+vertices_idx = torch.randint(0, B * V, (C, 3))
+bary_coords = torch.rand(C, 3, dtype=torch.float64)
+bary_coords = bary_coords / bary_coords.sum(-1, keepdim=True)
+s_point = torch.randn(C, 3, dtype=torch.float64)
+t_normal = torch.nn.functional.normalize(torch.randn(C, 3, dtype=torch.float64))
+weights = torch.rand(C, dtype=torch.float64)
+
+residuals = Point2PlaneResiduals(weight=0.5)
+
+# pixel-level reference
+v = vertices.reshape(-1, 3)
+t_point = (v[vertices_idx] * bary_coords.unsqueeze(-1)).sum(-2)  # (C, 3)
+Jv = vertices_jacobian.reshape(-1, 3, N)
+t_point_jacobian = (Jv[vertices_idx] * bary_coords[..., None, None]).sum(1)
+F, _ = residuals.step(
+    s_point=s_point,
+    t_point=t_point,
+    t_normal=t_normal,
+    weights=weights,
+)
+J = residuals.jacobian_step(
+    t_point_jacobian=t_point_jacobian,
+    t_normal=t_normal,
+    weights=weights,
+)
+H_gt = 2 * J.T @ J
+grad_f_gt = 2 * J.T @ F
+
+# vertex-level reduction
+forms = residuals.reduce(
+    vertices_idx=vertices_idx,
+    bary_coords=bary_coords,
+    num_vertices=B * V,
+    s_point=s_point,
+    t_normal=t_normal,
+    weights=weights,
+)
+form = forms["point2plane"]
+H, grad_f = form.system(vertices=vertices, vertices_jacobian=vertices_jacobian)
+
+assert torch.allclose(form.energy(vertices), (F**2).sum())
+assert torch.allclose(H, H_gt)
+assert torch.allclose(grad_f, grad_f_gt)
+print(f"pixel rows: {C}, vertex pairs: {form.pairs.shape[0]}")
+print("H and grad_f match the pixel-level normal equations.")